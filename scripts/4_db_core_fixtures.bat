@@ -1,5 +1,6 @@
 @ECHO OFF
 CALL ..\venv\Scripts\activate.bat
 CD ..\src
-FOR %%i in (core\fixtures\*.json) DO python manage.py loaddata %%i
+ECHO python manage.py inicializar_bd --sin-migrar
+python manage.py inicializar_bd --sin-migrar
 PAUSE
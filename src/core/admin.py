@@ -2,8 +2,15 @@
 
 from django.apps import apps
 from django.contrib import admin
+from django.db import models
+from django.utils.html import format_html
 from guardian.admin import GuardedModelAdmin
 import djf_surveys.models
+from core.busqueda import BusquedaPersonaAdminMixin
+from core.clubes import FiltroClubAdminMixin, es_modelo_auxiliar
+from core.miniaturas import modelos_con_foto, url_miniatura
+from core.paginadores import PaginadorEstimado
+from core.permisos import PrecargaPermisosAdminMixin
 
 # Títulos de la pestaña del navegador, cabecera principal y admin login
 admin.site.site_title = "Picklefree"
@@ -24,11 +31,11 @@ djf_surveys.models.TermsValidators._meta.verbose_name_plural = "Validadores pers
 
 # Definimos en una lista los modelos que no queremos mostrar en la interfaz de administración
 modelos_sin_interfaz_administracion = [
-    'DestinatarioClub', 'DestinatarioCurso', 'DestinatarioDirectivo',
+    'ArchivoAlmacenado', 'DestinatarioClub', 'DestinatarioCurso', 'DestinatarioDirectivo',
     'DestinatarioEquipo', 'DestinatarioInstalacion', 'DestinatarioJugador',
     'DestinatarioPareja', 'DestinatarioOperario', 'DestinatarioPista',
     'DestinatarioTecnico', 'DestinatarioTorneoDobles', 'DestinatarioTorneoEquipos',
-    'DestinatarioTorneoIndividual', 'Operario']
+    'DestinatarioTorneoIndividual', 'Enfrentamiento', 'Operario']
 
 # Definimos en un diccionario los campos que queremos que sean de sólo lectura en cada modelo
 campos_solo_lectura = {
@@ -54,23 +61,94 @@ campos_solo_lectura = {
     'TorneoIndividual'      : ['token_qr']
 }
 
+# Definimos en un diccionario los campos de búsqueda que no se deducen de los propios campos del modelo
+campos_busqueda_adicionales = {
+    'Directivo'             : ['id_persona__nombre', 'id_persona__apellido_primero', 'id_persona__docidentidad_valor'],
+    'Jugador'               : ['id_persona__nombre', 'id_persona__apellido_primero', 'id_persona__docidentidad_valor'],
+    'Operario'              : ['id_persona__nombre', 'id_persona__apellido_primero', 'id_persona__docidentidad_valor'],
+    'Tecnico'               : ['id_persona__nombre', 'id_persona__apellido_primero', 'id_persona__docidentidad_valor'],
+}
+
+# Número máximo de columnas que mostramos en los listados
+MAX_COLUMNAS_LISTADO = 6
+
+def es_campo_de_texto_corto(campo):
+    """Campos de texto aptos para búsquedas y listados (ni tokens, ni textos largos)"""
+    return isinstance(campo, (models.CharField, models.EmailField)) and not campo.name.startswith('token_qr') and not campo.choices
+
+def deducir_campos_busqueda(modelo):
+    """Campos de búsqueda del modelo: sus campos de texto corto más los adicionales definidos"""
+    return [campo.name for campo in modelo._meta.concrete_fields if es_campo_de_texto_corto(campo)] + campos_busqueda_adicionales.get(modelo.__name__, [])
+
+def deducir_campo_persona(modelo):
+    """Por dónde llega un modelo a su persona ('pk' en la propia Persona), para buscarla por parecido; None si no tiene"""
+    persona = apps.get_model('core', 'Persona')
+    if modelo is persona:
+        return 'pk'
+    for campo in modelo._meta.concrete_fields:
+        if isinstance(campo, models.ForeignKey) and campo.related_model is persona and not campo.null:
+            return campo.name
+    return None
+
+def deducir_columnas_listado(modelo):
+    """Columnas del listado: la representación del objeto y los primeros campos que no sean textos largos, ficheros o tokens"""
+    columnas = ['__str__']
+    for campo in modelo._meta.concrete_fields:
+        if campo.primary_key or isinstance(campo, (models.TextField, models.FileField, models.GeneratedField)) or campo.name.startswith('token_qr'):
+            continue
+        columnas.append(campo.name)
+        if len(columnas) >= MAX_COLUMNAS_LISTADO:
+            break
+    return columnas
+
+@admin.display(description='Foto')
+def columna_miniatura(obj):
+    """Columna de listado con la miniatura pequeña de la foto (vacía mientras se genera)"""
+    url = url_miniatura(obj.foto, 'pequena', respaldo_original=False)
+    return format_html('<img src="{}" height="40" loading="lazy" alt="">', url) if url else ''
+
 # Obtenemos la configuración de la app cuyos modelos queremos registrar
 app = apps.get_app_config('core')
 
+# Modelos que vamos a registrar y sus campos de búsqueda (necesarios para saber a cuáles se puede autocompletar)
+modelos_con_interfaz = [modelo for modelo in app.get_models() if modelo.__name__ not in modelos_sin_interfaz_administracion]
+campos_busqueda = {modelo: deducir_campos_busqueda(modelo) for modelo in modelos_con_interfaz}
+modelos_foto = modelos_con_foto()
+
 # Los iteramos y tratamos uno a uno
-for modelo in app.get_models():
+for modelo in modelos_con_interfaz:
 
-    # Siempre que no sea un modelo sin interfaz de administración...
-    if modelo.__name__ not in modelos_sin_interfaz_administracion:
+    # Extraemos del diccionario la lista de campos de sólo lectura del modelo que tratamos
+    campos_solo_lectura_del_modelo = campos_solo_lectura.get(modelo.__name__, [])
 
-        # Extraemos del diccionario la lista de campos de sólo lectura del modelo que tratamos
-        campos_solo_lectura_del_modelo = campos_solo_lectura.get(modelo.__name__, [])
+    # Deducimos de los metadatos del modelo las columnas, las búsquedas y cómo elegir cada clave foránea
+    columnas_del_modelo = deducir_columnas_listado(modelo)
+    if modelo in modelos_foto:
+        columnas_del_modelo.insert(1, columna_miniatura)
+    claves_foraneas = [campo for campo in modelo._meta.concrete_fields if isinstance(campo, models.ForeignKey)]
+    claves_foraneas_en_listado = [campo.name for campo in claves_foraneas if campo.name in columnas_del_modelo]
+    # Las tablas auxiliares se siguen eligiendo con desplegable; las grandes, por autocompletado si
+    # tienen interfaz con búsqueda, o introduciendo su id en caso contrario
+    claves_grandes = [campo for campo in claves_foraneas if not es_modelo_auxiliar(campo.related_model)]
+    campos_autocompletar = [campo.name for campo in claves_grandes if campos_busqueda.get(campo.related_model)]
+    campos_id_directo = [campo.name for campo in claves_grandes if campo.name not in campos_autocompletar]
 
-        # Creamos "al vuelo" un ModelAdmin personalizado para dicho modelo en particular
-        # Heredamos de GuardedModelAdmin para que tengan permisos a nivel de objeto
-        class ModelAdminPersonalizado(GuardedModelAdmin):
-            """ModelAdmin personalizado para un modelo concreto"""
-            readonly_fields = campos_solo_lectura_del_modelo
+    # Creamos "al vuelo" un ModelAdmin personalizado para dicho modelo en particular
+    # Heredamos de GuardedModelAdmin para que tengan permisos a nivel de objeto,
+    # precargando los de cada página del listado en una sola consulta,
+    # limitamos las filas a los clubes que gestiona el usuario y buscamos las personas por parecido
+    class ModelAdminPersonalizado(BusquedaPersonaAdminMixin, FiltroClubAdminMixin, PrecargaPermisosAdminMixin, GuardedModelAdmin):
+        """ModelAdmin personalizado para un modelo concreto"""
+        campo_persona = deducir_campo_persona(modelo)
+        readonly_fields = campos_solo_lectura_del_modelo
+        list_display = columnas_del_modelo
+        list_select_related = claves_foraneas_en_listado
+        search_fields = campos_busqueda[modelo]
+        autocomplete_fields = campos_autocompletar
+        raw_id_fields = campos_id_directo
+        # En tablas muy grandes evitamos los COUNT(*) del listado
+        paginator = PaginadorEstimado
+        show_full_result_count = False
 
-        # Y lo registramos como su interfaz de administración
-        admin.site.register(modelo, ModelAdminPersonalizado)
+    # Y lo registramos como su interfaz de administración
+    admin.site.register(modelo, ModelAdminPersonalizado)
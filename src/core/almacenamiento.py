@@ -0,0 +1,106 @@
+"""Almacenamiento de ficheros direccionado por contenido (SHA-256), con deduplicación y recuento de referencias"""
+
+import hashlib
+from pathlib import PurePosixPath
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+
+CARPETA_BLOBS = 'blobs'
+CABECERA_CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def es_blob(nombre):
+    """¿El nombre corresponde a un fichero direccionado por contenido?"""
+    return bool(nombre) and nombre.replace('\\', '/').startswith(f'{CARPETA_BLOBS}/')
+
+def campos_fichero(modelo):
+    """Campos FileField/ImageField con columna propia de un modelo"""
+    return [campo for campo in modelo._meta.concrete_fields if isinstance(campo, models.FileField)]
+
+def modelos_con_ficheros():
+    """Modelos (de todas las apps) con algún FileField/ImageField"""
+    return [modelo for modelo in apps.get_models() if campos_fichero(modelo)]
+
+def sumar_referencia(nombre):
+    """Incrementa (o crea a 1) el recuento de referencias de un blob"""
+    archivo_almacenado = apps.get_model('core', 'ArchivoAlmacenado')
+    if archivo_almacenado.objects.filter(nombre=nombre).update(referencias=F('referencias') + 1):
+        return
+    try:
+        with transaction.atomic():
+            archivo_almacenado.objects.create(nombre=nombre, referencias=1)
+    except IntegrityError:
+        archivo_almacenado.objects.filter(nombre=nombre).update(referencias=F('referencias') + 1)
+
+def restar_referencia(nombre):
+    """Decrementa el recuento de referencias de un blob (el fichero lo borra después django-cleanup, si ya nadie lo usa)"""
+    apps.get_model('core', 'ArchivoAlmacenado').objects.filter(nombre=nombre, referencias__gt=0).update(referencias=F('referencias') - 1)
+
+def actualizar_referencias(anterior, nuevo):
+    """Ajusta los recuentos cuando el fichero de un campo de una fila pasa de un nombre a otro (vacío si no había o no queda)"""
+    if anterior == nuevo:
+        return
+    if es_blob(anterior):
+        restar_referencia(anterior)
+    if es_blob(nuevo):
+        sumar_referencia(nuevo)
+
+def referenciado_en_modelos(nombre):
+    """¿Hay algún FileField/ImageField de cualquier modelo que apunte todavía a este fichero?"""
+    for modelo in modelos_con_ficheros():
+        for campo in campos_fichero(modelo):
+            if modelo._default_manager.filter(**{campo.name: nombre}).exists():
+                return True
+    return False
+
+
+class AlmacenamientoPorContenido(FileSystemStorage):
+    """FileSystemStorage que guarda cada fichero subido como blobs/ab/cd/<sha256>.<ext>
+
+    Dos subidas idénticas (p.ej. el mismo logo en un club, un equipo y una pareja) comparten un único
+    fichero en disco, y su recuento de referencias (modelo ArchivoAlmacenado) impide que django-cleanup
+    lo borre mientras alguna fila lo siga usando. El recuento no se lleva aquí sino en las señales de los
+    modelos (core/signals.py), que sólo lo cambian cuando el fichero de una fila cambia de verdad: guardar
+    otra vez el mismo contenido en la misma fila no suma otra referencia que nadie restaría. Como el nombre
+    depende sólo del contenido, los ficheros pueden servirse con cabeceras de caché inmutables.
+    """
+
+    # Las miniaturas ya llevan el resumen del contenido en su nombre y no cuentan referencias
+    carpetas_sin_direccionar = ('miniaturas/',)
+
+    def __init__(self, *args, **kwargs):
+        # Sobrescribir un blob sólo puede escribir los mismos bytes, así que evitamos renombrados por colisión
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(*args, **kwargs)
+
+    def _save(self, name, content):
+        if name.replace('\\', '/').startswith(self.carpetas_sin_direccionar):
+            return super()._save(name, content)
+        resumen = hashlib.sha256()
+        for bloque in content.chunks():
+            resumen.update(bloque)
+        resumen = resumen.hexdigest()
+        extension = PurePosixPath(name).suffix.lower()
+        nombre = f'{CARPETA_BLOBS}/{resumen[:2]}/{resumen[2:4]}/{resumen}{extension}'
+        if not self.exists(nombre):
+            nombre = super()._save(nombre, content)
+        return nombre
+
+    def delete(self, name):
+        if not es_blob(name):
+            return super().delete(name)
+        archivo_almacenado = apps.get_model('core', 'ArchivoAlmacenado')
+        with transaction.atomic():
+            # Las señales ya han restado la referencia de la fila que lo suelta: si queda alguna, otra fila lo usa
+            registro = archivo_almacenado.objects.select_for_update().filter(nombre=name).first()
+            if registro and registro.referencias > 0:
+                return None
+            # Sin referencias según el recuento: comprobamos que de verdad nadie lo usa (p.ej. filas cargadas sin save()) antes de borrarlo
+            if referenciado_en_modelos(name):
+                return None
+            if registro:
+                registro.delete()
+        return super().delete(name)
@@ -0,0 +1,204 @@
+"""API JSON pública de sólo lectura: paginación por clave (keyset), campos a elegir y ETag"""
+
+import base64
+import binascii
+import hashlib
+import json
+from decimal import Decimal
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from core.models import (Club, Instalacion, PartidoDobles, PartidoIndividual, Pista, RankingJugadorClub, RankingJugadorTorneo,
+                         RankingParejaClub, RankingParejaTorneo, TorneoDobles, TorneoEquipos, TorneoIndividual)
+from core.replicas import leer_de_replica
+
+# orjson es opcional: si no está instalado se serializa con el módulo json estándar
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 500
+TIPO_JSON = 'application/json'
+
+
+class ErrorPeticion(ValueError):
+    """Parámetro de la petición no válido (respuesta 400)"""
+
+
+class Recurso:
+    """Listado de la API: modelo, campos públicos (nombre -> ruta en el ORM) y filtros admitidos (parámetro -> campo)"""
+
+    def __init__(self, modelo, campos, filtros=None):
+        self.modelo = modelo
+        self.campos = {'id': 'pk', **campos}
+        self.filtros = filtros or {}
+        # Por defecto, los campos de la propia tabla: los que necesitan un JOIN hay que pedirlos con ?campos=
+        self.por_defecto = [nombre for nombre, ruta in self.campos.items() if '__' not in ruta]
+
+    def campos_pedidos(self, parametro):
+        """Campos pedidos en ?campos=a,b (el id siempre va, es el cursor de la paginación)"""
+        if not parametro:
+            return self.por_defecto
+        pedidos = [nombre.strip() for nombre in parametro.split(',') if nombre.strip()]
+        desconocidos = [nombre for nombre in pedidos if nombre not in self.campos]
+        if desconocidos:
+            raise ErrorPeticion(f'Campos desconocidos: {", ".join(desconocidos)}. Disponibles: {", ".join(self.campos)}')
+        return ['id', *(nombre for nombre in dict.fromkeys(pedidos) if nombre != 'id')]
+
+    def filtros_pedidos(self, parametros):
+        """Filtros por clave ajena presentes en la petición"""
+        filtros = {}
+        for parametro, campo in self.filtros.items():
+            if parametro in parametros:
+                filtros[campo] = _entero(parametros[parametro], parametro)
+        return filtros
+
+    def consulta(self, campos, **filtros):
+        """values() con sólo los campos pedidos, así sólo se hacen los JOIN que esos campos necesitan"""
+        propios = [self.campos[nombre] for nombre in campos if self.campos[nombre] == nombre]
+        calculados = {nombre: F(self.campos[nombre]) for nombre in campos if self.campos[nombre] != nombre}
+        return self.modelo.objects.filter(**filtros).values(*propios, **calculados)
+
+
+def _entero(valor, parametro):
+    """Entero de un parámetro de la petición"""
+    try:
+        return int(valor)
+    except ValueError:
+        raise ErrorPeticion(f'{parametro} debe ser un número entero') from None
+
+def codificar_cursor(clave):
+    """Cursor opaco a partir de la última clave primaria devuelta"""
+    return base64.urlsafe_b64encode(str(clave).encode()).rstrip(b'=').decode()
+
+def decodificar_cursor(cursor):
+    """Clave primaria a partir de la que sigue el listado"""
+    try:
+        return int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise ErrorPeticion('Cursor no válido') from None
+
+
+def _por_defecto(valor):
+    """Tipos que orjson no serializa por sí mismo"""
+    if isinstance(valor, Decimal):
+        return str(valor)
+    raise TypeError
+
+def a_json(datos):
+    """Serializa a JSON (bytes) con orjson si está disponible"""
+    if orjson is not None:
+        return orjson.dumps(datos, default=_por_defecto)
+    return json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+def respuesta_json(request, datos, estado=200):
+    """Respuesta JSON con ETag: si el cliente ya tiene ese contenido se responde 304"""
+    cuerpo = a_json(datos)
+    etiqueta = quote_etag(hashlib.md5(cuerpo, usedforsecurity=False).hexdigest())
+    respuesta = get_conditional_response(request, etag=etiqueta) if estado == 200 else None
+    if respuesta is None:
+        respuesta = HttpResponse(cuerpo, content_type=TIPO_JSON, status=estado)
+    respuesta['ETag'] = etiqueta
+    patch_cache_control(respuesta, public=True, max_age=settings.API_MAX_AGE)
+    return respuesta
+
+def _error(mensaje, estado):
+    """Respuesta JSON de error"""
+    return HttpResponse(a_json({'error': mensaje}), content_type=TIPO_JSON, status=estado)
+
+
+_TORNEO = {
+    'nombre': 'nombre', 'club': 'id_club_id', 'club_nombre': 'id_club__nombre', 'instalacion': 'id_instalacion_id',
+    'instalacion_nombre': 'id_instalacion__nombre', 'categoria': 'id_categoria__nombre', 'competicion': 'id_tipo_competicion__nombre',
+    'rondas': 'rondas_o_jornadas', 'inicio': 'torneo_inicio', 'fin': 'torneo_fin',
+    'inscripcion_inicio': 'inscripcion_inicio', 'inscripcion_fin': 'inscripcion_fin',
+}
+_PARTIDO = {
+    'estado': 'id_estado_partido__nombre', 'pista': 'id_pista_id', 'ronda': 'ronda_o_jornada',
+    'fecha_hora': 'fecha_hora', 'formato': 'tods_formato', 'resultado': 'tods_resultado',
+}
+_RANKING = {'victorias': 'victorias', 'empates': 'empates', 'derrotas': 'derrotas', 'puntos': 'puntos', 'posicion': 'posicion', 'fecha': 'fecha'}
+
+RECURSOS = {
+    'clubes': Recurso(Club, {
+        'nombre': 'nombre', 'localidad': 'direccion_localidad', 'provincia': 'direccion_provincia__nombre', 'pais': 'direccion_pais',
+        'sitio_web': 'sitio_web', 'activo': 'activo'}),
+    'instalaciones': Recurso(Instalacion, {
+        'nombre': 'nombre', 'localidad': 'direccion_localidad', 'provincia': 'direccion_provincia__nombre', 'pais': 'direccion_pais',
+        'latitud': 'geoubicacion_latitud', 'longitud': 'geoubicacion_longitud', 'sitio_web': 'sitio_web', 'activa': 'activa'}),
+    'pistas': Recurso(Pista, {
+        'nombre': 'nombre', 'instalacion': 'id_instalacion_id', 'instalacion_nombre': 'id_instalacion__nombre',
+        'tipo': 'id_tipo_pista__nombre', 'suelo': 'id_tipo_suelo__nombre', 'iluminada': 'iluminada', 'activa': 'activa'},
+        filtros={'instalacion': 'id_instalacion'}),
+    'torneos-individuales': Recurso(TorneoIndividual, _TORNEO, filtros={'club': 'id_club'}),
+    'torneos-dobles': Recurso(TorneoDobles, {**_TORNEO, 'mixto': 'mixto'}, filtros={'club': 'id_club'}),
+    'torneos-equipos': Recurso(TorneoEquipos, _TORNEO, filtros={'club': 'id_club'}),
+    'partidos-individuales': Recurso(PartidoIndividual, {
+        'local': 'id_jugador_local_id', 'visitante': 'id_jugador_visitante_id', 'ganador': 'id_ganador_id',
+        'torneo': 'id_torneo_individual_id', **_PARTIDO},
+        filtros={'torneo': 'id_torneo_individual', 'pista': 'id_pista'}),
+    'partidos-dobles': Recurso(PartidoDobles, {
+        'local': 'id_pareja_local_id', 'visitante': 'id_pareja_visitante_id', 'ganador': 'id_ganador_id',
+        'torneo': 'id_torneo_dobles_id', **_PARTIDO},
+        filtros={'torneo': 'id_torneo_dobles', 'pista': 'id_pista'}),
+    'rankings-jugadores-club': Recurso(RankingJugadorClub, {
+        'jugador': 'id_jugador_id', 'club': 'id_club_id', **_RANKING},
+        filtros={'jugador': 'id_jugador', 'club': 'id_club'}),
+    'rankings-jugadores-torneo': Recurso(RankingJugadorTorneo, {
+        'jugador': 'id_jugador_id', 'torneo': 'id_torneo_individual_id', 'ronda': 'ronda_o_jornada', **_RANKING},
+        filtros={'jugador': 'id_jugador', 'torneo': 'id_torneo_individual'}),
+    'rankings-parejas-club': Recurso(RankingParejaClub, {
+        'pareja': 'id_pareja_id', 'club': 'id_club_id', **_RANKING},
+        filtros={'pareja': 'id_pareja', 'club': 'id_club'}),
+    'rankings-parejas-torneo': Recurso(RankingParejaTorneo, {
+        'pareja': 'id_pareja_id', 'torneo': 'id_torneo_dobles_id', 'ronda': 'ronda_o_jornada', **_RANKING},
+        filtros={'pareja': 'id_pareja', 'torneo': 'id_torneo_dobles'}),
+}
+
+
+@leer_de_replica
+def api_listado(request, recurso):
+    """Página de un listado ordenado por clave primaria: ?cursor=&limite=&campos= y filtros por clave ajena"""
+    definicion = RECURSOS.get(recurso)
+    if definicion is None:
+        return _error(f'No existe el recurso {recurso}', 404)
+    try:
+        campos = definicion.campos_pedidos(request.GET.get('campos'))
+        filtros = definicion.filtros_pedidos(request.GET)
+        limite = _entero(request.GET.get('limite', LIMITE_POR_DEFECTO), 'limite')
+        if not 1 <= limite <= LIMITE_MAXIMO:
+            raise ErrorPeticion(f'limite debe estar entre 1 y {LIMITE_MAXIMO}')
+        if request.GET.get('cursor'):
+            filtros['pk__gt'] = decodificar_cursor(request.GET['cursor'])
+    except ErrorPeticion as error:
+        return _error(str(error), 400)
+    # Se pide una fila de más para saber si hay página siguiente, sin COUNT(*) ni OFFSET
+    filas = list(definicion.consulta(campos, **filtros).order_by('pk')[:limite + 1])
+    siguiente = codificar_cursor(filas[limite - 1]['id']) if len(filas) > limite else None
+    respuesta = respuesta_json(request, {'datos': filas[:limite], 'siguiente': siguiente})
+    if siguiente:
+        parametros = {**request.GET.dict(), 'cursor': siguiente}
+        respuesta['Link'] = f'<{request.build_absolute_uri(request.path)}?{urlencode(parametros)}>; rel="next"'
+    return respuesta
+
+@leer_de_replica
+def api_detalle(request, recurso, clave):
+    """Un objeto de un recurso, con ?campos= como en el listado"""
+    definicion = RECURSOS.get(recurso)
+    if definicion is None:
+        return _error(f'No existe el recurso {recurso}', 404)
+    try:
+        campos = definicion.campos_pedidos(request.GET.get('campos'))
+    except ErrorPeticion as error:
+        return _error(str(error), 400)
+    fila = definicion.consulta(campos, pk=clave).first()
+    if fila is None:
+        return _error('No encontrado', 404)
+    return respuesta_json(request, fila)
@@ -6,3 +6,6 @@ class CoreConfig(AppConfig):
     name = 'core'
     verbose_name = 'Clubes deportivos'
 
+    def ready(self):
+        # Registramos las señales que mantienen las tablas derivadas
+        import core.signals  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
@@ -0,0 +1,170 @@
+"""Suite de benchmarks: escenarios registrados, ejecución por rondas y almacenamiento de resultados por commit"""
+
+import json
+import statistics
+import subprocess
+import time
+from datetime import datetime, time as hora_del_dia, timezone as tz
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Q
+from django.test import Client
+from django.urls import reverse
+from core.instrumentacion import host_permitido
+from core.models import (Club, DestinatarioClub, Enfrentamiento, Envio, EstadoEnvio, Instalacion, Jugador, PartidoIndividual, Persona,
+                         Pertenencia, Pista, RankingJugadorClub, ReservaClub, ReservaCurso, ReservaJugador, ReservaTorneoDobles,
+                         ReservaTorneoEquipos, ReservaTorneoIndividual)
+
+
+RUTA_RESULTADOS = settings.BASE_DIR.parent / 'benchmarks' / 'resultados.jsonl'
+UMBRAL_REGRESION = 1.2  # una mediana un 20% peor que la de la ejecución anterior se marca como regresión
+MODELOS_RESERVA = (ReservaClub, ReservaCurso, ReservaJugador, ReservaTorneoDobles, ReservaTorneoEquipos, ReservaTorneoIndividual)
+HORAS_RESERVABLES = range(8, 22)
+TABLAS_CONTADAS = (Persona, Jugador, Club, Pista, PartidoIndividual, Enfrentamiento, ReservaJugador, ReservaClub)
+
+BENCHMARKS = {}
+
+
+def benchmark(nombre):
+    """Registra un escenario: la función decorada prepara los datos y devuelve la operación (sin argumentos) a medir"""
+    def registrar(preparar):
+        BENCHMARKS[nombre] = preparar
+        return preparar
+    return registrar
+
+def sin_persistir(operacion):
+    """Envuelve una operación de escritura para que se deshaga al terminar, y así cada ronda parta del mismo estado"""
+    def envuelta():
+        with transaction.atomic():
+            operacion()
+            transaction.set_rollback(True)
+    return envuelta
+
+
+# Escenarios representativos
+
+def huecos_libres(instalacion, fecha):
+    """Franjas horarias (pista, hora) libres de una instalación en una fecha, con una sola consulta a las reservas"""
+    pistas = list(Pista.objects.filter(id_instalacion=instalacion, activa=True).values_list('pk', flat=True))
+    consultas = [modelo.objects.filter(id_pista__in=pistas, fecha_reserva=fecha, fecha_cancelacion__isnull=True).values_list('id_pista', 'hora_inicio')
+                 for modelo in MODELOS_RESERVA]
+    ocupadas = set(consultas[0].union(*consultas[1:], all=True))
+    return [(pista, hora) for pista in pistas for hora in HORAS_RESERVABLES if (pista, hora_del_dia(hora)) not in ocupadas]
+
+def reconstruir_ranking_club(club, fecha):
+    """Recalcula la clasificación de los jugadores de un club a partir de sus partidos individuales"""
+    jugadores = Pertenencia.objects.filter(id_club=club, activa=True).values('id_jugador')
+    resultados = (Enfrentamiento.objects.filter(id_jugador__in=jugadores, id_partido_individual__isnull=False, principal=True)
+                  .values('id_jugador').annotate(victorias=Count('pk', filter=Q(ganador=True)), derrotas=Count('pk', filter=Q(ganador=False)))
+                  .order_by('-victorias', 'derrotas', 'id_jugador'))
+    filas = [RankingJugadorClub(id_jugador_id=fila['id_jugador'], id_club_id=club, victorias=fila['victorias'], empates=0,
+                                derrotas=fila['derrotas'], puntos=2 * fila['victorias'], posicion=posicion, fecha=fecha)
+             for posicion, fila in enumerate(resultados, start=1)]
+    RankingJugadorClub.objects.filter(id_club=club, fecha=fecha).delete()
+    RankingJugadorClub.objects.bulk_create(filas, batch_size=1000)
+
+def repartir_mensaje(mensaje):
+    """Crea un envío por cada jugador de los clubes destinatarios de un mensaje"""
+    clubes = DestinatarioClub.objects.filter(id_mensaje=mensaje).values('id_club')
+    correos = (Persona.objects.filter(jugador__pertenencia__id_club__in=clubes, jugador__pertenencia__activa=True)
+               .values_list('email', flat=True).distinct())
+    estado = EstadoEnvio.objects.order_by('pk').first()
+    remitente = mensaje.id_remitente.email
+    Envio.objects.bulk_create((Envio(id_mensaje=mensaje, remitente=remitente, destinatario=correo, id_tipo_mensaje_id=mensaje.id_tipo_mensaje_id,
+                                     id_estado_envio=estado) for correo in correos.iterator(chunk_size=2000)), batch_size=2000)
+
+def club_mas_grande():
+    """Club con más jugadores (el peor caso de los escenarios por club)"""
+    return Pertenencia.objects.values('id_club').annotate(total=Count('pk')).order_by('-total').values_list('id_club', flat=True).first()
+
+
+def _registrar_listado_admin(modelo):
+    @benchmark(f'admin_listado_{modelo._meta.model_name}')
+    def preparar():
+        usuario = get_user_model().objects.filter(is_superuser=True, is_active=True).first()
+        if usuario is None:
+            return None
+        cliente = Client(SERVER_NAME=host_permitido())
+        cliente.force_login(usuario)
+        url = reverse(f'admin:{modelo._meta.app_label}_{modelo._meta.model_name}_changelist')
+        return lambda: cliente.get(url)
+
+for _modelo in (Persona, Jugador, PartidoIndividual, ReservaJugador, Pertenencia):
+    _registrar_listado_admin(_modelo)
+
+@benchmark('disponibilidad_instalacion')
+def preparar_disponibilidad():
+    instalacion = Pista.objects.values('id_instalacion').annotate(total=Count('pk')).order_by('-total').values_list('id_instalacion', flat=True).first()
+    fecha = ReservaJugador.objects.filter(id_pista__id_instalacion=instalacion).order_by('-fecha_reserva').values_list('fecha_reserva', flat=True).first()
+    if instalacion is None or fecha is None:
+        return None
+    return lambda: huecos_libres(Instalacion(pk=instalacion), fecha)
+
+@benchmark('reconstruccion_ranking_club')
+def preparar_ranking():
+    club = club_mas_grande()
+    if club is None:
+        return None
+    return sin_persistir(lambda: reconstruir_ranking_club(club, datetime.now(tz.utc).date()))
+
+@benchmark('reparto_mensaje_club')
+def preparar_reparto():
+    club = club_mas_grande()
+    destinatario = DestinatarioClub.objects.filter(id_club=club).select_related('id_mensaje__id_remitente').first()
+    if destinatario is None:
+        return None
+    return sin_persistir(lambda: repartir_mensaje(destinatario.id_mensaje))
+
+
+# Ejecución y resultados
+
+def medir(operacion, rondas, calentamiento=1):
+    """Estadísticas (ms) de ejecutar la operación varias rondas, tras unas de calentamiento"""
+    for _ in range(calentamiento):
+        operacion()
+    tiempos = []
+    for _ in range(rondas):
+        inicio = time.perf_counter()
+        operacion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        'rondas': rondas,
+        'min': round(min(tiempos), 3),
+        'mediana': round(statistics.median(tiempos), 3),
+        'media': round(statistics.mean(tiempos), 3),
+        'max': round(max(tiempos), 3),
+        'desviacion': round(statistics.stdev(tiempos), 3) if rondas > 1 else 0.0,
+    }
+
+def commit_actual():
+    """Commit de git del código medido (o None si no se puede saber)"""
+    try:
+        salida = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return salida.stdout.strip()
+
+def volumen_datos():
+    """Filas de las tablas principales, para no comparar ejecuciones sobre datos distintos"""
+    return {modelo._meta.db_table: modelo.objects.count() for modelo in TABLAS_CONTADAS}
+
+def leer_resultados(ruta=RUTA_RESULTADOS):
+    """Ejecuciones anteriores guardadas, de la más antigua a la más reciente"""
+    if not ruta.exists():
+        return []
+    with open(ruta, encoding='utf-8') as fichero:
+        return [json.loads(linea) for linea in fichero if linea.strip()]
+
+def guardar_resultados(ejecucion, ruta=RUTA_RESULTADOS):
+    """Añade una ejecución al histórico (una línea JSON por ejecución)"""
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    with open(ruta, 'a', encoding='utf-8') as fichero:
+        fichero.write(json.dumps(ejecucion, ensure_ascii=False) + '\n')
+
+def resultado_de_referencia(ejecucion, anteriores, nombre):
+    """(commit, resultado) de la última medición del escenario en otro commit sobre el mismo volumen de datos, o None"""
+    for anterior in reversed(anteriores):
+        if anterior.get('commit') != ejecucion['commit'] and anterior.get('volumen') == ejecucion['volumen'] and nombre in anterior['resultados']:
+            return anterior['commit'], anterior['resultados'][nombre]
+    return None
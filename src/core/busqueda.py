@@ -0,0 +1,75 @@
+"""Búsqueda aproximada de personas con pg_trgm y unaccent: tolera erratas y acentos y ordena por parecido"""
+
+import unicodedata
+import phonenumbers
+from django.contrib.postgres.search import TrigramSimilarity, TrigramWordSimilarity
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Greatest, Lower
+from core.models import Persona, nombre_para_busqueda
+
+
+LIMITE_SUGERENCIAS = 10
+LONGITUD_MINIMA = 3  # con menos caracteres no hay trigramas que aprovechen los índices
+CAMPOS_TELEFONO = ('telefono_movil', 'telefono_fijo', 'telefono_otro')
+
+
+def normalizar(texto):
+    """Texto en minúsculas, sin acentos y con los espacios simplificados, como las expresiones indexadas"""
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return ' '.join(''.join(letra for letra in descompuesto if not unicodedata.combining(letra)).split())
+
+def telefono_e164(texto):
+    """El texto como teléfono en formato E.164 (como se guardan en Persona), o None si no lo parece"""
+    try:
+        numero = phonenumbers.parse(texto, 'ES')
+    except phonenumbers.NumberParseException:
+        return None
+    return phonenumbers.format_number(numero, phonenumbers.PhoneNumberFormat.E164) if phonenumbers.is_valid_number(numero) else None
+
+def buscar_personas(texto, personas=None):
+    """Personas parecidas al texto (nombre y apellidos, documento, email o teléfono), de más a menos parecidas"""
+    personas = Persona.objects.all() if personas is None else personas
+    buscado = normalizar(texto)
+    if len(buscado) < LONGITUD_MINIMA:
+        return personas.none()
+    # Cada condición usa uno de los índices GIN de trigramas de Persona (o los únicos de los teléfonos)
+    personas = personas.annotate(nombre_busqueda=nombre_para_busqueda(), documento_busqueda=Lower('docidentidad_valor'),
+                                 email_busqueda=Lower('email'))
+    filtro = Q(nombre_busqueda__trigram_word_similar=buscado) | Q(documento_busqueda__contains=buscado) | Q(email_busqueda__contains=buscado)
+    similitud = Greatest(TrigramWordSimilarity(Value(buscado), 'nombre_busqueda'), TrigramSimilarity('documento_busqueda', Value(buscado)),
+                         TrigramSimilarity('email_busqueda', Value(buscado)))
+    telefono = telefono_e164(texto)
+    if telefono:
+        coincide_telefono = Q.create([(campo, telefono) for campo in CAMPOS_TELEFONO], connector=Q.OR)
+        filtro |= coincide_telefono
+        similitud = Case(When(coincide_telefono, then=Value(1.0)), default=similitud, output_field=FloatField())
+    return personas.filter(filtro).annotate(similitud=similitud).order_by('-similitud', 'apellido_primero', 'nombre', 'pk')
+
+def sugerencias_personas(texto, limite=LIMITE_SUGERENCIAS):
+    """Primeras personas parecidas al texto, para autocompletar mientras se escribe"""
+    return [{'id': persona['pk'], 'nombre': ' '.join(filter(None, (persona['nombre'], persona['apellido_primero'], persona['apellido_segundo']))),
+             'documento': persona['docidentidad_valor'], 'email': persona['email'], 'similitud': round(persona['similitud'], 3)}
+            for persona in buscar_personas(texto).values('pk', 'nombre', 'apellido_primero', 'apellido_segundo', 'docidentidad_valor',
+                                                           'email', 'similitud')[:limite]]
+
+
+class BusquedaPersonaAdminMixin:
+    """Mixin para ModelAdmin que busca las personas (en Persona o en los modelos con id_persona) por parecido en vez de con icontains"""
+    campo_persona = None  # 'pk' en Persona, 'id_persona' en los modelos que apuntan a ella
+
+    def get_search_fields(self, request):
+        campos = super().get_search_fields(request)
+        if self.campo_persona and self.campo_persona != 'pk':
+            return [campo for campo in campos if not campo.startswith(f'{self.campo_persona}__')]
+        return campos
+
+    def get_search_results(self, request, queryset, search_term):
+        if not self.campo_persona or len(normalizar(search_term)) < LONGITUD_MINIMA:
+            return super().get_search_results(request, queryset, search_term)
+        if self.campo_persona == 'pk':
+            return buscar_personas(search_term, queryset), False
+        por_persona = queryset.filter(**{f'{self.campo_persona}__in': buscar_personas(search_term).values('pk')})
+        if not self.get_search_fields(request):
+            return por_persona, False
+        propios, duplicados = super().get_search_results(request, queryset, search_term)
+        return propios | por_persona, duplicados
@@ -0,0 +1,297 @@
+"""Calendarios iCalendar (.ics) de reservas, clases, torneos y partidos, cacheados y con marcas de última modificación"""
+
+import datetime
+import hashlib
+import time
+from django.core.cache import cache
+from django.db.models import CharField, DateField, DateTimeField, F, Q, TimeField, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+from core.models import (Club, Curso, Jugador, MatriculaJugador, Pareja, PartidoDobles, PartidoIndividual, ReservaClub, ReservaCurso,
+                         ReservaJugador, ReservaTorneoDobles, ReservaTorneoEquipos, ReservaTorneoIndividual, Tecnico, TorneoDobles,
+                         TorneoEquipos, TorneoIndividual)
+
+
+DIAS_PASADOS = 90                                  # antigüedad máxima de los eventos incluidos
+DURACION_PARTIDO = datetime.timedelta(minutes=90)  # los partidos sólo tienen hora de inicio
+SEGUNDOS_CACHE = 6 * 3600                          # también acota lo que tarda en verse un cambio que no marca su entidad
+TAMANO_MAXIMO_CACHE = 2 * 1024 * 1024
+TAMANO_LOTE = 2000
+
+COLUMNAS = {
+    'clase':        None,
+    'clave':        None,
+    'dia':          DateField(),
+    'hora_inicio_': TimeField(),
+    'hora_fin_':    TimeField(),
+    'momento':      DateTimeField(),
+    'titulo':       CharField(),
+    'pista':        None,
+    'instalacion':  None,
+}
+
+PREFIJOS = {
+    'reserva':            'Reserva de pista',
+    'reserva-club':       'Reserva del club',
+    'clase':              'Clase',
+    'torneo':             'Torneo',
+    'partido-individual': 'Partido individual',
+    'partido-dobles':     'Partido de dobles',
+}
+
+
+# Consultas: cada calendario es una única UNION ALL de ramas con las mismas columnas (con nombres que no choquen con los campos)
+
+def _rama(consulta, clase, **expresiones):
+    """values() de una rama de la unión, con las columnas en el orden de COLUMNAS (las que falten, a NULL con su tipo)"""
+    columnas = {'clase': Value(clase), 'clave': F('pk'),
+                'pista': F('id_pista__nombre'), 'instalacion': F('id_pista__id_instalacion__nombre'), **expresiones}
+    return consulta.values(**{nombre: columnas.get(nombre, Cast(Value(None), output_field=tipo)) for nombre, tipo in COLUMNAS.items()})
+
+def _reservas(modelo, clase, desde, titulo=None, **filtro):
+    """Reservas no canceladas de un modelo Reserva* a partir de una fecha"""
+    consulta = modelo.objects.filter(fecha_cancelacion__isnull=True, fecha_reserva__gte=desde, **filtro)
+    expresiones = {'titulo': titulo} if titulo is not None else {}
+    return _rama(consulta, clase, dia=F('fecha_reserva'), hora_inicio_=F('hora_inicio'), hora_fin_=F('hora_fin'), **expresiones)
+
+def _partidos(modelo, clase, campo_torneo, desde, condicion):
+    """Partidos de un modelo Partido* a partir de una fecha"""
+    consulta = modelo.objects.filter(condicion, fecha_hora__gte=timezone.make_aware(datetime.datetime.combine(desde, datetime.time.min)))
+    return _rama(consulta, clase, momento=F('fecha_hora'), titulo=F(f'{campo_torneo}__nombre'))
+
+def _torneos(filtro, desde):
+    """Reservas de pista de los torneos (de los tres tipos) que cumplen el filtro"""
+    return [_reservas(modelo, 'torneo', desde, titulo=F(f'{campo}__nombre'), **{f'{campo}__{clave}': valor for clave, valor in filtro.items()})
+            for modelo, campo in ((ReservaTorneoIndividual, 'id_torneo_individual'), (ReservaTorneoDobles, 'id_torneo_dobles'),
+                                  (ReservaTorneoEquipos, 'id_torneo_equipos'))]
+
+def _ramas_jugador(jugador, desde):
+    """Reservas, clases de los cursos en que está matriculado y partidos (individuales y de sus parejas) de un jugador"""
+    parejas = Pareja.objects.filter(Q(id_jugador_izquierdo=jugador) | Q(id_jugador_derecho=jugador)).values('pk')
+    cursos = MatriculaJugador.objects.filter(id_jugador=jugador, activa=True).values('id_curso')
+    return [
+        _reservas(ReservaJugador, 'reserva', desde, id_jugador=jugador),
+        _reservas(ReservaCurso, 'clase', desde, titulo=F('id_curso__nombre'), id_curso__in=cursos),
+        _partidos(PartidoIndividual, 'partido-individual', 'id_torneo_individual', desde,
+                  Q(id_jugador_local=jugador) | Q(id_jugador_visitante=jugador)),
+        _partidos(PartidoDobles, 'partido-dobles', 'id_torneo_dobles', desde,
+                  Q(id_pareja_local__in=parejas) | Q(id_pareja_visitante__in=parejas)),
+    ]
+
+def _ramas_tecnico(tecnico, desde):
+    """Clases de los cursos que imparte un técnico y reservas de los torneos que dirige"""
+    return [_reservas(ReservaCurso, 'clase', desde, titulo=F('id_curso__nombre'), id_curso__id_profesor=tecnico),
+            *_torneos({'id_director': tecnico}, desde)]
+
+def _ramas_club(club, desde):
+    """Reservas de un club, de sus cursos y de sus torneos"""
+    return [_reservas(ReservaClub, 'reserva-club', desde, titulo=F('id_equipo__nombre'), id_club=club),
+            _reservas(ReservaCurso, 'clase', desde, titulo=F('id_curso__nombre'), id_curso__id_club=club),
+            *_torneos({'id_club': club}, desde)]
+
+def _ramas_curso(curso, desde):
+    """Clases de un curso"""
+    return [_reservas(ReservaCurso, 'clase', desde, titulo=F('id_curso__nombre'), id_curso=curso)]
+
+def _ramas_torneo_individual(torneo, desde):
+    """Reservas y partidos de un torneo individual"""
+    return [_reservas(ReservaTorneoIndividual, 'torneo', desde, titulo=F('id_torneo_individual__nombre'), id_torneo_individual=torneo),
+            _partidos(PartidoIndividual, 'partido-individual', 'id_torneo_individual', desde, Q(id_torneo_individual=torneo))]
+
+def _ramas_torneo_dobles(torneo, desde):
+    """Reservas y partidos de un torneo de dobles"""
+    return [_reservas(ReservaTorneoDobles, 'torneo', desde, titulo=F('id_torneo_dobles__nombre'), id_torneo_dobles=torneo),
+            _partidos(PartidoDobles, 'partido-dobles', 'id_torneo_dobles', desde, Q(id_torneo_dobles=torneo))]
+
+def _ramas_torneo_equipos(torneo, desde):
+    """Reservas de un torneo por equipos (sus partidos no se registran por separado)"""
+    return [_reservas(ReservaTorneoEquipos, 'torneo', desde, titulo=F('id_torneo_equipos__nombre'), id_torneo_equipos=torneo)]
+
+
+# Dependencias: otras entidades cuyos cambios también cambian el calendario
+
+def _torneos_de(**filtro):
+    """Torneos (de los tres tipos) que cumplen el filtro, como entidades (tipo, pk)"""
+    return [(tipo, pk) for tipo, modelo in (('torneo-individual', TorneoIndividual), ('torneo-dobles', TorneoDobles), ('torneo-equipos', TorneoEquipos))
+            for pk in modelo.objects.filter(**filtro).values_list('pk', flat=True)]
+
+def _dependencias_jugador(jugador):
+    """Cursos en que está matriculado un jugador y parejas de las que forma parte"""
+    cursos = MatriculaJugador.objects.filter(id_jugador=jugador, activa=True).values_list('id_curso', flat=True)
+    parejas = Pareja.objects.filter(Q(id_jugador_izquierdo=jugador) | Q(id_jugador_derecho=jugador)).values_list('pk', flat=True)
+    return [('curso', pk) for pk in cursos] + [('pareja', pk) for pk in parejas]
+
+def _dependencias_tecnico(tecnico):
+    """Cursos que imparte un técnico y torneos que dirige"""
+    return [('curso', pk) for pk in Curso.objects.filter(id_profesor=tecnico).values_list('pk', flat=True)] + _torneos_de(id_director=tecnico)
+
+def _dependencias_club(club):
+    """Cursos y torneos de un club"""
+    return [('curso', pk) for pk in Curso.objects.filter(id_club=club).values_list('pk', flat=True)] + _torneos_de(id_club=club)
+
+def _sin_dependencias(entidad):
+    """Calendario que sólo depende de su propia entidad"""
+    return []
+
+
+# Tipo de calendario -> (modelo con token_qr, ramas de la unión, dependencias)
+CALENDARIOS = {
+    'jugador':           (Jugador, _ramas_jugador, _dependencias_jugador),
+    'tecnico':           (Tecnico, _ramas_tecnico, _dependencias_tecnico),
+    'club':              (Club, _ramas_club, _dependencias_club),
+    'curso':             (Curso, _ramas_curso, _sin_dependencias),
+    'torneo-individual': (TorneoIndividual, _ramas_torneo_individual, _sin_dependencias),
+    'torneo-dobles':     (TorneoDobles, _ramas_torneo_dobles, _sin_dependencias),
+    'torneo-equipos':    (TorneoEquipos, _ramas_torneo_equipos, _sin_dependencias),
+}
+
+def consulta_eventos(tipo, entidad, desde=None):
+    """Eventos de un calendario en una sola consulta UNION ALL"""
+    desde = desde or timezone.localdate() - datetime.timedelta(days=DIAS_PASADOS)
+    primera, *resto = CALENDARIOS[tipo][1](entidad, desde)
+    return primera.union(*resto, all=True) if resto else primera
+
+
+# Marcas de última modificación por entidad
+
+def clave_marca(tipo, pk):
+    """Clave de caché de la marca de última modificación de una entidad"""
+    return f'calendarios:marca:{tipo}:{pk}'
+
+def clave_cache_calendario(tipo, token):
+    """Clave de caché del calendario de la entidad con ese token"""
+    return f'calendarios:ics:{tipo}:{token}'
+
+def marcar_cambio(entidades):
+    """Actualiza la marca de última modificación de las entidades (tipo, pk) dadas"""
+    ahora = time.time()
+    cache.set_many({clave_marca(tipo, pk): ahora for tipo, pk in entidades if pk}, None)
+
+def marca_actual(entidades):
+    """Última modificación de un conjunto de entidades; las que no tengan marca (caché vaciada) cuentan como cambiadas ahora"""
+    claves = [clave_marca(tipo, pk) for tipo, pk in entidades]
+    marcas = cache.get_many(claves)
+    ahora = time.time()
+    for clave in claves:
+        if clave not in marcas:
+            cache.add(clave, ahora, None)
+            marcas[clave] = ahora
+    return max(marcas.values())
+
+def entidades_afectadas(instancia):
+    """Entidades (tipo, pk) cuyo calendario cambia al guardar o borrar la instancia"""
+    return [(tipo, pk) for tipo, pk in _AFECTADAS[type(instancia)](instancia) if pk]
+
+_AFECTADAS = {
+    Jugador:                 lambda jugador: [('jugador', jugador.pk)],
+    Tecnico:                 lambda tecnico: [('tecnico', tecnico.pk)],
+    Club:                    lambda club: [('club', club.pk)],
+    Curso:                   lambda curso: [('curso', curso.pk), ('tecnico', curso.id_profesor_id), ('club', curso.id_club_id)],
+    TorneoIndividual:        lambda torneo: [('torneo-individual', torneo.pk), ('tecnico', torneo.id_director_id), ('club', torneo.id_club_id)],
+    TorneoDobles:            lambda torneo: [('torneo-dobles', torneo.pk), ('tecnico', torneo.id_director_id), ('club', torneo.id_club_id)],
+    TorneoEquipos:           lambda torneo: [('torneo-equipos', torneo.pk), ('tecnico', torneo.id_director_id), ('club', torneo.id_club_id)],
+    Pareja:                  lambda pareja: [('pareja', pareja.pk), ('jugador', pareja.id_jugador_izquierdo_id), ('jugador', pareja.id_jugador_derecho_id)],
+    MatriculaJugador:        lambda matricula: [('jugador', matricula.id_jugador_id)],
+    ReservaJugador:          lambda reserva: [('jugador', reserva.id_jugador_id)],
+    ReservaClub:             lambda reserva: [('club', reserva.id_club_id)],
+    ReservaCurso:            lambda reserva: [('curso', reserva.id_curso_id)],
+    ReservaTorneoIndividual: lambda reserva: [('torneo-individual', reserva.id_torneo_individual_id)],
+    ReservaTorneoDobles:     lambda reserva: [('torneo-dobles', reserva.id_torneo_dobles_id)],
+    ReservaTorneoEquipos:    lambda reserva: [('torneo-equipos', reserva.id_torneo_equipos_id)],
+    PartidoIndividual:       lambda partido: [('jugador', partido.id_jugador_local_id), ('jugador', partido.id_jugador_visitante_id),
+                                              ('torneo-individual', partido.id_torneo_individual_id)],
+    PartidoDobles:           lambda partido: [('pareja', partido.id_pareja_local_id), ('pareja', partido.id_pareja_visitante_id),
+                                              ('torneo-dobles', partido.id_torneo_dobles_id)],
+}
+
+MODELOS_CON_CALENDARIO = tuple(_AFECTADAS)
+
+def nombre_calendario(entidad):
+    """Nombre visible del calendario: el de la persona (jugador, técnico) o el de la entidad"""
+    persona = getattr(entidad, 'id_persona', None)
+    if persona:
+        return f'{persona.nombre} {persona.apellido_primero}'
+    return getattr(entidad, 'nombre', None) or str(entidad)
+
+def etiqueta_entidad(tipo, pk, marca):
+    """ETag del calendario de una entidad en una marca dada"""
+    return hashlib.md5(f'{tipo}:{pk}:{marca:.6f}'.encode(), usedforsecurity=False).hexdigest()
+
+
+# Formato iCalendar (RFC 5545)
+
+def _escapar(texto):
+    """Texto escapado para un valor TEXT de iCalendar (los saltos de línea de los formularios llegan como CRLF)"""
+    texto = str(texto).replace('\r\n', '\n').replace('\r', '\n')
+    return texto.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def _linea(nombre, valor):
+    """Línea de contenido plegada a 75 octetos, terminada en CRLF"""
+    linea, trozos, actual, octetos = f'{nombre}:{valor}', [], '', 0
+    for caracter in linea:
+        tamano = len(caracter.encode())
+        if octetos + tamano > 75:
+            trozos.append(actual)
+            actual, octetos = ' ', 1
+        actual += caracter
+        octetos += tamano
+    trozos.append(actual)
+    return '\r\n'.join(trozos) + '\r\n'
+
+def _utc(momento):
+    """Fecha y hora en UTC con el formato de iCalendar"""
+    return momento.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+def _intervalo(evento):
+    """Inicio y fin de un evento: las reservas tienen fecha y horas locales, los partidos un momento de inicio"""
+    if evento['momento'] is not None:
+        return evento['momento'], evento['momento'] + DURACION_PARTIDO
+    inicio = timezone.make_aware(datetime.datetime.combine(evento['dia'], evento['hora_inicio_']))
+    fin = timezone.make_aware(datetime.datetime.combine(evento['dia'], evento['hora_fin_']))
+    if fin <= inicio:
+        fin += datetime.timedelta(days=1)  # termina pasada la medianoche
+    return inicio, fin
+
+def evento_ical(evento, sello):
+    """Bloque VEVENT de una fila de la consulta de eventos"""
+    inicio, fin = _intervalo(evento)
+    prefijo = PREFIJOS[evento['clase']]
+    lugar = ', '.join(valor for valor in (evento['pista'], evento['instalacion']) if valor)
+    lineas = [
+        _linea('BEGIN', 'VEVENT'),
+        _linea('UID', f'{evento["clase"]}-{evento["clave"]}@picklefree'),
+        _linea('DTSTAMP', sello),
+        _linea('DTSTART', _utc(inicio)),
+        _linea('DTEND', _utc(fin)),
+        _linea('SUMMARY', _escapar(f'{prefijo}: {evento["titulo"]}' if evento['titulo'] else prefijo)),
+    ]
+    if lugar:
+        lineas.append(_linea('LOCATION', _escapar(lugar)))
+    lineas.append(_linea('END', 'VEVENT'))
+    return ''.join(lineas)
+
+def generar_ical(tipo, entidad, nombre, marca):
+    """Genera el calendario por trozos, leyendo los eventos de la unión en streaming"""
+    sello = _utc(datetime.datetime.fromtimestamp(marca, datetime.timezone.utc))
+    yield (_linea('BEGIN', 'VCALENDAR') + _linea('VERSION', '2.0') + _linea('PRODID', '-//PickleFree//Calendarios//ES')
+           + _linea('CALSCALE', 'GREGORIAN') + _linea('METHOD', 'PUBLISH') + _linea('X-WR-CALNAME', _escapar(nombre)))
+    lote = []
+    for evento in consulta_eventos(tipo, entidad).iterator(chunk_size=TAMANO_LOTE):
+        lote.append(evento_ical(evento, sello))
+        if len(lote) >= 100:
+            yield ''.join(lote)
+            lote = []
+    yield ''.join(lote) + _linea('END', 'VCALENDAR')
+
+def generar_y_cachear(tipo, token, entidad, nombre, marca, dependencias):
+    """Genera el calendario en streaming y, al terminar, lo guarda en caché junto con su marca y dependencias"""
+    trozos, tamano = [], 0
+    for trozo in generar_ical(tipo, entidad, nombre, marca):
+        tamano += len(trozo)
+        if tamano <= TAMANO_MAXIMO_CACHE:
+            trozos.append(trozo)
+        yield trozo
+    # Si es demasiado grande sólo guardamos la marca, que basta para responder 304
+    contenido = ''.join(trozos) if tamano <= TAMANO_MAXIMO_CACHE else None
+    cache.set(clave_cache_calendario(tipo, token), {'clave': entidad.pk, 'marca': marca, 'dependencias': dependencias, 'contenido': contenido},
+              SEGUNDOS_CACHE)
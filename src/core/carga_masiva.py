@@ -0,0 +1,92 @@
+"""Carga masiva de filas: COPY en PostgreSQL y bulk_create en el resto de bases de datos"""
+
+from django.core import serializers
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+
+TAMANO_LOTE_CARGA = 5000
+
+
+def cargar_filas(modelo, campos, filas, using='default'):
+    """Inserta las tuplas de 'filas' (valores de 'campos', por nombre o attname) sin pasar por save() ni señales; devuelve cuántas"""
+    # Al no haber señales, las tablas derivadas (p. ej. Enfrentamiento.objects.reconstruir()) las pone al día quien llama
+    conexion = connections[using]
+    if conexion.vendor == 'postgresql':
+        columnas = ', '.join(conexion.ops.quote_name(modelo._meta.get_field(campo).column) for campo in campos)
+        total = 0
+        with conexion.cursor() as cursor:
+            with cursor.copy(f'COPY {conexion.ops.quote_name(modelo._meta.db_table)} ({columnas}) FROM STDIN') as copia:
+                for fila in filas:
+                    copia.write_row(fila)
+                    total += 1
+        return total
+    atributos = [modelo._meta.get_field(campo).attname for campo in campos]
+    lote, total = [], 0
+    for fila in filas:
+        lote.append(modelo(**dict(zip(atributos, fila))))
+        if len(lote) == TAMANO_LOTE_CARGA:
+            total += len(modelo.objects.using(using).bulk_create(lote))
+            lote = []
+    return total + len(modelo.objects.using(using).bulk_create(lote))
+
+def reiniciar_secuencias(modelos, using='default'):
+    """Ajusta las secuencias de las claves primarias tras cargar filas con claves explícitas"""
+    conexion = connections[using]
+    sentencias = conexion.ops.sequence_reset_sql(no_style(), modelos)
+    if sentencias:
+        with conexion.cursor() as cursor:
+            for sentencia in sentencias:
+                cursor.execute(sentencia)
+
+def siguiente_clave(modelo, using='default'):
+    """Primera clave primaria libre (por encima de la mayor existente) de un modelo con clave entera"""
+    ultima = modelo.objects.using(using).order_by('-pk').values_list('pk', flat=True).first()
+    return (ultima or 0) + 1
+
+def _campos_insertables(modelo):
+    """Campos con columna propia que se pueden insertar (todos menos los generados por la base de datos)"""
+    return [campo for campo in modelo._meta.concrete_fields if not getattr(campo, 'generated', False)]
+
+def _fusionar_con_copy(conexion, modelo, objetos):
+    """Inserta o actualiza (por clave primaria) los objetos: COPY a una tabla temporal y un único INSERT ... ON CONFLICT"""
+    campos = _campos_insertables(modelo)
+    nombre = conexion.ops.quote_name
+    tabla, temporal = nombre(modelo._meta.db_table), nombre(f'carga_{modelo._meta.db_table}')
+    columnas = ', '.join(nombre(campo.column) for campo in campos)
+    clave = nombre(modelo._meta.pk.column)
+    actualizaciones = ', '.join(f'{nombre(campo.column)} = EXCLUDED.{nombre(campo.column)}' for campo in campos if not campo.primary_key)
+    with conexion.cursor() as cursor:
+        cursor.execute(f'CREATE TEMPORARY TABLE {temporal} (LIKE {tabla} INCLUDING DEFAULTS) ON COMMIT DROP')
+        with cursor.copy(f'COPY {temporal} ({columnas}) FROM STDIN') as copia:
+            for objeto in objetos:
+                copia.write_row([campo.get_db_prep_save(getattr(objeto, campo.attname), conexion) for campo in campos])
+        accion = f'DO UPDATE SET {actualizaciones}' if actualizaciones else 'DO NOTHING'
+        cursor.execute(f'INSERT INTO {tabla} ({columnas}) SELECT {columnas} FROM {temporal} ON CONFLICT ({clave}) {accion}')
+        cursor.execute(f'DROP TABLE {temporal}')
+
+def cargar_fixtures(rutas, using='default'):
+    """Carga varios fixtures en una sola transacción; devuelve {modelo: objetos}
+
+    En PostgreSQL con restricciones diferidas y COPY (el orden entre ficheros no importa);
+    en el resto de bases de datos, con un único loaddata"""
+    conexion = connections[using]
+    if conexion.vendor != 'postgresql':
+        call_command('loaddata', *rutas, database=using, verbosity=0)
+        return {}
+    por_modelo = {}
+    for ruta in rutas:
+        with open(ruta, encoding='utf-8') as fichero:
+            for deserializado in serializers.deserialize('json', fichero, using=using):
+                por_modelo.setdefault(type(deserializado.object), []).append(deserializado.object)
+    with transaction.atomic(using=using):
+        with conexion.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+        for modelo, objetos in por_modelo.items():
+            _fusionar_con_copy(conexion, modelo, objetos)
+        # Comprueba ya las referencias: dentro de otra transacción no se comprobarían hasta su final, fuera de este bloque
+        with conexion.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        reiniciar_secuencias(list(por_modelo), using=using)
+    return {modelo: len(objetos) for modelo, objetos in por_modelo.items()}
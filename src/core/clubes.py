@@ -0,0 +1,176 @@
+"""Ámbito de club: qué clubes gestiona cada usuario y filtrado de consultas por club"""
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+
+CLAVE_SESION_CLUBES = 'picklefree_clubes'
+# Las filas sin club sólo las ven en el admin los superusuarios y quienes tengan este permiso
+PERMISO_FILAS_SIN_CLUB = 'core.ver_filas_sin_club'
+# Por modelo, el camino hasta el usuario cuyos clubes dependen de la fila (Persona → Directivo/Técnico → Mandato/Contrato)
+RUTAS_USUARIO = {
+    'Persona':   'auth_user',
+    'Directivo': 'id_persona__auth_user',
+    'Tecnico':   'id_persona__auth_user',
+    'Mandato':   'id_directivo__id_persona__auth_user',
+    'Contrato':  'id_tecnico__id_persona__auth_user',
+}
+# Por modelo sin clave foránea directa a Club, los caminos hasta el club de sus filas (una fila es del club si lo es por cualquiera)
+# Las instalaciones son del club que las posee o usa (Posesion) y los jugadores, de los clubes a los que pertenecen
+RUTA_INSTALACION = 'posesion__id_club'
+RUTAS_CLUB = {
+    'CalendarioPista':         (f'id_pista__id_instalacion__{RUTA_INSTALACION}',),
+    'CategoriaEquipo':         ('id_equipo__id_club',),
+    'CategoriaJugador':        ('id_jugador__pertenencia__id_club',),
+    'CategoriaPareja':         ('id_pareja__id_club',),
+    'ClaseJugador':            ('id_curso__id_club',),
+    'ClaseProfesor':           ('id_curso__id_club',),
+    'ConfirmacionResultado':   ('id_partido_individual__id_torneo_individual__id_club', f'id_partido_individual__id_pista__id_instalacion__{RUTA_INSTALACION}',
+                                'id_partido_dobles__id_torneo_dobles__id_club', f'id_partido_dobles__id_pista__id_instalacion__{RUTA_INSTALACION}'),
+    'Dependencia':             (f'id_instalacion__{RUTA_INSTALACION}',),
+    'Directivo':               ('mandato__id_club',),
+    'Empleo':                  (f'id_instalacion__{RUTA_INSTALACION}',),
+    'Envio':                   ('id_mensaje__id_remitente',),
+    'Etapa':                   ('id_equipo__id_club',),
+    'HorarioPista':            (f'id_pista__id_instalacion__{RUTA_INSTALACION}',),
+    'InscripcionEquipo':       ('id_torneo_equipos__id_club',),
+    'InscripcionJugador':      ('id_torneo_individual__id_club',),
+    'InscripcionPareja':       ('id_torneo_dobles__id_club',),
+    'Instalacion':             (RUTA_INSTALACION,),
+    'Jugador':                 ('pertenencia__id_club',),
+    'Material':                (f'id_dependencia__id_instalacion__{RUTA_INSTALACION}',),
+    'MatriculaJugador':        ('id_curso__id_club',),
+    'Membresia':               ('id_equipo__id_club',),
+    'PartidoDobles':           ('id_torneo_dobles__id_club', f'id_pista__id_instalacion__{RUTA_INSTALACION}'),
+    'PartidoIndividual':       ('id_torneo_individual__id_club', f'id_pista__id_instalacion__{RUTA_INSTALACION}'),
+    'Persona':                 ('jugador__pertenencia__id_club', 'directivo__mandato__id_club', 'tecnico__contrato__id_club'),
+    'Pista':                   (f'id_instalacion__{RUTA_INSTALACION}',),
+    'RankingJugadorTorneo':    ('id_torneo_individual__id_club',),
+    'RankingParejaTorneo':     ('id_torneo_dobles__id_club',),
+    'Rating':                  ('id_jugador__pertenencia__id_club',),
+    'ReservaCurso':            ('id_curso__id_club',),
+    'ReservaJugador':          (f'id_pista__id_instalacion__{RUTA_INSTALACION}',),
+    'ReservaTorneoDobles':     ('id_torneo_dobles__id_club',),
+    'ReservaTorneoEquipos':    ('id_torneo_equipos__id_club',),
+    'ReservaTorneoIndividual': ('id_torneo_individual__id_club',),
+    'Tecnico':                 ('contrato__id_club',),
+}
+
+
+def campo_club(modelo):
+    """Nombre del campo por el que un modelo apunta a su club ('pk' para el propio Club), o None si no tiene"""
+    club = apps.get_model('core', 'Club')
+    if modelo is club:
+        return 'pk'
+    for campo in modelo._meta.concrete_fields:
+        if campo.is_relation and campo.related_model is club:
+            return campo.name
+    return None
+
+def es_modelo_auxiliar(modelo):
+    """Tablas pequeñas de tipos, estados y provincias, globales y cuyos desplegables pueden cargarse enteros"""
+    return modelo._meta.db_table.startswith(('tipo_', 'estado_')) or modelo.__name__ == 'Provincia'
+
+def rutas_club(modelo):
+    """Caminos por los que las filas de un modelo llegan a su club: () en las tablas auxiliares, que son globales, o None si no tiene"""
+    campo = campo_club(modelo)
+    if campo:
+        return (campo,)
+    if modelo.__name__ in RUTAS_CLUB:
+        return RUTAS_CLUB[modelo.__name__]
+    return () if es_modelo_auxiliar(modelo) else None
+
+def vigente_hoy(hoy=None):
+    """Filtro de los mandatos o contratos activos en la fecha de hoy"""
+    hoy = hoy or timezone.localdate()
+    return Q(activo=True, fecha_alta__lte=hoy) & (Q(fecha_baja__isnull=True) | Q(fecha_baja__gte=hoy))
+
+def modelos_con_clubes():
+    """Modelos cuyos cambios alteran los clubes de algún usuario"""
+    return [apps.get_model('core', nombre) for nombre in RUTAS_USUARIO]
+
+def usuarios_afectados(modelo, clave):
+    """Ids de los usuarios cuyos clubes dependen de una fila, según está ahora en la base de datos"""
+    if clave is None:
+        return set()
+    return set(modelo._base_manager.filter(pk=clave).exclude(**{f'{RUTAS_USUARIO[modelo.__name__]}__isnull': True})
+               .values_list(RUTAS_USUARIO[modelo.__name__], flat=True))
+
+def clave_version_clubes(id_usuario):
+    """Clave de caché de la versión de los clubes de un usuario"""
+    return f'picklefree:clubes:version:{id_usuario}'
+
+def invalidar_clubes_de_usuarios(ids_usuario):
+    """Invalida los clubes cacheados en las sesiones de unos usuarios (se recalculan en su siguiente petición)"""
+    for id_usuario in ids_usuario:
+        clave = clave_version_clubes(id_usuario)
+        if not cache.add(clave, 1, timeout=None):
+            cache.incr(clave)
+
+def calcular_clubes_de_usuario(usuario, hoy=None):
+    """Ids de los clubes en los que el usuario (vía su Persona) es directivo o técnico con mandato o contrato vigente"""
+    mandato = apps.get_model('core', 'Mandato')
+    contrato = apps.get_model('core', 'Contrato')
+    mandatos = mandato.objects.filter(vigente_hoy(hoy), id_directivo__id_persona__auth_user=usuario.pk, id_directivo__activo=True).values_list('id_club', flat=True)
+    contratos = contrato.objects.filter(vigente_hoy(hoy), id_tecnico__id_persona__auth_user=usuario.pk, id_tecnico__activo=True).values_list('id_club', flat=True)
+    return frozenset(mandatos.union(contratos))
+
+def clubes_del_usuario(request):
+    """Clubes del usuario de la petición, cacheados en su sesión hasta que cambie el día o algún mandato o contrato"""
+    if not request.user.is_authenticated:
+        return frozenset()
+    hoy = timezone.localdate()
+    version = cache.get(clave_version_clubes(request.user.pk), 0)
+    guardado = request.session.get(CLAVE_SESION_CLUBES)
+    if guardado and guardado['usuario'] == request.user.pk and guardado['fecha'] == hoy.isoformat() and guardado['version'] == version:
+        return frozenset(guardado['clubes'])
+    clubes = calcular_clubes_de_usuario(request.user, hoy)
+    request.session[CLAVE_SESION_CLUBES] = {'usuario': request.user.pk, 'fecha': hoy.isoformat(), 'version': version, 'clubes': sorted(clubes)}
+    return clubes
+
+
+class FiltroClubAdminMixin:
+    """Mixin para ModelAdmin que limita las filas a los clubes del usuario (salvo superusuarios)"""
+    filtrar_por_club = True
+
+    def acceso_denegado(self, request):
+        """Sin camino hasta un club, el modelo sólo es para superusuarios (y las tablas globales, para quien tenga el permiso de filas sin club)"""
+        if not self.filtrar_por_club or request.user.is_superuser:
+            return False
+        rutas = rutas_club(self.model)
+        return rutas is None or (not rutas and not request.user.has_perm(PERMISO_FILAS_SIN_CLUB))
+
+    def get_queryset(self, request):
+        consulta = super().get_queryset(request)
+        if not self.filtrar_por_club or request.user.is_superuser:
+            return consulta
+        if self.acceso_denegado(request):
+            return consulta.none()
+        rutas = rutas_club(self.model)
+        if not rutas:
+            return consulta
+        clubes = clubes_del_usuario(request)
+        campo = campo_club(self.model)
+        if campo:
+            filtro = Q(**{f'{campo}__in': clubes})
+            # Las filas sin club son globales: sólo las ve quien tiene permiso para ello
+            if campo != 'pk' and self.model._meta.get_field(campo).null and request.user.has_perm(PERMISO_FILAS_SIN_CLUB):
+                filtro |= Q(**{f'{campo}__isnull': True})
+            return consulta.filter(filtro)
+        # Los caminos indirectos cruzan relaciones inversas (una fila puede ser de varios clubes): filtramos por subconsulta para no repetir filas
+        filtro = Q.create([Q(**{f'{ruta}__in': clubes}) for ruta in rutas], connector=Q.OR)
+        return consulta.filter(pk__in=self.model._base_manager.filter(filtro).values('pk'))
+
+    def has_view_permission(self, request, obj=None):
+        return not self.acceso_denegado(request) and super().has_view_permission(request, obj)
+
+    def has_add_permission(self, request, *args, **kwargs):
+        return not self.acceso_denegado(request) and super().has_add_permission(request, *args, **kwargs)
+
+    def has_change_permission(self, request, obj=None):
+        return not self.acceso_denegado(request) and super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return not self.acceso_denegado(request) and super().has_delete_permission(request, obj)
@@ -0,0 +1,235 @@
+"""Generador de datos sintéticos a escala de federación, para pruebas de rendimiento"""
+
+import random
+from itertools import islice
+from datetime import date, datetime, time, timedelta, timezone as tz
+from decimal import Decimal
+from django.db import transaction
+from core.carga_masiva import cargar_filas, reiniciar_secuencias, siguiente_clave
+from core.models import (Club, DestinatarioClub, Enfrentamiento, EstadoPartido, Instalacion, Jugador, Mensaje, PartidoIndividual,
+                         Persona, Pertenencia, Pista, Provincia, ReservaClub, ReservaJugador, TipoIdentificacion, TipoLateralidad,
+                         TipoMensaje, TipoPista, TipoSexo, TipoSuelo, nuevo_token_qr)
+
+
+# Volúmenes a escala 1 (una federación nacional)
+VOLUMENES = {
+    'clubes': 2_000,
+    'instalaciones': 1_500,
+    'pistas': 5_000,
+    'personas': 100_000,
+    'jugadores': 80_000,
+    'partidos_individuales': 1_000_000,
+    'reservas': 2_000_000,
+    'mensajes': 2_000,
+}
+PROPORCION_RESERVAS_JUGADOR = 0.7      # el resto son reservas de club
+PROPORCION_SEGUNDO_CLUB = 0.1          # jugadores que pertenecen a dos clubes
+HORAS_RESERVABLES = range(8, 22)
+DIAS_RESERVAS_PASADAS = 180
+DIAS_RESERVAS_FUTURAS = 30
+DIAS_PARTIDOS = 3 * 365
+DOMINIO_CORREO = 'sintetico.picklefree.test'
+# Filas que se tienen a la vez en memoria al generar las tablas más grandes (partidos y reservas)
+TAMANO_LOTE_SINTETICO = 50_000
+NOMBRES = ('Lucía', 'Hugo', 'Martina', 'Mateo', 'Sofía', 'Leo', 'Julia', 'Daniel', 'Paula', 'Pablo', 'Valeria', 'Álvaro', 'Carmen', 'Manuel')
+APELLIDOS = ('García', 'Rodríguez', 'González', 'Fernández', 'López', 'Martínez', 'Sánchez', 'Pérez', 'Gómez', 'Martín', 'Jiménez', 'Ruiz')
+LOCALIDADES = ('Madrid', 'Barcelona', 'Valencia', 'Sevilla', 'Zaragoza', 'Málaga', 'Murcia', 'Palma', 'Bilbao', 'Alicante', 'Logroño')
+
+
+def en_lotes(filas, tamano=TAMANO_LOTE_SINTETICO):
+    """Agrupa un iterable en listas de como mucho 'tamano' elementos"""
+    iterador = iter(filas)
+    while lote := list(islice(iterador, tamano)):
+        yield lote
+
+def volumenes(escala):
+    """Volúmenes de cada entidad para una escala dada (1 = federación completa)"""
+    return {entidad: max(2, round(cantidad * escala)) for entidad, cantidad in VOLUMENES.items()}
+
+
+class GeneradorDatos:
+    """Puebla la base de datos con datos coherentes y reproducibles (misma semilla, mismos datos) mediante COPY"""
+
+    def __init__(self, escala=1.0, semilla=2025, informar=None):
+        self.volumen = volumenes(escala)
+        self.azar = random.Random(semilla)
+        self.informar = informar or (lambda texto: None)
+        self.hoy = date.today()
+        self.ahora = datetime.now(tz.utc).replace(microsecond=0)
+
+    def _claves(self, modelo):
+        """Claves primarias de una tabla auxiliar (cargada desde los fixtures)"""
+        claves = list(modelo.objects.values_list('pk', flat=True))
+        if not claves:
+            raise ValueError(f'La tabla {modelo._meta.db_table} está vacía: carga antes los fixtures')
+        return claves
+
+    def _cargar(self, modelo, campos, filas):
+        total = cargar_filas(modelo, campos, filas)
+        self.informar(f'{modelo._meta.db_table}: {total} filas')
+        return total
+
+    def generar(self):
+        """Genera todas las entidades en una transacción y devuelve {tabla: filas}"""
+        self.provincias = self._claves(Provincia)
+        with transaction.atomic():
+            conteos = {}
+            conteos['club'] = self._clubes()
+            conteos['instalacion'] = self._instalaciones()
+            conteos['pista'] = self._pistas()
+            conteos['persona'] = self._personas()
+            conteos['jugador'] = self._jugadores()
+            conteos['pertenencia'] = self._pertenencias()
+            conteos['partido_individual'], conteos['enfrentamiento'] = self._partidos_individuales()
+            conteos['reserva_jugador'], conteos['reserva_club'] = self._reservas()
+            conteos['mensaje'] = self._mensajes()
+            reiniciar_secuencias([Club, Instalacion, Pista, Persona, Jugador, Pertenencia, PartidoIndividual, Enfrentamiento,
+                                  ReservaJugador, ReservaClub, Mensaje, DestinatarioClub])
+        return conteos
+
+    def _direccion(self):
+        """Calle, localidad, código postal, provincia y país aleatorios"""
+        return (f'Calle {self.azar.choice(APELLIDOS)} {self.azar.randint(1, 200)}', self.azar.choice(LOCALIDADES),
+                f'{self.azar.randint(1000, 52999):05d}', self.azar.choice(self.provincias), 'ES')
+
+    def _clubes(self):
+        inicio = siguiente_clave(Club)
+        self.clubes = list(range(inicio, inicio + self.volumen['clubes']))
+        # Tamaños de club desiguales: unos pocos clubes grandes y muchos pequeños
+        self.pesos_clubes = [self.azar.paretovariate(1.2) for _ in self.clubes]
+        campos = ('id_club', 'token_qr', 'nombre', 'direccion_calle_num', 'direccion_localidad', 'direccion_codigopostal',
+                  'direccion_provincia', 'direccion_pais', 'telefono_fijo', 'email', 'fecha_alta', 'activo')
+        return self._cargar(Club, campos, (
+            (club, nuevo_token_qr(), f'Club sintético {club}', *self._direccion(), f'+348{club:08d}', f'club{club}@{DOMINIO_CORREO}', self.hoy, True)
+            for club in self.clubes))
+
+    def _instalaciones(self):
+        inicio = siguiente_clave(Instalacion)
+        self.instalaciones = list(range(inicio, inicio + self.volumen['instalaciones']))
+        campos = ('id_instalacion', 'token_qr', 'nombre', 'direccion_calle_num', 'direccion_localidad', 'direccion_codigopostal',
+                  'direccion_provincia', 'direccion_pais', 'telefono_fijo', 'email', 'fecha_alta', 'activa')
+        return self._cargar(Instalacion, campos, (
+            (instalacion, nuevo_token_qr(), f'Instalación sintética {instalacion}', *self._direccion(), f'+349{instalacion:08d}',
+             f'instalacion{instalacion}@{DOMINIO_CORREO}', self.hoy, True)
+            for instalacion in self.instalaciones))
+
+    def _pistas(self):
+        inicio = siguiente_clave(Pista)
+        tipos_pista, tipos_suelo = self._claves(TipoPista), self._claves(TipoSuelo)
+        self.pistas = list(range(inicio, inicio + self.volumen['pistas']))
+        # Cada instalación tiene al menos una pista; el resto se reparten al azar
+        instalacion_de_pista = [self.instalaciones[indice % len(self.instalaciones)] if indice < len(self.instalaciones) else self.azar.choice(self.instalaciones)
+                                for indice in range(len(self.pistas))]
+        self.pistas_de_instalacion = {}
+        for pista, instalacion in zip(self.pistas, instalacion_de_pista):
+            self.pistas_de_instalacion.setdefault(instalacion, []).append(pista)
+        campos = ('id_pista', 'token_qr', 'nombre', 'id_instalacion', 'id_tipo_pista', 'id_tipo_suelo', 'iluminada', 'tiene_llave',
+                  'dimensiones_longitud', 'dimensiones_archura', 'dimensiones_altura', 'fecha_alta', 'activa')
+        return self._cargar(Pista, campos, (
+            (pista, nuevo_token_qr(), f'Pista {pista}', instalacion, self.azar.choice(tipos_pista), self.azar.choice(tipos_suelo),
+             self.azar.random() < 0.7, self.azar.random() < 0.3, Decimal('13.41'), Decimal('6.10'), Decimal('7.00'), self.hoy, True)
+            for pista, instalacion in zip(self.pistas, instalacion_de_pista)))
+
+    def _personas(self):
+        inicio = siguiente_clave(Persona)
+        tipos_identificacion, tipos_sexo = self._claves(TipoIdentificacion), self._claves(TipoSexo)
+        self.personas = list(range(inicio, inicio + self.volumen['personas']))
+        campos = ('id_persona', 'id_tipo_identificacion', 'docidentidad_valor', 'nombre', 'apellido_primero', 'apellido_segundo',
+                  'id_tipo_sexo', 'direccion_calle_num', 'direccion_localidad', 'direccion_codigopostal', 'direccion_provincia',
+                  'direccion_pais', 'nacimiento_fecha', 'nacimiento_pais', 'telefono_movil', 'email', 'fecha_alta', 'activo')
+        return self._cargar(Persona, campos, (
+            (persona, self.azar.choice(tipos_identificacion), f'{persona:08d}S', self.azar.choice(NOMBRES), self.azar.choice(APELLIDOS),
+             self.azar.choice(APELLIDOS), self.azar.choice(tipos_sexo), *self._direccion(),
+             self.hoy - timedelta(days=self.azar.randint(16 * 365, 75 * 365)), 'ES', f'+346{persona:08d}',
+             f'persona{persona}@{DOMINIO_CORREO}', self.hoy, True)
+            for persona in self.personas))
+
+    def _jugadores(self):
+        inicio = siguiente_clave(Jugador)
+        lateralidades = self._claves(TipoLateralidad)
+        self.jugadores = list(range(inicio, inicio + min(self.volumen['jugadores'], len(self.personas))))
+        campos = ('id_jugador', 'id_persona', 'token_qr', 'num_federado', 'id_tipo_lateralidad', 'fecha_alta', 'activo')
+        return self._cargar(Jugador, campos, (
+            (jugador, persona, nuevo_token_qr(), f'S{jugador:09d}', self.azar.choice(lateralidades), self.hoy, True)
+            for jugador, persona in zip(self.jugadores, self.personas)))
+
+    def _pertenencias(self):
+        self.jugadores_de_club = {club: [] for club in self.clubes}
+        filas = []
+        for jugador in self.jugadores:
+            clubes = {self.azar.choices(self.clubes, weights=self.pesos_clubes)[0]}
+            if self.azar.random() < PROPORCION_SEGUNDO_CLUB:
+                clubes.add(self.azar.choice(self.clubes))
+            for club in clubes:
+                self.jugadores_de_club[club].append(jugador)
+                filas.append((jugador, club, self.hoy, True))
+        return self._cargar(Pertenencia, ('id_jugador', 'id_club', 'fecha_alta', 'activa'), filas)
+
+    def _partidos_individuales(self):
+        inicio = siguiente_clave(PartidoIndividual)
+        estados = self._claves(EstadoPartido)
+        # Los partidos se juegan entre jugadores del mismo club, en pistas de "su" instalación
+        clubes_con_rivales = [club for club, jugadores in self.jugadores_de_club.items() if len(jugadores) >= 2]
+        pesos = [len(self.jugadores_de_club[club]) for club in clubes_con_rivales]
+        def partidos():
+            for partido in range(inicio, inicio + self.volumen['partidos_individuales']):
+                club = self.azar.choices(clubes_con_rivales, weights=pesos)[0]
+                local, visitante = self.azar.sample(self.jugadores_de_club[club], 2)
+                pistas = self.pistas_de_instalacion.get(self.instalaciones[club % len(self.instalaciones)])
+                fecha_hora = self.ahora - timedelta(minutes=self.azar.randint(0, DIAS_PARTIDOS * 24 * 60))
+                ganador = local if self.azar.random() < 0.5 else visitante
+                yield partido, local, visitante, self.azar.choice(pistas) if pistas else None, fecha_hora, ganador
+        campos_partido = ('id_partido_individual', 'id_jugador_local', 'id_jugador_visitante', 'token_qr', 'token_qr_confirmacion',
+                          'id_estado_partido', 'id_pista', 'fecha_hora', 'tods_formato', 'tods_resultado', 'id_ganador')
+        campos_enfrentamiento = ('id_partido_individual', 'id_jugador', 'id_rival', 'fecha_hora', 'local', 'ganador', 'principal', 'representante')
+        # Por lotes: cada lote se carga en partidos y, con las mismas filas de enfrentamiento que generaría la señal de guardado
+        # (que COPY no dispara), en enfrentamientos; así no hay nunca el millón de partidos en memoria
+        total = enfrentamientos = 0
+        for lote in en_lotes(partidos()):
+            total += cargar_filas(PartidoIndividual, campos_partido, (
+                (partido, local, visitante, nuevo_token_qr(), nuevo_token_qr(), estados[min(1, len(estados) - 1)], pista, fecha_hora,
+                 'SET3-S:11/TB', '11-7 9-11 11-8', ganador)
+                for partido, local, visitante, pista, fecha_hora, ganador in lote))
+            enfrentamientos += cargar_filas(Enfrentamiento, campos_enfrentamiento, (
+                fila
+                for partido, local, visitante, _, fecha_hora, ganador in lote
+                for fila in ((partido, local, visitante, fecha_hora, True, ganador == local, True, True),
+                             (partido, visitante, local, fecha_hora, False, ganador == visitante, True, True))))
+        self.informar(f'{PartidoIndividual._meta.db_table}: {total} filas')
+        self.informar(f'{Enfrentamiento._meta.db_table}: {enfrentamientos} filas')
+        return total, enfrentamientos
+
+    def _reservas(self):
+        # Cada pista recibe su parte de las reservas en franjas horarias distintas (única por pista, fecha y horas)
+        franjas = [(self.hoy + timedelta(days=dia), hora)
+                   for dia in range(-DIAS_RESERVAS_PASADAS, DIAS_RESERVAS_FUTURAS) for hora in HORAS_RESERVABLES]
+        por_pista = min(len(franjas), -(-self.volumen['reservas'] // len(self.pistas)))
+        def reservas():
+            for pista in self.pistas:
+                for fecha, hora in self.azar.sample(franjas, por_pista):
+                    solicitud = datetime.combine(fecha, time(hora), tz.utc) - timedelta(days=self.azar.randint(1, 15))
+                    if self.azar.random() < PROPORCION_RESERVAS_JUGADOR:
+                        yield ReservaJugador, (pista, self.azar.choice(self.jugadores), fecha, time(hora), time(hora + 1), solicitud, solicitud)
+                    else:
+                        yield ReservaClub, (pista, self.azar.choice(self.clubes), fecha, time(hora), time(hora + 1), solicitud, solicitud)
+        comunes = ('fecha_reserva', 'hora_inicio', 'hora_fin', 'fecha_solicitud', 'fecha_confirmacion')
+        campos = {ReservaJugador: ('id_pista', 'id_jugador', *comunes), ReservaClub: ('id_pista', 'id_club', *comunes)}
+        totales = dict.fromkeys(campos, 0)
+        for lote in en_lotes(reservas()):
+            for modelo in campos:
+                totales[modelo] += cargar_filas(modelo, campos[modelo], (fila for modelo_fila, fila in lote if modelo_fila is modelo))
+        for modelo, total in totales.items():
+            self.informar(f'{modelo._meta.db_table}: {total} filas')
+        return totales[ReservaJugador], totales[ReservaClub]
+
+    def _mensajes(self):
+        inicio = siguiente_clave(Mensaje)
+        tipos = self._claves(TipoMensaje)
+        mensajes = [(mensaje, self.azar.choice(self.clubes)) for mensaje in range(inicio, inicio + self.volumen['mensajes'])]
+        campos = ('id_mensaje', 'id_remitente', 'token_qr', 'id_tipo_mensaje', 'asunto', 'cuerpo', 'fecha_hora', 'aplicacion_futura')
+        total = self._cargar(Mensaje, campos, (
+            (mensaje, club, nuevo_token_qr(), self.azar.choice(tipos), f'Aviso {mensaje}', 'Mensaje sintético', self.ahora, False)
+            for mensaje, club in mensajes))
+        # Cada mensaje va dirigido a los miembros de su club remitente
+        self._cargar(DestinatarioClub, ('id_mensaje', 'id_club'), mensajes)
+        return total
@@ -0,0 +1,191 @@
+"""Detección de personas duplicadas (por bloques de nombre, nacimiento, teléfono, email y documento) y fusión de duplicadas"""
+
+from collections import defaultdict, namedtuple
+from itertools import combinations
+from django.db import transaction
+from core.almacenamiento import actualizar_referencias, campos_fichero
+from core.busqueda import CAMPOS_TELEFONO, normalizar
+from core.models import Directivo, Jugador, Operario, Persona, Tecnico
+
+
+# Una pareja se da por duplicada a partir de esta puntuación (0 a 1)
+UMBRAL_DUPLICADO = 0.65
+# Los bloques más grandes (nombres muy comunes, emails como info@) se descartan: compararlos todos con todos no compensa
+MAXIMO_BLOQUE = 100
+# Peso de cada indicio en la puntuación; una fecha de nacimiento distinta resta
+PESO_NOMBRE = 0.5
+PESO_DOCUMENTO = 0.3
+PESO_NACIMIENTO = 0.2
+PESO_TELEFONO = 0.2
+PESO_EMAIL = 0.1
+PENALIZACION_NACIMIENTO = 0.3
+# Modelos de los papeles de una persona, de los que lo normal es que tenga como mucho una fila
+MODELOS_ROL = (Jugador, Tecnico, Directivo, Operario)
+# Campos que la persona conservada toma de las duplicadas si no los tiene
+CAMPOS_A_COMPLETAR = ('foto', 'apellido_segundo', 'nacimiento_fecha', 'nacimiento_localidad', 'auth_user')
+
+Ficha = namedtuple('Ficha', 'id nombre apellido trigramas nacimiento telefonos emails documento')
+Candidato = namedtuple('Candidato', 'puntuacion id_a id_b motivos')
+
+
+def trigramas(texto):
+    """Trigramas de las palabras de un texto normalizado, como los calcula pg_trgm"""
+    return frozenset(f'  {palabra} '[i:i + 3] for palabra in texto.split() for i in range(len(palabra) + 1))
+
+def normalizar_documento(valor):
+    """Documento sólo con letras y cifras en mayúsculas, para compararlo sea cual sea su tipo"""
+    return ''.join(caracter for caracter in valor.upper() if caracter.isalnum())
+
+def usuario_email(email):
+    """Parte local del email, sin la etiqueta +algo (el mismo usuario en distintos dominios suele ser la misma persona)"""
+    return email.lower().split('@')[0].split('+')[0]
+
+def ficha_persona(persona):
+    """Datos normalizados de una persona (fila de values()) que se usan para agrupar y puntuar"""
+    nombre = normalizar(' '.join(filter(None, (persona['nombre'], persona['apellido_primero'], persona['apellido_segundo']))))
+    return Ficha(
+        id=persona['pk'],
+        nombre=nombre,
+        apellido=normalizar(persona['apellido_primero']),
+        trigramas=trigramas(nombre),
+        nacimiento=persona['nacimiento_fecha'],
+        telefonos=frozenset(str(persona[campo]) for campo in CAMPOS_TELEFONO if persona[campo]),
+        emails=frozenset(usuario_email(persona[campo]) for campo in ('email', 'email_adicional') if persona[campo]),
+        documento=normalizar_documento(persona['docidentidad_valor']),
+    )
+
+def claves_bloque(ficha):
+    """Bloques a los que pertenece una persona: sólo se comparan entre sí las personas de un mismo bloque"""
+    claves = [('nombre', ficha.nombre), ('documento', ficha.documento)]
+    if ficha.nacimiento:
+        claves.append(('nacimiento', ficha.nacimiento, ficha.apellido[:1]))
+    claves.extend(('telefono', telefono) for telefono in ficha.telefonos)
+    claves.extend(('email', email) for email in ficha.emails)
+    return claves
+
+def puntuar(a, b):
+    """Puntuación de parecido de dos fichas (0 a 1) y los indicios que la justifican"""
+    union = len(a.trigramas | b.trigramas)
+    similitud_nombre = len(a.trigramas & b.trigramas) / union if union else 0.0
+    puntuacion = PESO_NOMBRE * similitud_nombre
+    motivos = [f'nombre {similitud_nombre:.2f}']
+    if a.documento and a.documento == b.documento:
+        puntuacion += PESO_DOCUMENTO
+        motivos.append('documento')
+    if a.nacimiento and b.nacimiento:
+        if a.nacimiento == b.nacimiento:
+            puntuacion += PESO_NACIMIENTO
+            motivos.append('nacimiento')
+        else:
+            puntuacion -= PENALIZACION_NACIMIENTO
+            motivos.append('nacimiento distinto')
+    if a.telefonos & b.telefonos:
+        puntuacion += PESO_TELEFONO
+        motivos.append('teléfono')
+    if a.emails & b.emails:
+        puntuacion += PESO_EMAIL
+        motivos.append('email')
+    return min(max(puntuacion, 0.0), 1.0), motivos
+
+def detectar_duplicados(personas=None, umbral=UMBRAL_DUPLICADO, maximo_bloque=MAXIMO_BLOQUE):
+    """Parejas de personas probablemente duplicadas, de más a menos probable, y el número de bloques descartados por grandes"""
+    personas = Persona.objects.all() if personas is None else personas
+    campos = ('pk', 'nombre', 'apellido_primero', 'apellido_segundo', 'nacimiento_fecha', 'docidentidad_valor', 'email', 'email_adicional',
+              *CAMPOS_TELEFONO)
+    # Una sola pasada por la tabla: las fichas se normalizan una vez y cada pareja se puntúa con operaciones de conjuntos
+    fichas = {}
+    bloques = defaultdict(list)
+    for persona in personas.values(*campos).iterator(chunk_size=5000):
+        ficha = ficha_persona(persona)
+        fichas[ficha.id] = ficha
+        for clave in claves_bloque(ficha):
+            bloques[clave].append(ficha.id)
+    parejas = set()
+    descartados = 0
+    for ids in bloques.values():
+        if len(ids) > maximo_bloque:
+            descartados += 1
+        elif len(ids) > 1:
+            parejas.update(combinations(sorted(set(ids)), 2))
+    # Sin vectorizar: los bloques dejan pocas parejas y los trigramas son conjuntos de tamaño variable, así que pasarlos a
+    # matrices para compararlos en bloque costaría más que puntuar cada pareja con operaciones de conjuntos
+    candidatos = []
+    for id_a, id_b in parejas:
+        puntuacion, motivos = puntuar(fichas[id_a], fichas[id_b])
+        if puntuacion >= umbral:
+            candidatos.append(Candidato(round(puntuacion, 3), id_a, id_b, motivos))
+    candidatos.sort(key=lambda candidato: (-candidato.puntuacion, candidato.id_a, candidato.id_b))
+    return candidatos, descartados
+
+
+def relaciones_persona():
+    """Claves ajenas de otros modelos que apuntan a Persona (Jugador, Tecnico, Directivo, Operario...)"""
+    return [relacion for relacion in Persona._meta.related_objects if relacion.one_to_many or relacion.one_to_one]
+
+@transaction.atomic
+def fusionar_personas(id_conservada, ids_duplicadas):
+    """Pasa a una persona todo lo que apunta a sus duplicadas, completa sus datos con los de ellas y las borra; devuelve las filas movidas por modelo"""
+    ids_duplicadas = sorted(set(ids_duplicadas) - {id_conservada})
+    if not ids_duplicadas:
+        raise ValueError('Indique al menos una persona duplicada distinta de la conservada')
+    # Bloqueadas en orden de clave para que dos fusiones simultáneas no se interbloqueen
+    personas = {persona.pk: persona for persona in Persona.objects.select_for_update().filter(pk__in=[id_conservada, *ids_duplicadas]).order_by('pk')}
+    faltan = sorted(set([id_conservada, *ids_duplicadas]) - set(personas))
+    if faltan:
+        raise ValueError(f'No existen las personas {", ".join(map(str, faltan))}')
+    conservada = personas[id_conservada]
+    duplicadas = [personas[id_persona] for id_persona in ids_duplicadas]
+    movidas = {}
+    for relacion in relaciones_persona():
+        campo = relacion.field.name
+        filas = relacion.related_model._base_manager.filter(**{f'{campo}__in': ids_duplicadas}).update(**{campo: id_conservada})
+        if filas:
+            movidas[relacion.related_model._meta.verbose_name_plural] = filas
+    completar_datos(conservada, duplicadas)
+    soltar_ficheros_pasados(conservada, duplicadas)
+    # Las duplicadas se borran antes de guardar la conservada: teléfonos, emails y usuario son únicos
+    Persona.objects.filter(pk__in=ids_duplicadas).delete()
+    conservada.save()
+    return movidas
+
+def roles_repetidos(id_persona):
+    """Papeles (jugador, técnico...) en los que la persona tiene más de una fila, p. ej. tras fusionarla: {modelo: claves}"""
+    repetidos = {}
+    for modelo in MODELOS_ROL:
+        claves = list(modelo._base_manager.filter(id_persona=id_persona).order_by('pk').values_list('pk', flat=True))
+        if len(claves) > 1:
+            repetidos[modelo._meta.verbose_name_plural] = claves
+    return repetidos
+
+def completar_datos(conservada, duplicadas):
+    """Rellena los datos que le faltan a la persona conservada con los de sus duplicadas (sin guardarla)"""
+    for duplicada in duplicadas:
+        for campo in CAMPOS_A_COMPLETAR:
+            if not getattr(conservada, campo) and getattr(duplicada, campo):
+                setattr(conservada, campo, getattr(duplicada, campo))
+        telefonos = {getattr(conservada, campo) for campo in CAMPOS_TELEFONO} - {None, ''}
+        libres = [campo for campo in CAMPOS_TELEFONO if not getattr(conservada, campo)]
+        for campo in CAMPOS_TELEFONO:
+            telefono = getattr(duplicada, campo)
+            if telefono and telefono not in telefonos and libres:
+                setattr(conservada, libres.pop(0), telefono)
+                telefonos.add(telefono)
+        emails = {email.lower() for email in (conservada.email, conservada.email_adicional) if email}
+        nuevos = [email for email in (duplicada.email, duplicada.email_adicional) if email and email.lower() not in emails]
+        if not conservada.email_adicional and nuevos:
+            conservada.email_adicional = nuevos[0]
+        conservada.fecha_alta = min(conservada.fecha_alta, duplicada.fecha_alta)
+        conservada.activo = conservada.activo or duplicada.activo
+        nota = f'Fusionada con la persona {duplicada.pk} ({duplicada.id_tipo_identificacion} {duplicada.docidentidad_valor})'
+        conservada.comentarios = '\n'.join(filter(None, (conservada.comentarios, nota)))
+
+def soltar_ficheros_pasados(conservada, duplicadas):
+    """Vacía en la BD los ficheros que la conservada ha tomado de sus duplicadas, para que django-cleanup no los borre con ellas"""
+    # update() no pasa por las señales: restamos a mano la referencia que suelta la duplicada (la conservada suma la suya al guardarse)
+    campos = [campo.name for campo in campos_fichero(Persona)]
+    for duplicada in duplicadas:
+        pasados = {campo: '' for campo in campos if getattr(duplicada, campo) and getattr(duplicada, campo).name == getattr(conservada, campo).name}
+        if pasados:
+            Persona.objects.filter(pk=duplicada.pk).update(**pasados)
+            for campo in pasados:
+                actualizar_referencias(getattr(duplicada, campo).name, '')
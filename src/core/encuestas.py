@@ -0,0 +1,204 @@
+"""Agregación de las respuestas de las encuestas (djf_surveys) con SQL agrupado, cacheada por encuesta"""
+
+from contextlib import contextmanager
+from django.core.cache import cache
+from django.db.models import Count
+from djf_surveys.admins.views import SummaryResponseSurveyView
+from djf_surveys.models import TYPE_FIELD, Answer, Question, UserAnswer
+from djf_surveys.summary import ChartBar, ChartBarRating, ChartPie, SummaryResponse
+
+
+# Tipos de pregunta cuyas respuestas tiene sentido agrupar (los de texto libre sólo se cuentan)
+TIPOS_CON_DISTRIBUCION = (TYPE_FIELD.radio, TYPE_FIELD.select, TYPE_FIELD.multi_select, TYPE_FIELD.rating, TYPE_FIELD.number)
+TIPOS_CON_MEDIA = (TYPE_FIELD.rating, TYPE_FIELD.number)
+SEGUNDOS_BLOQUEO_RESUMEN = 10
+SEGUNDOS_CAMBIO_EN_CURSO = 60
+
+
+def clave_cache_resumen(id_encuesta):
+    """Clave de caché del resumen agregado de una encuesta"""
+    return f'encuestas:resumen:{id_encuesta}'
+
+def _valores(tipo, valor):
+    """Valores individuales de una respuesta: las de selección múltiple guardan varias opciones separadas por comas"""
+    if tipo == TYPE_FIELD.multi_select:
+        return [opcion for opcion in valor.split(',') if opcion]
+    return [valor]
+
+def _a_numero(valor):
+    """Valor numérico de una respuesta, o None si no lo es"""
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+def _resumen_pregunta(tipo):
+    """Resumen vacío de una pregunta"""
+    return {'tipo': tipo, 'total': 0, 'distribucion': {}, 'suma': 0.0, 'numericas': 0}
+
+def _sumar_respuesta(resumen, valor, veces=1):
+    """Acumula en el resumen de una pregunta una respuesta (o un grupo de respuestas iguales)"""
+    resumen['total'] += veces
+    if resumen['tipo'] not in TIPOS_CON_DISTRIBUCION:
+        return
+    for opcion in _valores(resumen['tipo'], valor):
+        resumen['distribucion'][opcion] = resumen['distribucion'].get(opcion, 0) + veces
+    numero = _a_numero(valor) if resumen['tipo'] in TIPOS_CON_MEDIA else None
+    if numero is not None:
+        resumen['suma'] += numero * veces
+        resumen['numericas'] += veces
+
+def media(resumen_pregunta):
+    """Media de una pregunta numérica o de valoración (None si no tiene respuestas numéricas)"""
+    if not resumen_pregunta['numericas']:
+        return None
+    return resumen_pregunta['suma'] / resumen_pregunta['numericas']
+
+def calcular_resumen(id_encuesta):
+    """Recuentos, distribuciones y medias por pregunta de una encuesta, con tres consultas agrupadas"""
+    preguntas = {pk: _resumen_pregunta(tipo) for pk, tipo in Question.objects.filter(survey_id=id_encuesta).values_list('pk', 'type_field')}
+    # Un grupo por (pregunta, valor): las respuestas de texto libre se agrupan sólo por pregunta
+    agrupadas = (Answer.objects.filter(question__survey_id=id_encuesta, question__type_field__in=TIPOS_CON_DISTRIBUCION)
+                 .values_list('question_id', 'value').annotate(veces=Count('pk')).order_by())
+    for pregunta, valor, veces in agrupadas:
+        _sumar_respuesta(preguntas[pregunta], valor, veces)
+    libres = (Answer.objects.filter(question__survey_id=id_encuesta).exclude(question__type_field__in=TIPOS_CON_DISTRIBUCION)
+              .values_list('question_id').annotate(veces=Count('pk')).order_by())
+    for pregunta, veces in libres:
+        preguntas[pregunta]['total'] += veces
+    return {'encuestados': UserAnswer.objects.filter(survey_id=id_encuesta).count(), 'preguntas': preguntas}
+
+@contextmanager
+def _bloqueo_resumen(id_encuesta):
+    """Bloqueo en la caché del resumen de una encuesta; da False si lo tiene otro proceso"""
+    bloqueo = f'{clave_cache_resumen(id_encuesta)}:bloqueo'
+    obtenido = cache.add(bloqueo, 1, timeout=SEGUNDOS_BLOQUEO_RESUMEN)
+    try:
+        yield obtenido
+    finally:
+        if obtenido:
+            cache.delete(bloqueo)
+
+def resumen_encuesta(id_encuesta):
+    """Resumen agregado de una encuesta, desde la caché o calculándolo si no está"""
+    clave = clave_cache_resumen(id_encuesta)
+    resumen = cache.get(clave)
+    if resumen is not None:
+        return resumen
+    # El recálculo sólo se guarda, con el mismo bloqueo que las sumas incrementales, si no había cambios en curso al empezar
+    # ni al terminar y no se ha confirmado ninguno entretanto: si no, una respuesta que ya ve la consulta se sumaría otra vez
+    # al confirmarse, o se perdería una sumada mientras se calculaba
+    version = cache.get(f'{clave}:version', 0)
+    sin_cambios = not cache.get(f'{clave}:cambios')
+    resumen = calcular_resumen(id_encuesta)
+    if sin_cambios:
+        with _bloqueo_resumen(id_encuesta) as obtenido:
+            if obtenido and not cache.get(f'{clave}:cambios') and cache.get(f'{clave}:version', 0) == version:
+                cache.set(clave, resumen, timeout=None)
+    return resumen
+
+def anotar_cambio(id_encuesta):
+    """Anota un cambio de la encuesta aún sin confirmar (se llama dentro de la transacción que lo hace)"""
+    clave = f'{clave_cache_resumen(id_encuesta)}:cambios'
+    # Caduca por si la transacción se deshace y nunca llega a confirmarse
+    if not cache.add(clave, 1, timeout=SEGUNDOS_CAMBIO_EN_CURSO):
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.add(clave, 1, timeout=SEGUNDOS_CAMBIO_EN_CURSO)
+
+def confirmar_cambio(id_encuesta, actualizacion=None):
+    """Cierra un cambio anotado y ya confirmado: aplica su actualización incremental al resumen cacheado o, si no la tiene, lo descarta"""
+    clave = clave_cache_resumen(id_encuesta)
+    with _bloqueo_resumen(id_encuesta) as obtenido:
+        # Sin el bloqueo no podemos leer-modificar-escribir sin perder actualizaciones concurrentes: mejor recalcular
+        resumen = cache.get(clave) if obtenido and actualizacion else None
+        if resumen is not None:
+            actualizacion(resumen)
+            cache.set(clave, resumen, timeout=None)
+        else:
+            cache.delete(clave)
+        if not cache.add(f'{clave}:version', 1, timeout=None):
+            cache.incr(f'{clave}:version')
+    try:
+        cache.decr(f'{clave}:cambios')
+    except ValueError:
+        pass
+
+def invalidar_resumen(id_encuesta):
+    """Descarta el resumen cacheado de una encuesta (se recalcula en la siguiente consulta)"""
+    anotar_cambio(id_encuesta)
+    confirmar_cambio(id_encuesta)
+
+def datos_pregunta(id_pregunta):
+    """Encuesta y tipo de una pregunta, cacheados para no consultarlos por cada respuesta (None si no existe)"""
+    clave = f'encuestas:pregunta:{id_pregunta}'
+    datos = cache.get(clave)
+    if datos is None:
+        datos = Question.objects.filter(pk=id_pregunta).values_list('survey_id', 'type_field').first()
+        if datos is not None:
+            cache.set(clave, tuple(datos), timeout=None)
+    return datos
+
+def olvidar_pregunta(id_pregunta):
+    """Descarta la encuesta y el tipo cacheados de una pregunta"""
+    cache.delete(f'encuestas:pregunta:{id_pregunta}')
+
+def sumar_encuestado(id_encuesta):
+    """Cuenta un nuevo encuestado (ya confirmado) en el resumen cacheado"""
+    def actualizacion(resumen):
+        resumen['encuestados'] += 1
+    confirmar_cambio(id_encuesta, actualizacion)
+
+def sumar_respuesta(id_encuesta, id_pregunta, tipo, valor):
+    """Acumula una nueva respuesta (ya confirmada) en el resumen cacheado de su encuesta"""
+    def actualizacion(resumen):
+        resumen['preguntas'].setdefault(id_pregunta, _resumen_pregunta(tipo))
+        _sumar_respuesta(resumen['preguntas'][id_pregunta], valor)
+    confirmar_cambio(id_encuesta, actualizacion)
+
+
+class ResumenEncuesta(SummaryResponse):
+    """Resumen de djf_surveys que dibuja los gráficos a partir del resumen agregado y cacheado, sin consultas por pregunta"""
+
+    def __init__(self, survey):
+        super().__init__(survey)
+        self.resumen = resumen_encuesta(survey.pk)
+
+    def _distribucion(self, question):
+        return self.resumen['preguntas'].get(question.pk, _resumen_pregunta(question.type_field))['distribucion']
+
+    def _process_radio_type(self, question):
+        grafico = ChartPie(chart_id=f'chartpie_{question.id}', chart_name=question.label)
+        distribucion = self._distribucion(question)
+        grafico.labels = question.choices.split(',')
+        grafico.data = [distribucion.get(etiqueta.strip().replace(' ', '_').lower(), 0) for etiqueta in grafico.labels]
+        return grafico.render()
+
+    def _process_multiselect_type(self, question):
+        grafico = ChartBar(chart_id=f'barchart_{question.id}', chart_name=question.label)
+        distribucion = self._distribucion(question)
+        grafico.labels = question.choices.split(',')
+        grafico.data = [distribucion.get(etiqueta.strip().replace(' ', '_').lower(), 0) for etiqueta in grafico.labels]
+        return grafico.render()
+
+    def _process_rating_type(self, question):
+        estrellas = int(question.choices or 5)  # 5 por defecto, como djf_surveys
+        grafico = ChartBarRating(chart_id=f'chartbar_{question.id}', chart_name=question.label)
+        distribucion = self._distribucion(question)
+        grafico.num_stars = estrellas
+        grafico.labels = [str(valor + 1) for valor in range(estrellas)]
+        grafico.data = [distribucion.get(etiqueta, 0) for etiqueta in grafico.labels]
+        grafico.rate_avg = round(media(self.resumen['preguntas'].get(question.pk, _resumen_pregunta(question.type_field))) or 0, 1)
+        return grafico.render()
+
+
+class ResumenEncuestaView(SummaryResponseSurveyView):
+    """Página de resumen de djf_surveys servida con ResumenEncuesta"""
+    leer_de_replica = True
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['summary'] = ResumenEncuesta(survey=self.object)
+        return context
+
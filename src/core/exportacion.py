@@ -0,0 +1,130 @@
+"""Exportación en streaming de las respuestas de las encuestas (djf_surveys) a CSV o Parquet"""
+
+import csv
+from itertools import groupby
+from django.http import Http404, StreamingHttpResponse
+from djf_surveys.admins.views import DownloadResponseSurveyView
+from djf_surveys.models import TYPE_FIELD, UserAnswer
+
+# Parquet es opcional: sólo se ofrece si pyarrow está instalado
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+TAMANO_LOTE_EXPORTACION = 2000
+TIPOS_CON_OPCIONES = (TYPE_FIELD.radio, TYPE_FIELD.select, TYPE_FIELD.multi_select)
+SIN_USUARIO = 'no auth'
+
+
+def _valor_exportado(tipo, valor):
+    """Valor de una respuesta tal y como lo exporta djf_surveys (Answer.get_value_for_csv)"""
+    if tipo in TIPOS_CON_OPCIONES:
+        return valor.strip().replace('_', ' ').capitalize()
+    return valor.strip()
+
+def cabecera(preguntas):
+    """Nombres de las columnas: usuario, fecha de la respuesta y una por pregunta"""
+    return ['user', 'update_at'] + [pregunta.label for pregunta in preguntas]
+
+def filas_encuestados(encuesta, preguntas):
+    """Genera una fila por encuestado pivotando sus respuestas, leyéndolas con un cursor de servidor"""
+    posiciones = {pregunta.pk: posicion for posicion, pregunta in enumerate(preguntas)}
+    # Se recorren los encuestados con sus respuestas unidas por LEFT JOIN: los que no contestaron nada también tienen fila
+    respuestas = (UserAnswer.objects.filter(survey=encuesta)
+                  .order_by('pk')
+                  .values_list('pk', 'user__username', 'updated_at', 'answer__question_id', 'answer__question__type_field', 'answer__value')
+                  .iterator(chunk_size=TAMANO_LOTE_EXPORTACION))
+    # Las respuestas llegan ordenadas por encuestado, así que sólo hace falta tener en memoria las de uno
+    for _, grupo in groupby(respuestas, key=lambda respuesta: respuesta[0]):
+        valores = [''] * len(preguntas)
+        usuario = fecha = None
+        for _, usuario, fecha, pregunta, tipo, valor in grupo:
+            if pregunta in posiciones:
+                valores[posiciones[pregunta]] = _valor_exportado(tipo, valor)
+        yield [usuario or SIN_USUARIO, fecha] + valores
+
+class _Eco:
+    """Pseudo-fichero que devuelve lo que se le escribe, para que csv.writer genere trozos de la respuesta"""
+
+    def write(self, valor):
+        return valor
+
+def exportar_csv(encuesta, preguntas):
+    """Genera el CSV de las respuestas línea a línea"""
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(cabecera(preguntas))
+    for fila in filas_encuestados(encuesta, preguntas):
+        fila[1] = fila[1].strftime('%Y-%m-%d %H:%M:%S')
+        yield escritor.writerow(fila)
+
+
+class _SalidaVaciable:
+    """Fichero de sólo escritura que acumula lo escrito hasta que se recoge, para enviar el Parquet por trozos"""
+
+    closed = False
+
+    def __init__(self):
+        self.trozos = []
+        self.posicion = 0
+
+    def write(self, datos):
+        self.trozos.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def recoger(self):
+        """Devuelve y olvida lo escrito desde la última recogida"""
+        datos, self.trozos = b''.join(self.trozos), []
+        return datos
+
+def _lote_parquet(filas, esquema):
+    """RecordBatch de Arrow con las filas dadas (por columnas, así se admiten preguntas con la misma etiqueta)"""
+    return pyarrow.RecordBatch.from_arrays([list(columna) for columna in zip(*filas)], schema=esquema)
+
+def exportar_parquet(encuesta, preguntas):
+    """Genera el Parquet de las respuestas, un grupo de filas por lote de encuestados"""
+    nombres = cabecera(preguntas)
+    esquema = pyarrow.schema([pyarrow.field(nombre, pyarrow.string()) for nombre in nombres])
+    esquema = esquema.set(1, pyarrow.field(nombres[1], pyarrow.timestamp('us', tz='UTC')))
+    salida = _SalidaVaciable()
+    with pyarrow.parquet.ParquetWriter(salida, esquema) as escritor:
+        lote = []
+        for fila in filas_encuestados(encuesta, preguntas):
+            lote.append(fila)
+            if len(lote) == TAMANO_LOTE_EXPORTACION:
+                escritor.write_batch(_lote_parquet(lote, esquema))
+                lote = []
+                yield salida.recoger()
+        if lote:
+            escritor.write_batch(_lote_parquet(lote, esquema))
+    yield salida.recoger()
+
+
+class ExportarRespuestasView(DownloadResponseSurveyView):
+    """Descarga de respuestas de djf_surveys en streaming: CSV por defecto y Parquet con ?formato=parquet"""
+    leer_de_replica = True
+
+    def get(self, request, *args, **kwargs):
+        encuesta = self.get_object()
+        preguntas = list(encuesta.questions.all())
+        if request.GET.get('formato') == 'parquet':
+            if pyarrow is None:
+                raise Http404('La exportación a Parquet necesita pyarrow')
+            respuesta = StreamingHttpResponse(exportar_parquet(encuesta, preguntas), content_type='application/vnd.apache.parquet')
+            respuesta['Content-Disposition'] = f'attachment; filename={encuesta.slug}.parquet'
+        else:
+            respuesta = StreamingHttpResponse(exportar_csv(encuesta, preguntas), content_type='text/csv')
+            respuesta['Content-Disposition'] = f'attachment; filename={encuesta.slug}.csv'
+        return respuesta
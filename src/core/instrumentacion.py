@@ -0,0 +1,152 @@
+"""Instrumentación de consultas SQL por petición: recuento, tiempo, duplicadas (N+1) y más lentas, con muestreo"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger('picklefree.consultas')
+
+CONSULTAS_LENTAS_MOSTRADAS = 5
+LONGITUD_MAXIMA_SQL = 500
+
+# Listas de parámetros de IN (...) y VALUES (...), que varían en longitud pero no cambian la forma de la consulta
+_PATRON_LISTA_PARAMETROS = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_PATRON_ESPACIOS = re.compile(r'\s+')
+
+
+def huella(sql):
+    """Forma normalizada de una consulta: igual para todas las ejecuciones de la misma consulta con distintos parámetros"""
+    return _PATRON_ESPACIOS.sub(' ', _PATRON_LISTA_PARAMETROS.sub('(%s, ...)', sql)).strip()
+
+
+class RegistroConsultas:
+    """Recoge las consultas ejecutadas mientras está activo, vía execute_wrapper (no necesita DEBUG)"""
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append((sql, (time.perf_counter() - inicio) * 1000))
+
+    def activar(self):
+        """Gestor de contexto que instala el registro en todas las conexiones del hilo actual"""
+        pila = ExitStack()
+        for alias in connections:
+            pila.enter_context(connections[alias].execute_wrapper(self))
+        return pila
+
+    def resumen(self):
+        """Recuento, tiempo total, huellas repetidas y sentencias más lentas"""
+        repeticiones = Counter(huella(sql) for sql, _ in self.consultas)
+        lentas = sorted(self.consultas, key=lambda consulta: consulta[1], reverse=True)[:CONSULTAS_LENTAS_MOSTRADAS]
+        return {
+            'consultas': len(self.consultas),
+            'tiempo_bd_ms': round(sum(duracion for _, duracion in self.consultas), 2),
+            'duplicadas': {sql[:LONGITUD_MAXIMA_SQL]: veces for sql, veces in repeticiones.most_common() if veces > 1},
+            'lentas': [{'sql': sql[:LONGITUD_MAXIMA_SQL], 'ms': round(duracion, 2)} for sql, duracion in lentas],
+        }
+
+
+# Métricas acumuladas por vista en este proceso, expuestas en formato Prometheus
+
+class Metricas:
+    """Contadores por vista de las peticiones muestreadas (cada proceso expone los suyos, etiquetados con su pid)"""
+
+    def __init__(self):
+        self.cerrojo = threading.Lock()
+        self.por_vista = {}
+
+    def anotar(self, vista, resumen, duracion_ms):
+        with self.cerrojo:
+            valores = self.por_vista.setdefault(vista, Counter())
+            valores['peticiones'] += 1
+            valores['consultas'] += resumen['consultas']
+            valores['duplicadas'] += sum(veces - 1 for veces in resumen['duplicadas'].values())
+            valores['tiempo_bd'] += resumen['tiempo_bd_ms'] / 1000
+            valores['tiempo'] += duracion_ms / 1000
+
+    def exponer(self):
+        """Texto en el formato de exposición de Prometheus"""
+        series = (
+            ('picklefree_peticiones_muestreadas_total', 'peticiones', 'Peticiones muestreadas'),
+            ('picklefree_consultas_sql_total', 'consultas', 'Consultas SQL en peticiones muestreadas'),
+            ('picklefree_consultas_sql_duplicadas_total', 'duplicadas', 'Consultas SQL repetidas (N+1) en peticiones muestreadas'),
+            ('picklefree_tiempo_bd_segundos_total', 'tiempo_bd', 'Tiempo en base de datos de peticiones muestreadas'),
+            ('picklefree_tiempo_peticion_segundos_total', 'tiempo', 'Tiempo total de peticiones muestreadas'),
+        )
+        with self.cerrojo:
+            por_vista = {vista: dict(valores) for vista, valores in self.por_vista.items()}
+        lineas = []
+        for nombre, clave, ayuda in series:
+            lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} counter']
+            for vista, valores in sorted(por_vista.items()):
+                lineas.append(f'{nombre}{{vista="{vista}",pid="{os.getpid()}"}} {valores.get(clave, 0)}')
+        return '\n'.join(lineas) + '\n'
+
+metricas = Metricas()
+
+
+def nombre_vista(request):
+    """Nombre estable de la vista que atendió la petición (o su ruta si no se resolvió)"""
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is None:
+        return 'sin_resolver'
+    return coincidencia.view_name or coincidencia.route or coincidencia._func_path  # pylint: disable=protected-access
+
+
+def host_permitido():
+    """Un nombre de host aceptado por ALLOWED_HOSTS, para las peticiones simuladas con el cliente de pruebas"""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+class InstrumentacionConsultasMiddleware:
+    """Middleware que, para una fracción INSTRUMENTACION_MUESTREO de las peticiones, registra sus consultas SQL"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.muestreo = getattr(settings, 'INSTRUMENTACION_MUESTREO', 0)
+        self.umbral_lenta_ms = getattr(settings, 'INSTRUMENTACION_UMBRAL_LENTA_MS', 200)
+
+    def __call__(self, request):
+        if not self.muestreo or random.random() >= self.muestreo:
+            return self.get_response(request)
+        registro = RegistroConsultas()
+        inicio = time.perf_counter()
+        with registro.activar():
+            response = self.get_response(request)
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        resumen = registro.resumen()
+        vista = nombre_vista(request)
+        metricas.anotar(vista, resumen, duracion_ms)
+        lenta = any(consulta['ms'] >= self.umbral_lenta_ms for consulta in resumen['lentas'])
+        nivel = logging.WARNING if lenta or resumen['duplicadas'] else logging.INFO
+        logger.log(nivel, 'consultas %s %s', request.method, request.path, extra={'datos': {
+            'metodo': request.method, 'ruta': request.path, 'vista': vista, 'estado': response.status_code,
+            'duracion_ms': round(duracion_ms, 2), **resumen,
+        }})
+        return response
+
+
+class FormateadorJSON(logging.Formatter):
+    """Formatea cada registro como una línea JSON, incluyendo los datos estructurados del atributo 'datos'"""
+
+    def format(self, record):
+        linea = {'fecha': self.formatTime(record), 'nivel': record.levelname, 'logger': record.name, 'mensaje': record.getMessage()}
+        linea.update(getattr(record, 'datos', {}))
+        return json.dumps(linea, ensure_ascii=False, default=str)
@@ -0,0 +1,62 @@
+"""Comando para separar y archivar las particiones antiguas de envíos y reservas"""
+
+import datetime
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from core.particionado import ESQUEMA_ARCHIVO, TABLAS_PARTICIONABLES, archivar_particiones, esta_particionada, inicio_periodo
+
+
+def fecha_de_corte(opciones):
+    """Fecha antes de la cual se archivan las particiones: --antes-de o hace --conservar meses"""
+    if opciones['antes_de']:
+        return opciones['antes_de']
+    hoy = datetime.date.today()
+    meses = hoy.year * 12 + hoy.month - 1 - opciones['conservar']
+    return datetime.date(meses // 12, meses % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    """Separa (DETACH) las particiones anteriores a una fecha y las mueve al esquema de archivo o las exporta a CSV y las borra"""
+    help = 'Archiva las particiones antiguas: el borrado del histórico es un cambio de metadatos en vez de un DELETE masivo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Alias de la base de datos')
+        parser.add_argument('--tabla', choices=sorted(TABLAS_PARTICIONABLES), action='append', help='Tabla a archivar (por defecto todas las particionadas)')
+        parser.add_argument('--antes-de', type=datetime.date.fromisoformat, help='Archivar las particiones que terminan antes de esta fecha (AAAA-MM-DD)')
+        parser.add_argument('--conservar', type=int, default=24, help='Meses a conservar si no se indica --antes-de')
+        parser.add_argument('--exportar', metavar='CARPETA', help='Exportar cada partición a CSV en esta carpeta y borrarla, en vez de moverla al esquema de archivo')
+        parser.add_argument('--simular', action='store_true', help='Sólo mostrar las particiones que se archivarían')
+
+    def handle(self, *args, **options):
+        conexion = connections[options['database']]
+        if conexion.vendor != 'postgresql':
+            raise CommandError('El particionado necesita PostgreSQL')
+        # Nunca se archiva el periodo en curso, aunque se pida una fecha posterior
+        antes_de = min(fecha_de_corte(options), inicio_periodo(datetime.date.today(), 'mes'))
+        carpeta = Path(options['exportar']) if options['exportar'] else None
+        if carpeta:
+            carpeta.mkdir(parents=True, exist_ok=True)
+        for tabla in options['tabla'] or TABLAS_PARTICIONABLES:
+            with transaction.atomic(using=options['database']), conexion.cursor() as cursor:
+                if not esta_particionada(cursor, tabla):
+                    continue
+                separadas = archivar_particiones(cursor, tabla, antes_de)
+                for particion in separadas:
+                    if options['simular']:
+                        continue
+                    if carpeta:
+                        self._exportar(cursor, particion, carpeta / f'{particion}.csv')
+                        cursor.execute(f'DROP TABLE "{particion}"')
+                    else:
+                        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{ESQUEMA_ARCHIVO}"')
+                        cursor.execute(f'ALTER TABLE "{particion}" SET SCHEMA "{ESQUEMA_ARCHIVO}"')
+                self.stdout.write(f'{tabla}: {len(separadas)} particiones archivadas antes de {antes_de}' + (f' ({", ".join(separadas)})' if separadas else ''))
+                if options['simular']:
+                    transaction.set_rollback(True, using=options['database'])
+
+    def _exportar(self, cursor, particion, ruta):
+        """Vuelca una partición a un fichero CSV con cabecera"""
+        with open(ruta, 'wb') as fichero, cursor.copy(f'COPY "{particion}" TO STDOUT WITH (FORMAT csv, HEADER)') as copia:
+            for bloque in copia:
+                fichero.write(bloque)
@@ -0,0 +1,134 @@
+"""Comando para auditar el uso de los índices de las tablas de core en PostgreSQL"""
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+CONSULTA_USO_INDICES = '''
+    SELECT s.relname, s.indexrelname, s.idx_scan, pg_relation_size(s.indexrelid), i.indisunique, i.indisprimary
+    FROM pg_stat_user_indexes s JOIN pg_index i ON i.indexrelid = s.indexrelid
+    WHERE s.relname = ANY(%s)
+    ORDER BY s.relname, s.indexrelname
+'''
+
+CONSULTA_COLUMNAS_INDICES = '''
+    SELECT t.relname, c.relname, i.indkey::int2[], i.indisunique, i.indpred IS NOT NULL
+    FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid JOIN pg_class t ON t.oid = i.indrelid
+    WHERE t.relname = ANY(%s) AND i.indexprs IS NULL
+'''
+
+CONSULTA_SENTENCIAS = '''
+    SELECT calls, total_exec_time, mean_exec_time, rows, query
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+    ORDER BY total_exec_time DESC
+    LIMIT %s
+'''
+
+# Sólo las tablas auditadas y sus índices: el resto de estadísticas del servidor (y las de otras aplicaciones) se conservan
+CONSULTA_REINICIAR_TABLAS = '''
+    SELECT pg_stat_reset_single_table_counters(c.oid) FROM pg_class c WHERE c.relname = ANY(%s)
+    UNION ALL
+    SELECT pg_stat_reset_single_table_counters(i.indexrelid) FROM pg_index i JOIN pg_class t ON t.oid = i.indrelid WHERE t.relname = ANY(%s)
+'''
+
+CONSULTA_REINICIAR_SENTENCIAS = '''
+    SELECT pg_stat_statements_reset(0, (SELECT oid FROM pg_database WHERE datname = current_database()), 0)
+'''
+
+
+def tablas_core():
+    """Nombres de las tablas de los modelos de core (incluidas las intermedias de ManyToMany)"""
+    tablas = set()
+    for modelo in apps.get_app_config('core').get_models(include_auto_created=True):
+        if modelo._meta.managed:
+            tablas.add(modelo._meta.db_table)
+    return sorted(tablas)
+
+def indices_redundantes(filas):
+    """Pares (índice, índice que lo cubre) cuyas columnas son prefijo de otro índice completo de la misma tabla"""
+    # Por este motivo las claves ajenas que encabezan un unique_together se declaran en core/models.py con db_index=False:
+    # el índice único ya sirve para buscar por ellas y no necesitan índice propio
+    redundantes = []
+    for tabla, indice, columnas, unico, parcial in filas:
+        if unico or parcial:
+            continue
+        for otra_tabla, otro, otras_columnas, _, otro_parcial in filas:
+            if otra_tabla == tabla and otro != indice and not otro_parcial and len(otras_columnas) >= len(columnas) and otras_columnas[:len(columnas)] == columnas:
+                # Con columnas idénticas sólo marcamos uno de los dos
+                if len(otras_columnas) > len(columnas) or otro < indice:
+                    redundantes.append((tabla, indice, otro))
+                    break
+    return redundantes
+
+def tamano_legible(octetos):
+    """Tamaño en octetos expresado en kB o MB"""
+    if octetos >= 1024 * 1024:
+        return f'{octetos / 1024 / 1024:.1f} MB'
+    return f'{octetos / 1024:.0f} kB'
+
+
+class Command(BaseCommand):
+    """Lista índices sin uso o redundantes y las sentencias más costosas según pg_stat_statements"""
+    help = 'Audita el uso de los índices de las tablas de core (sólo PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Alias de la base de datos a auditar')
+        parser.add_argument('--sentencias', type=int, default=15, help='Número de sentencias más costosas a mostrar')
+        parser.add_argument('--reiniciar', action='store_true', help='Pone a cero las estadísticas de las tablas de core tras mostrarlas, para empezar una nueva ventana de medida')
+
+    def handle(self, *args, **options):
+        conexion = connections[options['database']]
+        if conexion.vendor != 'postgresql':
+            raise CommandError('La auditoría de índices necesita PostgreSQL')
+        tablas = tablas_core()
+        with conexion.cursor() as cursor:
+            cursor.execute(CONSULTA_USO_INDICES, [tablas])
+            uso = cursor.fetchall()
+            cursor.execute(CONSULTA_COLUMNAS_INDICES, [tablas])
+            columnas = [(tabla, indice, list(claves), unico, parcial) for tabla, indice, claves, unico, parcial in cursor.fetchall()]
+            self._sin_uso(uso)
+            self._redundantes(columnas)
+            self._sentencias(cursor, options['sentencias'])
+            if options['reiniciar']:
+                self._reiniciar(cursor, tablas)
+
+    def _sin_uso(self, uso):
+        """Índices no únicos que no se han usado desde el último reinicio de estadísticas"""
+        sin_uso = [(tabla, indice, tamano) for tabla, indice, escaneos, tamano, unico, primario in uso if not escaneos and not unico and not primario]
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Índices sin uso ({len(sin_uso)} de {len(uso)})'))
+        for tabla, indice, tamano in sin_uso:
+            self.stdout.write(f'  {tabla:<32} {indice:<56} {tamano_legible(tamano):>10}')
+
+    def _redundantes(self, columnas):
+        """Índices cubiertos por otro cuyo prefijo de columnas coincide"""
+        redundantes = indices_redundantes(columnas)
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Índices redundantes ({len(redundantes)})'))
+        for tabla, indice, otro in redundantes:
+            self.stdout.write(f'  {tabla:<32} {indice} (cubierto por {otro})')
+
+    def _con_pg_stat_statements(self, cursor):
+        """¿Está instalada la extensión pg_stat_statements en la base de datos?"""
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
+        return cursor.fetchone() is not None
+
+    def _sentencias(self, cursor, limite):
+        """Sentencias con más tiempo total de ejecución, si está instalada la extensión pg_stat_statements"""
+        if not self._con_pg_stat_statements(cursor):
+            self.stdout.write(self.style.WARNING('pg_stat_statements no está instalada: no se muestran las sentencias más costosas'))
+            return
+        cursor.execute(CONSULTA_SENTENCIAS, [limite])
+        self.stdout.write(self.style.MIGRATE_HEADING('Sentencias más costosas'))
+        for llamadas, total, media, filas, sentencia in cursor.fetchall():
+            sentencia = ' '.join(sentencia.split())[:150]
+            self.stdout.write(f'  {total:10.0f} ms {llamadas:8} llamadas {media:8.2f} ms/llamada {filas:8} filas  {sentencia}')
+
+    def _reiniciar(self, cursor, tablas):
+        """Pone a cero las estadísticas de las tablas auditadas, de sus índices y de las sentencias de esta base de datos"""
+        cursor.execute(CONSULTA_REINICIAR_TABLAS, [tablas, tablas])
+        mensaje = f'Estadísticas reiniciadas de {len(cursor.fetchall())} tablas e índices'
+        if self._con_pg_stat_statements(cursor):
+            cursor.execute(CONSULTA_REINICIAR_SENTENCIAS)
+            mensaje += ' y de pg_stat_statements'
+        self.stdout.write(self.style.SUCCESS(mensaje))
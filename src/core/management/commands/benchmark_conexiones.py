@@ -0,0 +1,54 @@
+"""Comando para medir el coste de conexión a PostgreSQL por petición con y sin pool"""
+
+import statistics
+import time
+from copy import deepcopy
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+def simular_peticiones(conexion, iteraciones):
+    """Tiempos (ms) de un ciclo de petición: obtener conexión, consulta trivial y cierre de fin de petición"""
+    tiempos = []
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        with conexion.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        # Lo mismo que hace Django con la señal request_finished
+        conexion.close_if_unusable_or_obsolete()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    conexion.close()
+    return tiempos
+
+def configuraciones(ajustes):
+    """Variantes de la conexión por defecto a comparar: (nombre, ajustes)"""
+    base = deepcopy(ajustes)
+    base['OPTIONS'] = {clave: valor for clave, valor in base.get('OPTIONS', {}).items() if clave != 'pool'}
+    pool = ajustes.get('OPTIONS', {}).get('pool') or True
+    return [
+        ('sin persistencia', {**base, 'CONN_MAX_AGE': 0}),
+        ('persistentes', {**base, 'CONN_MAX_AGE': 60}),
+        ('pool', {**base, 'CONN_MAX_AGE': 0, 'OPTIONS': {**base['OPTIONS'], 'pool': pool}}),
+    ]
+
+
+class Command(BaseCommand):
+    """Compara la latencia por petición sin persistencia, con conexiones persistentes y con el pool de psycopg"""
+    help = 'Mide la latencia de conexión por petición con cada configuración de conexiones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteraciones', type=int, default=200, help='Peticiones simuladas por configuración')
+
+    def handle(self, *args, **options):
+        defecto = connections['default']
+        if defecto.vendor != 'postgresql':
+            raise CommandError('El benchmark de conexiones necesita PostgreSQL')
+        for nombre, ajustes in configuraciones(defecto.settings_dict):
+            conexion = type(defecto)(ajustes, alias=f'benchmark_{nombre.replace(" ", "_")}')
+            try:
+                tiempos = simular_peticiones(conexion, options['iteraciones'])
+            finally:
+                if conexion.pool:
+                    conexion.close_pool()
+            percentiles = statistics.quantiles(tiempos, n=100)
+            self.stdout.write(f'{nombre:<18} p50 {percentiles[49]:7.2f} ms   p95 {percentiles[94]:7.2f} ms   media {statistics.mean(tiempos):7.2f} ms')
@@ -0,0 +1,27 @@
+"""Comando para sumar a los rankings los partidos confirmados que quedaron sin contabilizar"""
+
+from django.core.management.base import BaseCommand
+from core.resultados import PARTIDOS, actualizar_rankings, pendientes_de_contabilizar
+
+
+class Command(BaseCommand):
+    """Suma a los rankings los partidos jugados cuyas confirmaciones siguen sin contabilizar"""
+    help = 'Suma a los rankings los partidos confirmados que no se contabilizaron (fallo del trabajo o falta de configuración de puntos); a programar periódicamente'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simular', action='store_true', help='Sólo lista los partidos pendientes, sin sumarlos')
+
+    def handle(self, *args, **options):
+        sumados = fallidos = 0
+        for tipo in PARTIDOS:
+            for clave in pendientes_de_contabilizar(tipo):
+                if options['simular']:
+                    self.stdout.write(f'Pendiente: partido {tipo} {clave}')
+                    continue
+                try:
+                    sumados += actualizar_rankings(tipo, clave)
+                except Exception as error:
+                    fallidos += 1
+                    self.stderr.write(f'Partido {tipo} {clave}: {error}')
+        if not options['simular']:
+            self.stdout.write(self.style.SUCCESS(f'{sumados} partidos sumados a los rankings, {fallidos} fallidos'))
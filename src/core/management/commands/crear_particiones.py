@@ -0,0 +1,46 @@
+"""Comando para crear por adelantado las particiones de envíos y reservas (y particionar las tablas que falten)"""
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from core.particionado import (INTERVALOS, TABLAS_PARTICIONABLES, crear_particiones, esta_particionada, horizonte, particionar_tabla,
+                               restricciones_debilitadas)
+
+
+class Command(BaseCommand):
+    """Mantiene creadas las particiones futuras; pensado para ejecutarse periódicamente (cron, tarea programada)"""
+    help = 'Crea las particiones futuras de las tablas particionadas por fecha'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Alias de la base de datos')
+        parser.add_argument('--intervalo', choices=INTERVALOS, default=settings.PARTICIONADO_INTERVALO or None,
+                            help='Mes o año por partición (por defecto PICKLEFREE_PARTICIONADO)')
+        parser.add_argument('--futuras', type=int, default=settings.PARTICIONES_FUTURAS, help='Periodos a crear por delante del actual')
+        parser.add_argument('--convertir', action='store_true', help='Particionar también las tablas que aún no lo están (bloquea cada tabla mientras copia sus datos)')
+
+    def handle(self, *args, **options):
+        conexion = connections[options['database']]
+        if conexion.vendor != 'postgresql':
+            raise CommandError('El particionado necesita PostgreSQL')
+        intervalo = options['intervalo']
+        if not intervalo:
+            raise CommandError('Indica --intervalo o configura PICKLEFREE_PARTICIONADO')
+        hasta = horizonte(intervalo, options['futuras'])
+        tablas = {modelo._meta.db_table for modelo in apps.get_app_config('core').get_models()}
+        for tabla in TABLAS_PARTICIONABLES:
+            if tabla not in tablas:
+                continue
+            with transaction.atomic(using=options['database']), conexion.cursor() as cursor:
+                if esta_particionada(cursor, tabla):
+                    creadas = crear_particiones(cursor, tabla, intervalo, hasta=hasta)
+                    self.stdout.write(f'{tabla}: {len(creadas)} particiones nuevas' + (f' ({", ".join(creadas)})' if creadas else ''))
+                    continue
+                debilitadas = restricciones_debilitadas(cursor, tabla)
+                if debilitadas:
+                    self.stdout.write(self.style.WARNING(f'{tabla}: no se particiona, dejarían de ser únicas en toda la tabla {", ".join(debilitadas)}'))
+                elif options['convertir']:
+                    particionar_tabla(cursor, tabla, intervalo, options['futuras'])
+                    self.stdout.write(self.style.SUCCESS(f'{tabla}: particionada por {intervalo}'))
+                else:
+                    self.stdout.write(self.style.WARNING(f'{tabla}: no está particionada (usa --convertir)'))
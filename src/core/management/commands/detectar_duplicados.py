@@ -0,0 +1,26 @@
+"""Comando para listar las personas probablemente duplicadas"""
+
+import time
+from django.core.management.base import BaseCommand
+from core.duplicados import MAXIMO_BLOQUE, UMBRAL_DUPLICADO, detectar_duplicados
+from core.models import Persona
+
+
+class Command(BaseCommand):
+    """Recorre todas las personas, las agrupa por bloques y lista las parejas que superan el umbral de parecido"""
+    help = 'Lista las parejas de personas probablemente duplicadas, con su puntuación y los indicios, para fusionarlas con fusionar_personas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--umbral', type=float, default=UMBRAL_DUPLICADO, help='Puntuación mínima (0 a 1) para listar una pareja')
+        parser.add_argument('--maximo-bloque', type=int, default=MAXIMO_BLOQUE, help='Los bloques con más personas no se comparan')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        candidatos, descartados = detectar_duplicados(umbral=options['umbral'], maximo_bloque=options['maximo_bloque'])
+        personas = Persona.objects.in_bulk({id_persona for candidato in candidatos for id_persona in (candidato.id_a, candidato.id_b)})
+        for candidato in candidatos:
+            self.stdout.write(f'{candidato.puntuacion:.3f}\t{candidato.id_a}\t{candidato.id_b}\t'
+                              f'{personas[candidato.id_a]} = {personas[candidato.id_b]}\t{", ".join(candidato.motivos)}')
+        if descartados:
+            self.stdout.write(self.style.WARNING(f'{descartados} bloques descartados por tener más de {options["maximo_bloque"]} personas'))
+        self.stdout.write(self.style.SUCCESS(f'{len(candidatos)} parejas probablemente duplicadas en {time.perf_counter() - inicio:.1f} s'))
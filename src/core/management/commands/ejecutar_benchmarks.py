@@ -0,0 +1,47 @@
+"""Comando para ejecutar la suite de benchmarks y guardar sus resultados"""
+
+from datetime import datetime, timezone as tz
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmarks import (BENCHMARKS, RUTA_RESULTADOS, UMBRAL_REGRESION, commit_actual, guardar_resultados, leer_resultados, medir,
+                             resultado_de_referencia, volumen_datos)
+
+
+class Command(BaseCommand):
+    """Mide cada escenario, lo compara con la ejecución anterior de otro commit y guarda los resultados"""
+    help = 'Ejecuta los benchmarks (generar antes los datos con generar_datos_sinteticos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('nombres', nargs='*', help=f'Escenarios a ejecutar (por defecto todos: {", ".join(BENCHMARKS)})')
+        parser.add_argument('--rondas', type=int, default=5, help='Rondas medidas de cada escenario')
+        parser.add_argument('--resultados', type=Path, default=RUTA_RESULTADOS, help='Fichero JSONL con el histórico de resultados')
+        parser.add_argument('--umbral', type=float, default=UMBRAL_REGRESION, help='Cociente de medianas a partir del que hay regresión')
+        parser.add_argument('--no-guardar', action='store_true', help='No añadir esta ejecución al histórico')
+
+    def handle(self, *args, **options):
+        desconocidos = set(options['nombres']) - set(BENCHMARKS)
+        if desconocidos:
+            raise CommandError(f'Escenarios desconocidos: {", ".join(sorted(desconocidos))}')
+        ejecucion = {'fecha': datetime.now(tz.utc).isoformat(timespec='seconds'), 'commit': commit_actual(), 'volumen': volumen_datos(), 'resultados': {}}
+        anteriores = leer_resultados(options['resultados'])
+        regresiones = 0
+        for nombre in options['nombres'] or BENCHMARKS:
+            operacion = BENCHMARKS[nombre]()
+            if operacion is None:
+                self.stdout.write(self.style.WARNING(f'{nombre:<32} omitido (faltan datos o un superusuario)'))
+                continue
+            resultado = ejecucion['resultados'][nombre] = medir(operacion, options['rondas'])
+            linea = f'{nombre:<32} mediana {resultado["mediana"]:10.2f} ms   min {resultado["min"]:10.2f} ms'
+            referencia = resultado_de_referencia(ejecucion, anteriores, nombre)
+            if referencia:
+                commit, anterior = referencia
+                cociente = resultado['mediana'] / anterior['mediana'] if anterior['mediana'] else 1
+                linea += f'   x{cociente:.2f} respecto a {commit}'
+                if cociente > options['umbral']:
+                    regresiones += 1
+                    linea = self.style.ERROR(linea + '  REGRESIÓN')
+            self.stdout.write(linea)
+        if not options['no_guardar']:
+            guardar_resultados(ejecucion, options['resultados'])
+        if regresiones:
+            raise CommandError(f'{regresiones} escenarios empeoran más de un {options["umbral"] - 1:.0%}')
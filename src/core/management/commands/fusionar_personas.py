@@ -0,0 +1,33 @@
+"""Comando para fusionar personas duplicadas en una sola"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core.duplicados import fusionar_personas, roles_repetidos
+
+
+class Command(BaseCommand):
+    """Pasa jugadores, técnicos, directivos, operarios, etc. de las personas duplicadas a la conservada y borra las duplicadas"""
+    help = 'Fusiona personas duplicadas: todo lo que apunta a ellas pasa a la persona conservada, en una sola transacción'
+
+    def add_arguments(self, parser):
+        parser.add_argument('conservada', type=int, help='Id de la persona que se conserva')
+        parser.add_argument('duplicadas', type=int, nargs='+', help='Ids de las personas duplicadas, que se borran')
+        parser.add_argument('--simular', action='store_true', help='Hacer la fusión y deshacerla, sólo para ver qué se movería')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            try:
+                movidas = fusionar_personas(options['conservada'], options['duplicadas'])
+            except ValueError as error:
+                raise CommandError(error) from None
+            repetidos = roles_repetidos(options['conservada'])
+            if options['simular']:
+                transaction.set_rollback(True)
+        for modelo, filas in movidas.items():
+            self.stdout.write(f'{modelo}: {filas}')
+        # No se fusionan solas: cada fila puede tener sus propias licencias, contratos, partidos...; hay que revisarlas a mano
+        for modelo, claves in repetidos.items():
+            self.stdout.write(self.style.WARNING(f'{modelo}: la persona {options["conservada"]} queda con {len(claves)} filas '
+                                                 f'({", ".join(map(str, claves))}), revíselas'))
+        accion = 'se fusionarían' if options['simular'] else 'fusionadas'
+        self.stdout.write(self.style.SUCCESS(f'{len(set(options["duplicadas"]) - {options["conservada"]})} personas {accion} en la {options["conservada"]}'))
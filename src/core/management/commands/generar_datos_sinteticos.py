@@ -0,0 +1,23 @@
+"""Comando para poblar la base de datos con datos sintéticos a escala de federación"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.datos_sinteticos import GeneradorDatos, volumenes
+
+
+class Command(BaseCommand):
+    """Genera clubes, instalaciones, pistas, personas, jugadores, partidos, reservas y mensajes sintéticos"""
+    help = 'Genera datos sintéticos (escala 1 = 100k personas, 1M partidos, 2M reservas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', type=float, default=1.0, help='Fracción de los volúmenes de una federación completa')
+        parser.add_argument('--semilla', type=int, default=2025, help='Semilla aleatoria (mismos datos con la misma semilla)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Volúmenes: {volumenes(options["escala"])}')
+        inicio = time.perf_counter()
+        try:
+            GeneradorDatos(options['escala'], options['semilla'], informar=self.stdout.write).generar()
+        except ValueError as error:
+            raise CommandError(error) from error
+        self.stdout.write(self.style.SUCCESS(f'Datos generados en {time.perf_counter() - inicio:.1f} s'))
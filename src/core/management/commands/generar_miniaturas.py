@@ -0,0 +1,27 @@
+"""Comando para generar las miniaturas de todas las fotos ya subidas"""
+
+from concurrent.futures import as_completed
+from django.core.management.base import BaseCommand
+from core.miniaturas import anotar_resultado, generar_miniaturas, modelos_con_foto
+from core.trabajos import obtener_pool
+
+
+class Command(BaseCommand):
+    """Genera en paralelo (con el pool compartido) las miniaturas que falten de las fotos de todos los modelos"""
+    help = 'Genera las miniaturas de todas las fotos de clubes, personas, pistas, etc.'
+
+    def handle(self, *args, **options):
+        nombres = set()
+        for modelo in modelos_con_foto():
+            nombres.update(modelo.objects.exclude(foto='').exclude(foto__isnull=True).values_list('foto', flat=True))
+        pool = obtener_pool()
+        futuros = {pool.submit(generar_miniaturas, nombre): nombre for nombre in sorted(nombres)}
+        fallidas = 0
+        for futuro in as_completed(futuros):
+            resumen = anotar_resultado(futuro, futuros[futuro])
+            if resumen is None:
+                fallidas += 1
+                self.stderr.write(f'{futuros[futuro]}: {futuro.exception()}')
+            else:
+                self.stdout.write(f'{futuros[futuro]} -> {resumen[:12]}')
+        self.stdout.write(self.style.SUCCESS(f'{len(nombres) - fallidas} fotos procesadas, {fallidas} fallidas'))
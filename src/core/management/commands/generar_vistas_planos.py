@@ -0,0 +1,28 @@
+"""Comando para generar las vistas previas de todos los planos ya subidos"""
+
+from concurrent.futures import as_completed
+from django.core.management.base import BaseCommand
+from core.models import Instalacion
+from core.planos import anotar_resultado, generar_vista_plano, tiene_rasterizador
+from core.trabajos import obtener_pool
+
+
+class Command(BaseCommand):
+    """Genera en paralelo (con el pool compartido) las vistas previas y teselas que falten de los planos de instalaciones"""
+    help = 'Genera las vistas previas de los planos de todas las instalaciones'
+
+    def handle(self, *args, **options):
+        nombres = set(Instalacion.objects.exclude(plano='').exclude(plano__isnull=True).values_list('plano', flat=True))
+        for nombre in sorted(nombre for nombre in nombres if not tiene_rasterizador(nombre)):
+            self.stdout.write(self.style.WARNING(f'{nombre}: formato sin vista previa'))
+        pool = obtener_pool()
+        futuros = {pool.submit(generar_vista_plano, nombre): nombre for nombre in sorted(nombres) if tiene_rasterizador(nombre)}
+        for futuro in as_completed(futuros):
+            resumen = anotar_resultado(futuro, futuros[futuro])
+            if resumen:
+                self.stdout.write(f'{futuros[futuro]} -> {resumen[:12]}')
+            elif futuro.exception() is not None:
+                self.stderr.write(f'{futuros[futuro]}: {futuro.exception()}')
+            else:
+                self.stdout.write(self.style.WARNING(f'{futuros[futuro]}: sin las dependencias opcionales de su formato'))
+        self.stdout.write(self.style.SUCCESS(f'{len(nombres)} planos procesados'))
@@ -0,0 +1,84 @@
+"""Comando para preparar la base de datos de una vez: esquema, fixtures, superusuario y plantillas"""
+
+import os
+import time
+from pathlib import Path
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from core.carga_masiva import cargar_fixtures
+from core.models import Enfrentamiento, Pareja, PartidoDobles, PartidoIndividual
+
+
+CARPETA_FIXTURES = Path(__file__).resolve().parents[2] / 'fixtures'
+
+
+def _sentencias_sin_bd(conexion, sentencias):
+    """Ejecuta sentencias que no pueden ir contra la base de datos en uso (CREATE/DROP DATABASE)"""
+    conexion.close()
+    if conexion.pool:
+        conexion.close_pool()  # el pool mantiene conexiones abiertas que impedirían copiar o borrar la base de datos
+    with conexion._nodb_cursor() as cursor:  # pylint: disable=protected-access
+        for sentencia in sentencias:
+            cursor.execute(sentencia)
+
+def guardar_plantilla(conexion, plantilla):
+    """Copia la base de datos actual (ya preparada) en una base de datos plantilla"""
+    nombre = conexion.ops.quote_name
+    _sentencias_sin_bd(conexion, [f'DROP DATABASE IF EXISTS {nombre(plantilla)}',
+                                  f'CREATE DATABASE {nombre(plantilla)} TEMPLATE {nombre(conexion.settings_dict["NAME"])}'])
+
+def restaurar_plantilla(conexion, plantilla):
+    """Sustituye la base de datos actual por una copia de la plantilla (cerrando las conexiones que tenga abiertas)"""
+    nombre = conexion.ops.quote_name
+    _sentencias_sin_bd(conexion, [f'DROP DATABASE IF EXISTS {nombre(conexion.settings_dict["NAME"])} WITH (FORCE)',
+                                  f'CREATE DATABASE {nombre(conexion.settings_dict["NAME"])} TEMPLATE {nombre(plantilla)}'])
+
+
+class Command(BaseCommand):
+    """Aplica las migraciones, carga todos los fixtures de core en una transacción y crea el superusuario"""
+    help = 'Prepara la base de datos: migraciones, fixtures de core (con COPY), secuencias, superusuario y plantillas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Alias de la base de datos')
+        parser.add_argument('--sin-migrar', action='store_true', help='No aplicar las migraciones')
+        parser.add_argument('--superusuario', help='Nombre del superusuario a crear si no existe (contraseña en DJANGO_SUPERUSER_PASSWORD)')
+        parser.add_argument('--email', default='admin@example.com', help='Correo del superusuario')
+        parser.add_argument('--guardar-plantilla', metavar='NOMBRE', help='Al terminar, copiar la base de datos a esta plantilla')
+        parser.add_argument('--restaurar-plantilla', metavar='NOMBRE', help='Sólo recrear la base de datos a partir de esta plantilla')
+
+    def handle(self, *args, **options):
+        conexion = connections[options['database']]
+        plantillas = options['guardar_plantilla'] or options['restaurar_plantilla']
+        if plantillas and conexion.vendor != 'postgresql':
+            raise CommandError('Las plantillas de base de datos sólo están disponibles en PostgreSQL')
+        inicio = time.perf_counter()
+        if options['restaurar_plantilla']:
+            restaurar_plantilla(conexion, options['restaurar_plantilla'])
+            self.stdout.write(self.style.SUCCESS(f'Base de datos restaurada desde {options["restaurar_plantilla"]} en {time.perf_counter() - inicio:.1f} s'))
+            return
+        if not options['sin_migrar']:
+            call_command('migrate', database=options['database'], interactive=False, verbosity=max(0, options['verbosity'] - 1))
+        fixtures = sorted(CARPETA_FIXTURES.glob('*.json'))
+        cargados = cargar_fixtures(fixtures, using=options['database'])
+        self.stdout.write(f'{len(fixtures)} fixtures cargados ({sum(cargados.values())} objetos)')
+        # COPY no dispara las señales que mantienen los enfrentamientos: si se han cargado partidos o parejas se regeneran
+        if cargados.keys() & {PartidoIndividual, PartidoDobles, Pareja}:
+            total = Enfrentamiento.objects.db_manager(options['database']).reconstruir()
+            self.stdout.write(f'{total} enfrentamientos regenerados')
+        if options['superusuario']:
+            self._crear_superusuario(options)
+        if options['guardar_plantilla']:
+            guardar_plantilla(conexion, options['guardar_plantilla'])
+            self.stdout.write(f'Plantilla {options["guardar_plantilla"]} guardada')
+        self.stdout.write(self.style.SUCCESS(f'Base de datos preparada en {time.perf_counter() - inicio:.1f} s'))
+
+    def _crear_superusuario(self, options):
+        usuarios = get_user_model().objects.db_manager(options['database'])
+        if usuarios.filter(username=options['superusuario']).exists():
+            return
+        if not os.environ.get('DJANGO_SUPERUSER_PASSWORD'):
+            raise CommandError('Define DJANGO_SUPERUSER_PASSWORD para crear el superusuario sin preguntar')
+        usuarios.create_superuser(options['superusuario'], options['email'], os.environ['DJANGO_SUPERUSER_PASSWORD'])
+        self.stdout.write(f'Superusuario {options["superusuario"]} creado')
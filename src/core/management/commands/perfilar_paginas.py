@@ -0,0 +1,56 @@
+"""Comando para medir las consultas SQL de las páginas de administración y de encuestas"""
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from djf_surveys.models import Survey
+from core.instrumentacion import RegistroConsultas, host_permitido
+
+
+def paginas_a_perfilar():
+    """URLs de los listados y altas del admin y de los resúmenes y descargas de encuestas"""
+    urls = [reverse('admin:index')]
+    for modelo in admin.site._registry:  # pylint: disable=protected-access
+        info = (modelo._meta.app_label, modelo._meta.model_name)
+        urls += [reverse('admin:%s_%s_changelist' % info), reverse('admin:%s_%s_add' % info)]
+    for slug in Survey.objects.values_list('slug', flat=True):
+        urls += [reverse('djf_surveys:admin_summary_survey', args=[slug]), reverse('djf_surveys:admin_download_survey', args=[slug])]
+    return urls
+
+
+class Command(BaseCommand):
+    """Pide cada página como superusuario y muestra sus consultas, tiempo en BD, duplicadas y la más lenta"""
+    help = 'Perfila las consultas SQL de las páginas de administración y de encuestas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', help='URLs concretas (por defecto, todas las del admin y encuestas)')
+        parser.add_argument('--usuario', help='Usuario con el que pedir las páginas (por defecto, el primer superusuario)')
+        parser.add_argument('--minimo', type=int, default=0, help='Mostrar sólo páginas con al menos estas consultas')
+
+    def handle(self, *args, **options):
+        usuarios = get_user_model().objects.filter(is_active=True)
+        usuario = usuarios.filter(username=options['usuario']).first() if options['usuario'] else usuarios.filter(is_superuser=True).first()
+        if usuario is None:
+            raise CommandError('No hay usuario con el que pedir las páginas')
+        cliente = Client(SERVER_NAME=host_permitido())
+        cliente.force_login(usuario)
+        filas = []
+        for url in options['urls'] or paginas_a_perfilar():
+            registro = RegistroConsultas()
+            with registro.activar():
+                respuesta = cliente.get(url)
+                if respuesta.streaming:
+                    b''.join(respuesta.streaming_content)
+            filas.append((url, respuesta.status_code, registro.resumen()))
+        filas.sort(key=lambda fila: fila[2]['consultas'], reverse=True)
+        for url, estado, resumen in filas:
+            if resumen['consultas'] < options['minimo']:
+                continue
+            duplicadas = sum(veces - 1 for veces in resumen['duplicadas'].values())
+            estilo = self.style.WARNING if duplicadas else (lambda texto: texto)
+            self.stdout.write(estilo(f'{resumen["consultas"]:5d} consultas {resumen["tiempo_bd_ms"]:9.2f} ms {duplicadas:4d} duplicadas  [{estado}] {url}'))
+            if duplicadas and options['verbosity'] > 1:
+                for sql, veces in list(resumen['duplicadas'].items())[:3]:
+                    self.stdout.write(f'        x{veces} {sql[:160]}')
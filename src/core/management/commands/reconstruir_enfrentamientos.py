@@ -0,0 +1,13 @@
+"""Comando para regenerar por completo la tabla desnormalizada de enfrentamientos"""
+
+from django.core.management.base import BaseCommand
+from core.models import Enfrentamiento
+
+
+class Command(BaseCommand):
+    """Regenera los enfrentamientos de todos los partidos individuales y de dobles"""
+    help = 'Regenera la tabla de enfrentamientos a partir de los partidos existentes (p. ej. tras cargas masivas o update())'
+
+    def handle(self, *args, **options):
+        total = Enfrentamiento.objects.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'{total} enfrentamientos regenerados'))
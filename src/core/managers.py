@@ -0,0 +1,137 @@
+"""Managers y querysets personalizados de los modelos de core"""
+
+from django.db import IntegrityError, models, transaction
+
+
+TAMANO_LOTE_PAREJAS = 1000
+
+
+def _clave_pareja(jugador_a, jugador_b):
+    """Clave canónica (menor, mayor) de una pareja, independiente del orden de sus jugadores"""
+    ids = (getattr(jugador_a, 'pk', jugador_a), getattr(jugador_b, 'pk', jugador_b))
+    return min(ids), max(ids)
+
+
+class EnfrentamientoQuerySet(models.QuerySet):
+    """Consultas habituales sobre la tabla desnormalizada de enfrentamientos"""
+
+    def historial(self, jugador):
+        """Partidos (individuales y de dobles) de un jugador, del más reciente al más antiguo"""
+        return self.filter(id_jugador=jugador, principal=True).order_by('-fecha_hora')
+
+    def cara_a_cara(self, jugador, rival):
+        """Enfrentamientos directos de un jugador contra otro, en individual o en dobles"""
+        return self.filter(id_jugador=jugador, id_rival=rival).order_by('-fecha_hora')
+
+    def cara_a_cara_parejas(self, pareja, pareja_rival):
+        """Enfrentamientos de una pareja contra otra (una fila por partido)"""
+        return self.filter(id_pareja=pareja, id_pareja_rival=pareja_rival, principal=True, representante=True).order_by('-fecha_hora')
+
+
+class EnfrentamientoManager(models.Manager.from_queryset(EnfrentamientoQuerySet)):
+    """Mantiene las filas de enfrentamiento sincronizadas con los partidos"""
+    # Las señales post_save sólo cubren save(): tras cargar partidos o parejas con COPY (core/carga_masiva.py)
+    # o cambiarlos con QuerySet.update(), quien lo haga debe llamar a reconstruir() con los partidos afectados
+
+    def sincronizar_partido_individual(self, partido):
+        """Regenera las dos filas (una por jugador) de un partido individual"""
+        local, visitante = partido.id_jugador_local_id, partido.id_jugador_visitante_id
+        filas = [
+            self.model(id_partido_individual=partido, id_jugador_id=jugador, id_rival_id=rival,
+                       fecha_hora=partido.fecha_hora, local=es_local, ganador=partido.id_ganador_id == jugador,
+                       principal=True, representante=True)
+            for jugador, rival, es_local in ((local, visitante, True), (visitante, local, False))
+        ]
+        with transaction.atomic(using=self.db):
+            self.filter(id_partido_individual=partido).delete()
+            self.bulk_create(filas)
+
+    def sincronizar_partido_dobles(self, partido):
+        """Regenera las ocho filas (cada jugador contra cada rival) de un partido de dobles"""
+        pareja_local, pareja_visitante = partido.id_pareja_local, partido.id_pareja_visitante
+        filas = []
+        for pareja, pareja_rival, es_local in ((pareja_local, pareja_visitante, True), (pareja_visitante, pareja_local, False)):
+            jugadores = (pareja.id_jugador_izquierdo_id, pareja.id_jugador_derecho_id)
+            rivales = (pareja_rival.id_jugador_izquierdo_id, pareja_rival.id_jugador_derecho_id)
+            for jugador in jugadores:
+                for rival in rivales:
+                    filas.append(self.model(
+                        id_partido_dobles=partido, id_jugador_id=jugador, id_rival_id=rival,
+                        id_pareja=pareja, id_pareja_rival=pareja_rival,
+                        fecha_hora=partido.fecha_hora, local=es_local, ganador=partido.id_ganador_id == pareja.pk,
+                        # Una fila por jugador para su historial, y una por pareja para el cara a cara de parejas
+                        principal=rival == rivales[0], representante=jugador == jugadores[0]))
+        with transaction.atomic(using=self.db):
+            self.filter(id_partido_dobles=partido).delete()
+            self.bulk_create(filas)
+
+    def reconstruir(self, partidos_individuales=None, partidos_dobles=None):
+        """Regenera los enfrentamientos de unos partidos (querysets) o, sin indicarlos, la tabla entera; devuelve cuántas filas quedan"""
+        partido_individual = self.model._meta.get_field('id_partido_individual').related_model
+        partido_dobles = self.model._meta.get_field('id_partido_dobles').related_model
+        todos = partidos_individuales is None and partidos_dobles is None
+        with transaction.atomic(using=self.db):
+            if todos:
+                self.all().delete()
+            if todos or partidos_individuales is not None:
+                individuales = partido_individual.objects.using(self.db).all() if todos else partidos_individuales
+                for partido in individuales.iterator(chunk_size=2000):
+                    self.sincronizar_partido_individual(partido)
+            if todos or partidos_dobles is not None:
+                dobles = partido_dobles.objects.using(self.db).all() if todos else partidos_dobles
+                for partido in dobles.select_related('id_pareja_local', 'id_pareja_visitante').iterator(chunk_size=2000):
+                    self.sincronizar_partido_dobles(partido)
+        return self.count()
+
+
+class ParejaManager(models.Manager):
+    """Búsqueda y alta de parejas por su par de jugadores, sin importar el orden"""
+
+    def buscar(self, jugador_a, jugador_b):
+        """Pareja formada por dos jugadores (en cualquier orden) o None, con una única búsqueda indexada"""
+        menor, mayor = _clave_pareja(jugador_a, jugador_b)
+        return self.filter(id_jugador_menor=menor, id_jugador_mayor=mayor).first()
+
+    def obtener_o_crear(self, jugador_a, jugador_b, **valores):
+        """Devuelve (pareja, creada) para dos jugadores; si no existe la crea con jugador_a a la izquierda"""
+        menor, mayor = _clave_pareja(jugador_a, jugador_b)
+        pareja = self.buscar(menor, mayor)
+        if pareja:
+            return pareja, False
+        valores.setdefault('nombre', f'Pareja {menor}-{mayor}')
+        try:
+            with transaction.atomic(using=self.db):
+                return self.create(id_jugador_izquierdo_id=getattr(jugador_a, 'pk', jugador_a), id_jugador_derecho_id=getattr(jugador_b, 'pk', jugador_b), **valores), True
+        except IntegrityError:
+            # Otra petición la ha creado a la vez: la restricción única nos garantiza que ya existe
+            return self.buscar(menor, mayor), False
+
+    def buscar_en_bloque(self, pares):
+        """Diccionario {(menor, mayor): pareja} con las parejas existentes de una lista de pares de jugadores"""
+        claves = list({_clave_pareja(jugador_a, jugador_b) for jugador_a, jugador_b in pares})
+        encontradas = {}
+        for inicio in range(0, len(claves), TAMANO_LOTE_PAREJAS):
+            lote = claves[inicio:inicio + TAMANO_LOTE_PAREJAS]
+            # Un par (menor, mayor) exacto por clave: cada uno es una búsqueda en el índice único, sin combinaciones cruzadas
+            for pareja in self.filter(models.Q.create([models.Q(id_jugador_menor=menor, id_jugador_mayor=mayor) for menor, mayor in lote],
+                                                      connector=models.Q.OR)):
+                encontradas[_clave_pareja(pareja.id_jugador_izquierdo_id, pareja.id_jugador_derecho_id)] = pareja
+        return encontradas
+
+    def obtener_o_crear_en_bloque(self, pares, **valores):
+        """Diccionario {(menor, mayor): pareja} creando con bulk_create las parejas que falten"""
+        pares = list(pares)
+        encontradas = self.buscar_en_bloque(pares)
+        nuevas, vistas = [], set(encontradas)
+        for jugador_a, jugador_b in pares:
+            clave = _clave_pareja(jugador_a, jugador_b)
+            if clave in vistas:
+                continue
+            vistas.add(clave)
+            campos = {'nombre': f'Pareja {clave[0]}-{clave[1]}', **valores}
+            nuevas.append(self.model(id_jugador_izquierdo_id=getattr(jugador_a, 'pk', jugador_a), id_jugador_derecho_id=getattr(jugador_b, 'pk', jugador_b), **campos))
+        if nuevas:
+            # Ignoramos conflictos por si otra importación crea alguna a la vez, y releemos las creadas para tener sus ids
+            self.bulk_create(nuevas, batch_size=TAMANO_LOTE_PAREJAS, ignore_conflicts=True)
+            encontradas.update(self.buscar_en_bloque([(pareja.id_jugador_izquierdo_id, pareja.id_jugador_derecho_id) for pareja in nuevas]))
+        return encontradas
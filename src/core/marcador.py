@@ -0,0 +1,209 @@
+"""Marcador en directo: los cambios de partidos se publican con NOTIFY y una única conexión LISTEN por proceso los reparte a las conexiones SSE"""
+
+import asyncio
+import json
+import logging
+import psycopg
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections
+from core.models import PartidoDobles, PartidoIndividual
+
+
+CANAL = 'picklefree_marcador'
+MODELOS_CON_MARCADOR = {'individual': PartidoIndividual, 'dobles': PartidoDobles}
+CAMPO_TORNEO = {'individual': 'id_torneo_individual_id', 'dobles': 'id_torneo_dobles_id'}
+ESPERA_MAXIMA_RECONEXION = 30
+ESPERA_MAXIMA_ESCUCHA = 10
+
+logger = logging.getLogger(__name__)
+
+
+def tipo_partido(partido):
+    """Tipo de partido en el marcador ('individual' o 'dobles')"""
+    return 'individual' if isinstance(partido, PartidoIndividual) else 'dobles'
+
+def datos_partido(partido):
+    """Estado público de un partido que se envía a los espectadores"""
+    tipo = tipo_partido(partido)
+    return {
+        'tipo': tipo,
+        'id': partido.pk,
+        'torneo': getattr(partido, CAMPO_TORNEO[tipo]),
+        'ronda': partido.ronda_o_jornada,
+        'estado': partido.id_estado_partido.nombre,
+        'resultado': partido.tods_resultado,
+        'fecha_hora': partido.fecha_hora,
+    }
+
+def notificar_partido(partido, using=DEFAULT_DB_ALIAS):
+    """Publica el estado de un partido en el canal del marcador (PostgreSQL lo entrega al confirmar la transacción)"""
+    conexion = connections[using]
+    if conexion.vendor != 'postgresql':
+        return
+    carga = json.dumps(datos_partido(partido), cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    with conexion.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CANAL, carga])
+
+def parametros_conexion(using=DEFAULT_DB_ALIAS):
+    """Parámetros de psycopg de la base de datos, sin los adaptadores síncronos que añade Django"""
+    parametros = connections[using].get_connection_params()
+    parametros.pop('cursor_factory', None)
+    parametros.pop('context', None)
+    return parametros
+
+def clave_suscripcion(parametros):
+    """Clave de suscripción según ?tipo= y ?torneo= o ?partido= (sin parámetros, todo el marcador); ValueError si no es válida"""
+    tipo = parametros.get('tipo')
+    ambitos = [ambito for ambito in ('torneo', 'partido') if parametros.get(ambito)]
+    if tipo is None and not ambitos:
+        return None
+    if tipo not in MODELOS_CON_MARCADOR or len(ambitos) != 1:
+        raise ValueError(f'Indique tipo ({" o ".join(MODELOS_CON_MARCADOR)}) y torneo o partido')
+    try:
+        return tipo, ambitos[0], int(parametros[ambitos[0]])
+    except ValueError:
+        raise ValueError(f'{ambitos[0]} debe ser un número entero') from None
+
+def claves_partido(datos):
+    """Claves de suscripción interesadas en un cambio: todo el marcador, su torneo y el propio partido"""
+    claves = [None, (datos['tipo'], 'partido', datos['id'])]
+    if datos['torneo'] is not None:
+        claves.append((datos['tipo'], 'torneo', datos['torneo']))
+    return claves
+
+
+class Suscripcion:
+    """Cola de eventos pendientes de enviar a una conexión SSE"""
+
+    def __init__(self, clave):
+        self.clave = clave
+        self.cola = asyncio.Queue(maxsize=settings.MARCADOR_COLA)
+
+    def entregar(self, carga):
+        """Encola un evento; si el cliente no da abasto se le desconecta para que se reconecte al día"""
+        try:
+            self.cola.put_nowait(carga)
+        except asyncio.QueueFull:
+            self.desconectar()
+
+    def desconectar(self):
+        """Descarta los eventos pendientes y cierra el flujo: el navegador se reconecta y recibe de nuevo el estado inicial"""
+        while not self.cola.empty():
+            self.cola.get_nowait()
+        self.cola.put_nowait(None)
+
+
+class Distribuidor:
+    """Una conexión LISTEN por proceso (y bucle de eventos) que reparte cada notificación sólo a las suscripciones interesadas"""
+
+    def __init__(self):
+        self.suscripciones = {}
+        self.tarea = None
+        self.escuchando = None
+
+    def suscribir(self, clave):
+        """Nueva suscripción a todo el marcador (clave None), a un torneo o a un partido; arranca la escucha si hace falta"""
+        suscripcion = Suscripcion(clave)
+        self.suscripciones.setdefault(clave, set()).add(suscripcion)
+        bucle = asyncio.get_running_loop()
+        if self.tarea is None or self.tarea.done() or self.tarea.get_loop() is not bucle:
+            self.escuchando = asyncio.Event()
+            self.tarea = bucle.create_task(self._escuchar())
+        return suscripcion
+
+    async def esperar_escucha(self):
+        """Espera a que el LISTEN esté activo; devuelve False si no lo está en ESPERA_MAXIMA_ESCUCHA segundos"""
+        try:
+            await asyncio.wait_for(self.escuchando.wait(), ESPERA_MAXIMA_ESCUCHA)
+        except TimeoutError:
+            return False
+        return True
+
+    def cancelar(self, suscripcion):
+        """Da de baja una suscripción; la escucha termina sola cuando no queda ninguna"""
+        suscripciones = self.suscripciones.get(suscripcion.clave, set())
+        suscripciones.discard(suscripcion)
+        if not suscripciones:
+            self.suscripciones.pop(suscripcion.clave, None)
+        if not self.suscripciones and self.tarea is not None:
+            self.tarea.cancel()
+            self.tarea = None
+
+    def repartir(self, carga):
+        """Entrega una notificación (JSON ya serializado, se reenvía tal cual) a sus suscripciones"""
+        try:
+            datos = json.loads(carga)
+        except ValueError:
+            logger.warning('Notificación del marcador no válida: %r', carga)
+            return
+        for clave in claves_partido(datos):
+            for suscripcion in list(self.suscripciones.get(clave, ())):
+                suscripcion.entregar(carga)
+
+    def desconectar_todas(self):
+        """Cierra los flujos de todas las suscripciones"""
+        for suscripciones in list(self.suscripciones.values()):
+            for suscripcion in list(suscripciones):
+                suscripcion.desconectar()
+
+    async def _escuchar(self):
+        """Escucha el canal del marcador, reconectando con espera creciente si se pierde la conexión"""
+        espera = 1
+        while self.suscripciones:
+            try:
+                async with await psycopg.AsyncConnection.connect(autocommit=True, **parametros_conexion()) as conexion:
+                    await conexion.execute(f'LISTEN {CANAL}')
+                    self.escuchando.set()
+                    espera = 1
+                    async for notificacion in conexion.notifies():
+                        self.repartir(notificacion.payload)
+            except Exception as error:
+                # Lo notificado mientras no se escucha se pierde: se desconecta a los suscriptores para que se reconecten
+                # y reciban otra vez el estado inicial. Cualquier error (no sólo de psycopg) terminaría la tarea en silencio
+                self.escuchando.clear()
+                self.desconectar_todas()
+                logger.warning('Escucha del marcador interrumpida (%s); reintento en %s s', error, espera,
+                               exc_info=not isinstance(error, psycopg.Error))
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, ESPERA_MAXIMA_RECONEXION)
+
+distribuidor = Distribuidor()
+
+
+def evento_sse(datos=None, carga=None, evento='partido'):
+    """Evento en formato text/event-stream"""
+    if carga is None:
+        carga = json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    return f'event: {evento}\ndata: {carga}\n\n'
+
+async def estado_inicial(clave):
+    """Eventos con el estado actual de los partidos de una suscripción a un torneo o a un partido"""
+    if clave is None:
+        return []
+    tipo, ambito, valor = clave
+    filtro = {CAMPO_TORNEO[tipo]: valor} if ambito == 'torneo' else {'pk': valor}
+    partidos = MODELOS_CON_MARCADOR[tipo].objects.filter(**filtro).select_related('id_estado_partido').order_by('fecha_hora')
+    return [evento_sse(datos_partido(partido)) async for partido in partidos]
+
+async def flujo_marcador(clave):
+    """Flujo SSE: estado inicial, cambios según llegan y un comentario de latido para mantener viva la conexión"""
+    suscripcion = distribuidor.suscribir(clave)
+    try:
+        yield f'retry: {settings.MARCADOR_REINTENTO * 1000}\n\n'
+        # El estado inicial se lee con el LISTEN ya activo: un cambio confirmado antes está en él y uno posterior llega notificado
+        if not await distribuidor.esperar_escucha():
+            return
+        for evento in await estado_inicial(clave):
+            yield evento
+        while True:
+            try:
+                carga = await asyncio.wait_for(suscripcion.cola.get(), settings.MARCADOR_LATIDO)
+            except TimeoutError:
+                yield ': latido\n\n'
+                continue
+            if carga is None:
+                return
+            yield evento_sse(carga=carga)
+    finally:
+        distribuidor.cancelar(suscripcion)
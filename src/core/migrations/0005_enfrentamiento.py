@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_alter_destinatarioclub_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Enfrentamiento',
+            fields=[
+                ('id_enfrentamiento', models.AutoField(primary_key=True, serialize=False)),
+                ('fecha_hora', models.DateTimeField(db_comment='Copia de la fecha y hora del partido')),
+                ('local', models.BooleanField(db_comment='¿Jugaba como local?')),
+                ('ganador', models.BooleanField(db_comment='¿Ganó el partido?')),
+                ('principal', models.BooleanField(db_comment='Única fila del jugador en el partido (para su historial)')),
+                ('representante', models.BooleanField(db_comment='Única fila de la pareja en el partido (para el cara a cara de parejas)')),
+                ('id_jugador', models.ForeignKey(db_column='id_jugador', db_index=False, on_delete=django.db.models.deletion.RESTRICT, related_name='enfrentamiento_id_jugador_set', to='core.jugador')),
+                ('id_pareja', models.ForeignKey(blank=True, db_column='id_pareja', db_comment='Sólo en partidos de dobles', db_index=False, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='enfrentamiento_id_pareja_set', to='core.pareja')),
+                ('id_pareja_rival', models.ForeignKey(blank=True, db_column='id_pareja_rival', db_comment='Sólo en partidos de dobles', db_index=False, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='enfrentamiento_id_pareja_rival_set', to='core.pareja')),
+                ('id_partido_dobles', models.ForeignKey(blank=True, db_column='id_partido_dobles', null=True, on_delete=django.db.models.deletion.CASCADE, to='core.partidodobles')),
+                ('id_partido_individual', models.ForeignKey(blank=True, db_column='id_partido_individual', null=True, on_delete=django.db.models.deletion.CASCADE, to='core.partidoindividual')),
+                ('id_rival', models.ForeignKey(db_column='id_rival', db_index=False, on_delete=django.db.models.deletion.RESTRICT, related_name='enfrentamiento_id_rival_set', to='core.jugador')),
+            ],
+            options={
+                'verbose_name': 'Enfrentamiento',
+                'verbose_name_plural': 'Enfrentamientos',
+                'db_table': 'enfrentamiento',
+                'indexes': [models.Index(condition=models.Q(('principal', True)), fields=['id_jugador', '-fecha_hora'], name='enfrentamiento_historial_idx'), models.Index(fields=['id_jugador', 'id_rival', '-fecha_hora'], name='enfrentamiento_cara_a_cara_idx'), models.Index(condition=models.Q(('principal', True), ('representante', True)), fields=['id_pareja', 'id_pareja_rival', '-fecha_hora'], name='enfrentamiento_parejas_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('id_partido_dobles__isnull', True), ('id_partido_individual__isnull', False)), models.Q(('id_partido_dobles__isnull', False), ('id_partido_individual__isnull', True)), _connector='OR'), name='enfrentamiento_un_solo_partido')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:57
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_enfrentamiento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pareja',
+            name='id_jugador_mayor',
+            field=models.GeneratedField(db_comment='Clave canónica: el mayor de los dos jugadores', db_persist=True, expression=django.db.models.functions.comparison.Greatest('id_jugador_izquierdo', 'id_jugador_derecho'), output_field=models.IntegerField()),
+        ),
+        migrations.AddField(
+            model_name='pareja',
+            name='id_jugador_menor',
+            field=models.GeneratedField(db_comment='Clave canónica: el menor de los dos jugadores', db_persist=True, expression=django.db.models.functions.comparison.Least('id_jugador_izquierdo', 'id_jugador_derecho'), output_field=models.IntegerField()),
+        ),
+        migrations.AddConstraint(
+            model_name='pareja',
+            constraint=models.UniqueConstraint(fields=('id_jugador_menor', 'id_jugador_mayor'), name='pareja_jugadores_unica'),
+        ),
+    ]
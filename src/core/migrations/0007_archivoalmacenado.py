@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-19 19:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_pareja_id_jugador_mayor_pareja_id_jugador_menor_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoAlmacenado',
+            fields=[
+                ('id_archivo_almacenado', models.AutoField(primary_key=True, serialize=False)),
+                ('nombre', models.CharField(db_comment='Ruta del blob dentro de MEDIA_ROOT', max_length=255, unique=True)),
+                ('referencias', models.IntegerField(default=0)),
+                ('fecha_alta', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Archivo almacenado',
+                'verbose_name_plural': 'Archivos almacenados',
+                'db_table': 'archivo_almacenado',
+            },
+        ),
+    ]
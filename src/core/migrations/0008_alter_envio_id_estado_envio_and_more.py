@@ -0,0 +1,110 @@
+# Generated by Django 5.2.1 on 2026-10-19 19:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_archivoalmacenado'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='envio',
+            name='id_estado_envio',
+            field=models.ForeignKey(db_column='id_estado_envio', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.estadoenvio'),
+        ),
+        migrations.AlterField(
+            model_name='partidodobles',
+            name='id_torneo_dobles',
+            field=models.ForeignKey(blank=True, db_column='id_torneo_dobles', db_comment='Si pertenece a un torneo', db_index=False, null=True, on_delete=django.db.models.deletion.RESTRICT, to='core.torneodobles'),
+        ),
+        migrations.AlterField(
+            model_name='partidoindividual',
+            name='id_torneo_individual',
+            field=models.ForeignKey(blank=True, db_column='id_torneo_individual', db_comment='Si pertenece a un torneo', db_index=False, null=True, on_delete=django.db.models.deletion.RESTRICT, to='core.torneoindividual'),
+        ),
+        migrations.AlterField(
+            model_name='persona',
+            name='id_tipo_identificacion',
+            field=models.ForeignKey(db_column='id_tipo_identificacion', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.tipoidentificacion'),
+        ),
+        migrations.AlterField(
+            model_name='pertenencia',
+            name='id_club',
+            field=models.ForeignKey(db_column='id_club', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.club'),
+        ),
+        migrations.AlterField(
+            model_name='rankingjugadorclub',
+            name='id_jugador',
+            field=models.ForeignKey(db_column='id_jugador', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.jugador'),
+        ),
+        migrations.AlterField(
+            model_name='rankingjugadortorneo',
+            name='id_jugador',
+            field=models.ForeignKey(db_column='id_jugador', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.jugador'),
+        ),
+        migrations.AlterField(
+            model_name='rankingparejaclub',
+            name='id_pareja',
+            field=models.ForeignKey(db_column='id_pareja', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.pareja'),
+        ),
+        migrations.AlterField(
+            model_name='rankingparejatorneo',
+            name='id_pareja',
+            field=models.ForeignKey(db_column='id_pareja', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.pareja'),
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='id_jugador',
+            field=models.ForeignKey(db_column='id_jugador', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.jugador'),
+        ),
+        migrations.AlterField(
+            model_name='reservaclub',
+            name='id_pista',
+            field=models.ForeignKey(db_column='id_pista', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.pista'),
+        ),
+        migrations.AlterField(
+            model_name='reservacurso',
+            name='id_pista',
+            field=models.ForeignKey(db_column='id_pista', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.pista'),
+        ),
+        migrations.AlterField(
+            model_name='reservajugador',
+            name='id_pista',
+            field=models.ForeignKey(db_column='id_pista', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.pista'),
+        ),
+        migrations.AlterField(
+            model_name='reservatorneodobles',
+            name='id_pista',
+            field=models.ForeignKey(db_column='id_pista', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.pista'),
+        ),
+        migrations.AlterField(
+            model_name='reservatorneoequipos',
+            name='id_pista',
+            field=models.ForeignKey(db_column='id_pista', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.pista'),
+        ),
+        migrations.AlterField(
+            model_name='reservatorneoindividual',
+            name='id_pista',
+            field=models.ForeignKey(db_column='id_pista', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.pista'),
+        ),
+        migrations.AddIndex(
+            model_name='envio',
+            index=models.Index(fields=['id_estado_envio', 'fecha_hora'], name='envio_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='partidodobles',
+            index=models.Index(condition=models.Q(('id_torneo_dobles__isnull', False)), fields=['id_torneo_dobles', 'ronda_o_jornada'], name='partido_dob_torneo_ronda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='partidoindividual',
+            index=models.Index(condition=models.Q(('id_torneo_individual__isnull', False)), fields=['id_torneo_individual', 'ronda_o_jornada'], name='partido_ind_torneo_ronda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pertenencia',
+            index=models.Index(fields=['id_club', 'activa'], name='pertenencia_club_activa_idx'),
+        ),
+    ]
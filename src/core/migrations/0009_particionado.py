@@ -0,0 +1,21 @@
+# Particionado opcional por fecha (PICKLEFREE_PARTICIONADO) de las tablas de envíos y reservas
+
+from django.db import migrations
+from core.particionado import ParticionarPorRango
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_alter_envio_id_estado_envio_and_more'),
+    ]
+
+    operations = [
+        ParticionarPorRango('Envio'),
+        ParticionarPorRango('ReservaClub'),
+        ParticionarPorRango('ReservaCurso'),
+        ParticionarPorRango('ReservaJugador'),
+        ParticionarPorRango('ReservaTorneoDobles'),
+        ParticionarPorRango('ReservaTorneoEquipos'),
+        ParticionarPorRango('ReservaTorneoIndividual'),
+    ]
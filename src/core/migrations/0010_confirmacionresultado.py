@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-19 19:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_particionado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfirmacionResultado',
+            fields=[
+                ('id_confirmacion_resultado', models.AutoField(primary_key=True, serialize=False)),
+                ('local', models.BooleanField(db_comment='¿Lo envía el lado local?')),
+                ('tods_resultado', models.CharField(max_length=50)),
+                ('fecha_hora', models.DateTimeField(default=django.utils.timezone.now)),
+                ('contabilizado', models.BooleanField(db_comment='Ya sumado a los rankings (nunca se suma dos veces)', default=False)),
+                ('id_partido_dobles', models.ForeignKey(blank=True, db_column='id_partido_dobles', db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.partidodobles')),
+                ('id_partido_individual', models.ForeignKey(blank=True, db_column='id_partido_individual', db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.partidoindividual')),
+                ('id_persona', models.ForeignKey(db_column='id_persona', db_comment='Quién lo envió', on_delete=django.db.models.deletion.RESTRICT, to='core.persona')),
+            ],
+            options={
+                'verbose_name': 'Confirmación de resultado',
+                'verbose_name_plural': 'Confirmaciones de resultados',
+                'db_table': 'confirmacion_resultado',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('id_partido_individual__isnull', False)), fields=('id_partido_individual', 'local'), name='confirmacion_individual_lado_uniq'), models.UniqueConstraint(condition=models.Q(('id_partido_dobles__isnull', False)), fields=('id_partido_dobles', 'local'), name='confirmacion_dobles_lado_uniq'), models.CheckConstraint(condition=models.Q(models.Q(('id_partido_dobles__isnull', True), ('id_partido_individual__isnull', False)), models.Q(('id_partido_dobles__isnull', False), ('id_partido_individual__isnull', True)), _connector='OR'), name='confirmacion_un_solo_partido')],
+            },
+        ),
+    ]
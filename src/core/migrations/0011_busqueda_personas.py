@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-19 19:46
+
+import core.models
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_confirmacionresultado'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        django.contrib.postgres.operations.UnaccentExtension(),
+        # unaccent() es STABLE (depende del diccionario); fijando el diccionario se puede declarar IMMUTABLE e indexar
+        migrations.RunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION sin_acentos(text) RETURNS text
+                LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+                AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+            """,
+            reverse_sql='DROP FUNCTION IF EXISTS sin_acentos(text)',
+        ),
+        migrations.AddIndex(
+            model_name='persona',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(core.models.SinAcentos(django.db.models.functions.text.Lower(django.db.models.functions.text.Concat('nombre', models.Value(' '), 'apellido_primero', models.Value(' '), django.db.models.functions.comparison.Coalesce('apellido_segundo', models.Value('')), output_field=models.TextField()))), name='gin_trgm_ops'), name='persona_nombre_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='persona',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('docidentidad_valor'), name='gin_trgm_ops'), name='persona_documento_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='persona',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('email'), name='gin_trgm_ops'), name='persona_email_trgm_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-19 20:01
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_busqueda_personas'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='club',
+            options={'permissions': [('ver_filas_sin_club', 'Puede ver en el admin las filas globales (sin club) de cualquier modelo')], 'verbose_name': 'Club deportivo', 'verbose_name_plural': 'Clubes deportivos'},
+        ),
+    ]
@@ -0,0 +1,119 @@
+"""Miniaturas de las fotos (ImageField): generación en segundo plano con Pillow y URLs por tamaño"""
+
+import hashlib
+import io
+import logging
+from concurrent.futures import BrokenExecutor
+from pathlib import PurePosixPath
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import ImageField
+from PIL import Image, ImageOps
+from core.almacenamiento import CARPETA_BLOBS
+from core.trabajos import obtener_pool
+
+
+TAMANOS_MINIATURA = {'pequena': 160, 'mediana': 480, 'grande': 1024}
+FORMATOS_MINIATURA = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+CALIDAD_MINIATURA = 80
+CARPETA_MINIATURAS = 'miniaturas'
+TAMANO_BLOQUE_LECTURA = 64 * 1024
+# Marca en la caché de las fotos cuyas miniaturas no se pudieron generar (corruptas o en un formato no admitido):
+# mientras dure no se vuelven a encargar en cada página que las muestra
+FALLIDA = 'fallida'
+SEGUNDOS_REINTENTO_FALLIDAS = 60 * 60
+
+logger = logging.getLogger(__name__)
+
+_pendientes = set()
+
+
+def clave_cache_miniaturas(nombre):
+    """Clave de caché que guarda el resumen SHA-256 de una foto cuyas miniaturas ya existen"""
+    return f'miniaturas:{nombre}'
+
+def nombre_miniatura(resumen, tamano, formato):
+    """Nombre de una miniatura a partir del resumen SHA-256 del contenido de la foto original"""
+    return f'{CARPETA_MINIATURAS}/{resumen[:2]}/{resumen}_{TAMANOS_MINIATURA[tamano]}.{formato}'
+
+def resumen_contenido(nombre, almacenamiento=default_storage):
+    """Resumen SHA-256 del contenido de un fichero, leyéndolo por bloques (o de su nombre, si ya es un blob)"""
+    if nombre.startswith(f'{CARPETA_BLOBS}/'):
+        return PurePosixPath(nombre).stem
+    resumen = hashlib.sha256()
+    with almacenamiento.open(nombre, 'rb') as fichero:
+        for bloque in iter(lambda: fichero.read(TAMANO_BLOQUE_LECTURA), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+def generar_miniaturas(nombre):
+    """Genera (si no existen ya) todas las miniaturas de una foto y devuelve (nombre, resumen)"""
+    resumen = resumen_contenido(nombre)
+    with default_storage.open(nombre, 'rb') as fichero:
+        original = ImageOps.exif_transpose(Image.open(fichero))
+        original.load()
+    for tamano, ancho in TAMANOS_MINIATURA.items():
+        imagen = original.copy()
+        imagen.thumbnail((ancho, ancho), Image.Resampling.LANCZOS)
+        for formato, formato_pillow in FORMATOS_MINIATURA.items():
+            destino = nombre_miniatura(resumen, tamano, formato)
+            if default_storage.exists(destino):
+                continue
+            salida = io.BytesIO()
+            convertida = imagen if formato_pillow == 'WEBP' or imagen.mode == 'RGB' else imagen.convert('RGB')
+            convertida.save(salida, formato_pillow, quality=CALIDAD_MINIATURA, optimize=True)
+            default_storage.save(destino, ContentFile(salida.getvalue()))
+    return nombre, resumen
+
+def anotar_resultado(futuro, nombre):
+    """Anota en la caché el resumen de una foto cuyas miniaturas se han generado, o la marca de fallida; devuelve el resumen o None"""
+    if futuro.exception() is not None:
+        logger.warning('No se pudieron generar las miniaturas de %s', nombre, exc_info=futuro.exception())
+        # Si lo que ha fallado es el pool, no la foto, se reintentará en cuanto se vuelva a pedir
+        if not isinstance(futuro.exception(), BrokenExecutor):
+            cache.set(clave_cache_miniaturas(nombre), FALLIDA, timeout=SEGUNDOS_REINTENTO_FALLIDAS)
+        return None
+    _, resumen = futuro.result()
+    cache.set(clave_cache_miniaturas(nombre), resumen, timeout=None)
+    return resumen
+
+def _al_terminar(futuro, nombre):
+    """Anota el resultado de un trabajo del pool y deja de considerarlo en curso"""
+    _pendientes.discard(nombre)
+    anotar_resultado(futuro, nombre)
+
+def encolar_miniaturas(nombre):
+    """Encarga al pool la generación de las miniaturas de una foto, si no están ya hechas, en curso o fallidas hace poco"""
+    if not nombre or nombre in _pendientes or cache.get(clave_cache_miniaturas(nombre)) is not None:
+        return
+    _pendientes.add(nombre)
+    futuro = obtener_pool().submit(generar_miniaturas, nombre)
+    futuro.add_done_callback(lambda futuro: _al_terminar(futuro, nombre))
+
+def url_miniatura(campo, tamano='mediana', formato='webp', respaldo_original=True):
+    """URL de la miniatura de una foto; mientras no exista se encola y se devuelve la original (o '')"""
+    if not campo:
+        return ''
+    resumen = cache.get(clave_cache_miniaturas(campo.name))
+    if resumen is None:
+        encolar_miniaturas(campo.name)
+    elif resumen != FALLIDA:
+        return default_storage.url(nombre_miniatura(resumen, tamano, formato))
+    return campo.url if respaldo_original else ''
+
+def srcset_miniatura(campo, formato='webp'):
+    """Atributo srcset con todas las miniaturas disponibles de una foto ('' si aún no se han generado o no se pudieron generar)"""
+    if not campo:
+        return ''
+    resumen = cache.get(clave_cache_miniaturas(campo.name))
+    if resumen is None:
+        encolar_miniaturas(campo.name)
+    if resumen is None or resumen == FALLIDA:
+        return ''
+    return ', '.join(f'{default_storage.url(nombre_miniatura(resumen, tamano, formato))} {ancho}w' for tamano, ancho in TAMANOS_MINIATURA.items())
+
+def modelos_con_foto():
+    """Modelos de core con un campo de imagen 'foto'"""
+    return [modelo for modelo in apps.get_app_config('core').get_models() if any(isinstance(campo, ImageField) and campo.name == 'foto' for campo in modelo._meta.concrete_fields)]
@@ -12,8 +12,11 @@ from phonenumber_field.modelfields import PhoneNumberField
 from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
 from django.db import models
-from django.db.models import Q
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models import Q, Value
 from django.utils import timezone
+from django.db.models.functions import Coalesce, Concat, Greatest, Least, Lower
+from core.managers import EnfrentamientoManager, ParejaManager
 
 
 # Funciones base
@@ -24,6 +27,16 @@ def aplicar_docstring_como_comentario_de_tabla(clase):
         clase._meta.db_table_comment = clase.__doc__.strip()
     return clase
 
+class SinAcentos(models.Func):
+    """Función sin_acentos(texto) de la base de datos: unaccent declarada inmutable para poder usarla en índices"""
+    function = 'sin_acentos'
+    output_field = models.TextField()
+
+def nombre_para_busqueda():
+    """Nombre y apellidos de una persona en minúsculas y sin acentos (expresión de su índice de trigramas)"""
+    return SinAcentos(Lower(Concat('nombre', Value(' '), 'apellido_primero', Value(' '), Coalesce('apellido_segundo', Value('')),
+                                   output_field=models.TextField())))
+
 def nuevo_token_qr():
     """Generador de valores de 32 caracteres hexadecimales aleatorios, criptográficamente seguros, para uso con códigos QR"""
     return secrets.token_hex(MAXLEN_TOKENQR // 2)
@@ -247,6 +260,7 @@ class Club(models.Model):
         db_table = 'club'
         verbose_name = 'Club deportivo'
         verbose_name_plural = 'Clubes deportivos'
+        permissions = [('ver_filas_sin_club', 'Puede ver en el admin las filas globales (sin club) de cualquier modelo')]
 
 @aplicar_docstring_como_comentario_de_tabla
 class Configuracion(models.Model):
@@ -527,13 +541,17 @@ class Envio(models.Model):
     remitente = models.CharField(max_length=MAXLEN_MENSAJE_REMITENTE, db_comment='Dirección o número de remitente usado')
     destinatario = models.CharField(max_length=MAXLEN_MENSAJE_DESTINATARIO, db_comment='Dirección o número de destinatario usado')
     id_tipo_mensaje = models.ForeignKey('TipoMensaje', models.RESTRICT, db_column='id_tipo_mensaje', db_comment='Tipo de mensaje finalmente usado')
-    id_estado_envio = models.ForeignKey('EstadoEnvio', models.RESTRICT, db_column='id_estado_envio')
+    id_estado_envio = models.ForeignKey('EstadoEnvio', models.RESTRICT, db_column='id_estado_envio', db_index=False)
     fecha_hora = models.DateTimeField(default=timezone.now, db_comment='Momento de la creación del envío')
     class Meta:
         """Metadatos"""
         db_table = 'envio'
         verbose_name = 'Envío de mensaje'
         verbose_name_plural = 'Envíos de mensajes'
+        indexes = [
+            # Cola de envíos por estado, en orden de creación
+            models.Index(fields=['id_estado_envio', 'fecha_hora'], name='envio_estado_fecha_idx'),
+        ]
 
 @aplicar_docstring_como_comentario_de_tabla
 class Equipo(models.Model):
@@ -827,17 +845,20 @@ class Pareja(models.Model):
     nombre = models.CharField(max_length=MAXLEN_NOMBRE)
     id_jugador_izquierdo = models.ForeignKey('Jugador', models.RESTRICT, db_column='id_jugador_izquierdo', related_name='pareja_id_jugador_izquierdo_set', blank=False, null=False)
     id_jugador_derecho = models.ForeignKey('Jugador', models.RESTRICT, db_column='id_jugador_derecho', related_name='pareja_id_jugador_derecho_set', blank=False, null=False)
+    id_jugador_menor = models.GeneratedField(expression=Least('id_jugador_izquierdo', 'id_jugador_derecho'), output_field=models.IntegerField(), db_persist=True, db_comment='Clave canónica: el menor de los dos jugadores')
+    id_jugador_mayor = models.GeneratedField(expression=Greatest('id_jugador_izquierdo', 'id_jugador_derecho'), output_field=models.IntegerField(), db_persist=True, db_comment='Clave canónica: el mayor de los dos jugadores')
     fecha_alta = models.DateField(default=timezone.now)
     fecha_baja = models.DateField(blank=True, null=True)
     activa = models.BooleanField(default=True)
     comentarios = models.TextField(blank=True, null=True)
+    objects = ParejaManager()
     def clean(self):
         """Validación de coherencia interna"""
         # Error si los dos miembros de la pareja tienen valor y apuntan al mismo jugador
-        if self.id_jugador_izquierdo and self.id_jugador_derecho and self.id_jugador_izquierdo == self.id_jugador_derecho:
+        if self.id_jugador_izquierdo_id and self.id_jugador_derecho_id and self.id_jugador_izquierdo_id == self.id_jugador_derecho_id:
             raise ValidationError('Los jugadores de una pareja deben ser distintos entre sí')
-        # Error si la pareja que queremos crear ya existe (con sus miembros en en cualquier orden)
-        elif self.__class__.objects.exclude(pk=self.pk).filter(Q(id_jugador_izquierdo=self.id_jugador_izquierdo, id_jugador_derecho=self.id_jugador_derecho) | Q(id_jugador_izquierdo=self.id_jugador_derecho, id_jugador_derecho=self.id_jugador_izquierdo)).exists():
+        # Error si la pareja que queremos crear ya existe (con sus miembros en cualquier orden), buscando por su clave canónica
+        elif self.id_jugador_izquierdo_id and self.id_jugador_derecho_id and self.__class__.objects.exclude(pk=self.pk).filter(id_jugador_menor=min(self.id_jugador_izquierdo_id, self.id_jugador_derecho_id), id_jugador_mayor=max(self.id_jugador_izquierdo_id, self.id_jugador_derecho_id)).exists():
             raise ValidationError('Esta pareja de jugadores ya existe (con sus miembros en cualquier orden)')
     def __str__(self):
         return str(self.nombre)
@@ -846,6 +867,9 @@ class Pareja(models.Model):
         db_table = 'pareja'
         verbose_name = 'Pareja'
         verbose_name_plural = 'Parejas'
+        constraints = [
+            models.UniqueConstraint(fields=['id_jugador_menor', 'id_jugador_mayor'], name='pareja_jugadores_unica'),
+        ]
 
 @aplicar_docstring_como_comentario_de_tabla
 class PartidoDobles(models.Model):
@@ -857,7 +881,7 @@ class PartidoDobles(models.Model):
     token_qr_confirmacion = models.CharField(unique=True, max_length=MAXLEN_TOKENQR, default=nuevo_token_qr)
     id_estado_partido = models.ForeignKey('EstadoPartido', models.RESTRICT, db_column='id_estado_partido')
     id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista', blank=True, null=True)
-    id_torneo_dobles = models.ForeignKey('TorneoDobles', models.RESTRICT, db_column='id_torneo_dobles', blank=True, null=True, db_comment='Si pertenece a un torneo')
+    id_torneo_dobles = models.ForeignKey('TorneoDobles', models.RESTRICT, db_column='id_torneo_dobles', blank=True, null=True, db_comment='Si pertenece a un torneo', db_index=False)
     ronda_o_jornada = models.IntegerField(blank=True, null=True)
     fecha_hora = models.DateTimeField(db_comment='Momento de celebración del partido')
     tods_formato = models.CharField(max_length=MAXLEN_TODS)
@@ -869,6 +893,10 @@ class PartidoDobles(models.Model):
         db_table = 'partido_dobles'
         verbose_name = 'Partido de dobles'
         verbose_name_plural = 'Partidos de dobles'
+        indexes = [
+            # Partidos de un torneo por ronda (los partidos sueltos, la mayoría, quedan fuera del índice)
+            models.Index(fields=['id_torneo_dobles', 'ronda_o_jornada'], condition=Q(id_torneo_dobles__isnull=False), name='partido_dob_torneo_ronda_idx'),
+        ]
 
 @aplicar_docstring_como_comentario_de_tabla
 class PartidoIndividual(models.Model):
@@ -880,7 +908,7 @@ class PartidoIndividual(models.Model):
     token_qr_confirmacion = models.CharField(unique=True, max_length=MAXLEN_TOKENQR, default=nuevo_token_qr)
     id_estado_partido = models.ForeignKey('EstadoPartido', models.RESTRICT, db_column='id_estado_partido')
     id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista', blank=True, null=True)
-    id_torneo_individual = models.ForeignKey('TorneoIndividual', models.RESTRICT, db_column='id_torneo_individual', blank=True, null=True, db_comment='Si pertenece a un torneo')
+    id_torneo_individual = models.ForeignKey('TorneoIndividual', models.RESTRICT, db_column='id_torneo_individual', blank=True, null=True, db_comment='Si pertenece a un torneo', db_index=False)
     ronda_o_jornada = models.IntegerField(blank=True, null=True)
     fecha_hora = models.DateTimeField(db_comment='Momento de celebración del partido')
     tods_formato = models.CharField(max_length=MAXLEN_TODS)
@@ -892,13 +920,17 @@ class PartidoIndividual(models.Model):
         db_table = 'partido_individual'
         verbose_name = 'Partido individual'
         verbose_name_plural = 'Partidos individuales'
+        indexes = [
+            # Partidos de un torneo por ronda (los partidos sueltos, la mayoría, quedan fuera del índice)
+            models.Index(fields=['id_torneo_individual', 'ronda_o_jornada'], condition=Q(id_torneo_individual__isnull=False), name='partido_ind_torneo_ronda_idx'),
+        ]
 
 @aplicar_docstring_como_comentario_de_tabla
 class Persona(models.Model):
     """Agrupamos todos los tipos de persona (evitamos duplicidades)"""
     id_persona = models.AutoField(primary_key=True)
     foto = models.ImageField(upload_to='fotos_personas/', blank=True, null=True)
-    id_tipo_identificacion = models.ForeignKey('TipoIdentificacion', models.RESTRICT, db_column='id_tipo_identificacion')
+    id_tipo_identificacion = models.ForeignKey('TipoIdentificacion', models.RESTRICT, db_column='id_tipo_identificacion', db_index=False)
     docidentidad_valor = models.CharField(max_length=MAXLEN_IDENTIFICADOR_LARGO)
     nombre = models.CharField(max_length=MAXLEN_NOMBRE)
     apellido_primero = models.CharField(max_length=MAXLEN_APELLIDO)
@@ -934,13 +966,19 @@ class Persona(models.Model):
         verbose_name = 'Persona'
         verbose_name_plural = 'Personas'
         unique_together = (('id_tipo_identificacion', 'docidentidad_valor'),)
+        # Índices de trigramas para la búsqueda aproximada (core/busqueda.py): por nombre sin acentos, documento y email
+        indexes = [
+            GinIndex(OpClass(nombre_para_busqueda(), name='gin_trgm_ops'), name='persona_nombre_trgm_idx'),
+            GinIndex(OpClass(Lower('docidentidad_valor'), name='gin_trgm_ops'), name='persona_documento_trgm_idx'),
+            GinIndex(OpClass(Lower('email'), name='gin_trgm_ops'), name='persona_email_trgm_idx'),
+        ]
 
 @aplicar_docstring_como_comentario_de_tabla
 class Pertenencia(models.Model):
     """Pertenencia: Tabla de combinación N:M jugador-club"""
     id_pertenencia = models.AutoField(primary_key=True)
     id_jugador = models.ForeignKey('Jugador', models.RESTRICT, db_column='id_jugador')
-    id_club = models.ForeignKey('Club', models.RESTRICT, db_column='id_club')
+    id_club = models.ForeignKey('Club', models.RESTRICT, db_column='id_club', db_index=False)
     fecha_alta = models.DateField(default=timezone.now)
     fecha_baja = models.DateField(blank=True, null=True)
     activa = models.BooleanField(default=True)
@@ -950,6 +988,10 @@ class Pertenencia(models.Model):
         db_table = 'pertenencia'
         verbose_name = 'Pertenencia [jugador-club]'
         verbose_name_plural = 'Pertenencias [jugador-club]'
+        indexes = [
+            # Miembros (activos) de un club; encabezado por id_club, sustituye al índice de la clave ajena
+            models.Index(fields=['id_club', 'activa'], name='pertenencia_club_activa_idx'),
+        ]
 
 @aplicar_docstring_como_comentario_de_tabla
 class Pista(models.Model):
@@ -996,7 +1038,7 @@ class Provincia(models.Model):
 class RankingJugadorClub(models.Model):
     """Ranking de un jugador en un club a lo largo del tiempo"""
     id_ranking_jugador_club = models.AutoField(primary_key=True)
-    id_jugador = models.ForeignKey('Jugador', models.RESTRICT, db_column='id_jugador')
+    id_jugador = models.ForeignKey('Jugador', models.RESTRICT, db_column='id_jugador', db_index=False)
     id_club = models.ForeignKey('Club', models.RESTRICT, db_column='id_club')
     victorias = models.IntegerField()
     empates = models.IntegerField()
@@ -1015,7 +1057,7 @@ class RankingJugadorClub(models.Model):
 class RankingJugadorTorneo(models.Model):
     """Ranking de un jugador en un torneo determinado"""
     id_ranking_jugador_torneo = models.AutoField(primary_key=True)
-    id_jugador = models.ForeignKey('Jugador', models.RESTRICT, db_column='id_jugador')
+    id_jugador = models.ForeignKey('Jugador', models.RESTRICT, db_column='id_jugador', db_index=False)
     id_torneo_individual = models.ForeignKey('TorneoIndividual', models.RESTRICT, db_column='id_torneo_individual')
     ronda_o_jornada = models.IntegerField()
     victorias = models.IntegerField()
@@ -1035,7 +1077,7 @@ class RankingJugadorTorneo(models.Model):
 class RankingParejaClub(models.Model):
     """Ranking de una pareja en un club a lo largo del tiempo"""
     id_ranking_pareja_club = models.AutoField(primary_key=True)
-    id_pareja = models.ForeignKey('Pareja', models.RESTRICT, db_column='id_pareja')
+    id_pareja = models.ForeignKey('Pareja', models.RESTRICT, db_column='id_pareja', db_index=False)
     id_club = models.ForeignKey('Club', models.RESTRICT, db_column='id_club')
     victorias = models.IntegerField()
     empates = models.IntegerField()
@@ -1054,7 +1096,7 @@ class RankingParejaClub(models.Model):
 class RankingParejaTorneo(models.Model):
     """Ranking de una pareja en un torneo de dobles determinado"""
     id_ranking_pareja_torneo = models.AutoField(primary_key=True)
-    id_pareja = models.ForeignKey('Pareja', models.RESTRICT, db_column='id_pareja')
+    id_pareja = models.ForeignKey('Pareja', models.RESTRICT, db_column='id_pareja', db_index=False)
     id_torneo_dobles = models.ForeignKey('TorneoDobles', models.RESTRICT, db_column='id_torneo_dobles')
     ronda_o_jornada = models.IntegerField()
     victorias = models.IntegerField()
@@ -1074,7 +1116,7 @@ class RankingParejaTorneo(models.Model):
 class Rating(models.Model):
     """Rating de un jugador a lo largo del tiempo"""
     id_rating = models.AutoField(primary_key=True)
-    id_jugador = models.ForeignKey('Jugador', models.RESTRICT, db_column='id_jugador')
+    id_jugador = models.ForeignKey('Jugador', models.RESTRICT, db_column='id_jugador', db_index=False)
     wpr_puntuacion = models.DecimalField(max_digits=4, decimal_places=2)
     wpr_incertidumbre = models.IntegerField()
     fecha = models.DateField()
@@ -1089,7 +1131,7 @@ class Rating(models.Model):
 class ReservaClub(models.Model):
     """Reserva de pista de un club, puede que para un equipo concreto"""
     id_reserva_club = models.AutoField(primary_key=True)
-    id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista')
+    id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista', db_index=False)
     id_club = models.ForeignKey('Club', models.RESTRICT, db_column='id_club')
     id_equipo = models.ForeignKey('Equipo', models.RESTRICT, db_column='id_equipo', blank=True, null=True)
     fecha_reserva = models.DateField()
@@ -1110,7 +1152,7 @@ class ReservaClub(models.Model):
 class ReservaCurso(models.Model):
     """Reserva de pista por parte de un curso"""
     id_reserva_curso = models.AutoField(primary_key=True)
-    id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista')
+    id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista', db_index=False)
     id_curso = models.ForeignKey('Curso', models.RESTRICT, db_column='id_curso')
     fecha_reserva = models.DateField()
     hora_inicio = models.TimeField()
@@ -1130,7 +1172,7 @@ class ReservaCurso(models.Model):
 class ReservaJugador(models.Model):
     """Reserva de pista por parte de un jugador"""
     id_reserva_jugador = models.AutoField(primary_key=True)
-    id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista')
+    id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista', db_index=False)
     id_jugador = models.ForeignKey('Jugador', models.RESTRICT, db_column='id_jugador')
     fecha_reserva = models.DateField()
     hora_inicio = models.TimeField()
@@ -1150,7 +1192,7 @@ class ReservaJugador(models.Model):
 class ReservaTorneoDobles(models.Model):
     """Reserva de pista por parte de un torneo de dobles"""
     id_reserva_torneo_dobles = models.AutoField(primary_key=True)
-    id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista')
+    id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista', db_index=False)
     id_torneo_dobles = models.ForeignKey('TorneoDobles', models.RESTRICT, db_column='id_torneo_dobles')
     fecha_reserva = models.DateField()
     hora_inicio = models.TimeField()
@@ -1170,7 +1212,7 @@ class ReservaTorneoDobles(models.Model):
 class ReservaTorneoEquipos(models.Model):
     """Reserva de pista por parte de un torneo por equipos"""
     id_reserva_torneo_equipos = models.AutoField(primary_key=True)
-    id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista')
+    id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista', db_index=False)
     id_torneo_equipos = models.ForeignKey('TorneoEquipos', models.RESTRICT, db_column='id_torneo_equipos')
     fecha_reserva = models.DateField()
     hora_inicio = models.TimeField()
@@ -1190,7 +1232,7 @@ class ReservaTorneoEquipos(models.Model):
 class ReservaTorneoIndividual(models.Model):
     """Reserva de pista por parte de un torneo individual"""
     id_reserva_torneo_individual = models.AutoField(primary_key=True)
-    id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista')
+    id_pista = models.ForeignKey('Pista', models.RESTRICT, db_column='id_pista', db_index=False)
     id_torneo_individual = models.ForeignKey('TorneoIndividual', models.RESTRICT, db_column='id_torneo_individual')
     fecha_reserva = models.DateField()
     hora_inicio = models.TimeField()
@@ -1841,3 +1883,71 @@ class TipoCapacitacion(models.Model):
         db_table = 'tipo_capacitacion'
         verbose_name = 'Tipo de capacitación'
         verbose_name_plural = 'Tipos de capacitación'
+
+@aplicar_docstring_como_comentario_de_tabla
+class Enfrentamiento(models.Model):
+    """Tabla desnormalizada de participación en partidos (una fila por jugador y rival), mantenida por señales"""
+    id_enfrentamiento = models.AutoField(primary_key=True)
+    id_partido_individual = models.ForeignKey('PartidoIndividual', models.CASCADE, db_column='id_partido_individual', blank=True, null=True)
+    id_partido_dobles = models.ForeignKey('PartidoDobles', models.CASCADE, db_column='id_partido_dobles', blank=True, null=True)
+    id_jugador = models.ForeignKey('Jugador', models.RESTRICT, db_column='id_jugador', related_name='enfrentamiento_id_jugador_set', db_index=False)
+    id_rival = models.ForeignKey('Jugador', models.RESTRICT, db_column='id_rival', related_name='enfrentamiento_id_rival_set', db_index=False)
+    id_pareja = models.ForeignKey('Pareja', models.RESTRICT, db_column='id_pareja', related_name='enfrentamiento_id_pareja_set', blank=True, null=True, db_index=False, db_comment='Sólo en partidos de dobles')
+    id_pareja_rival = models.ForeignKey('Pareja', models.RESTRICT, db_column='id_pareja_rival', related_name='enfrentamiento_id_pareja_rival_set', blank=True, null=True, db_index=False, db_comment='Sólo en partidos de dobles')
+    fecha_hora = models.DateTimeField(db_comment='Copia de la fecha y hora del partido')
+    local = models.BooleanField(db_comment='¿Jugaba como local?')
+    ganador = models.BooleanField(db_comment='¿Ganó el partido?')
+    principal = models.BooleanField(db_comment='Única fila del jugador en el partido (para su historial)')
+    representante = models.BooleanField(db_comment='Única fila de la pareja en el partido (para el cara a cara de parejas)')
+    objects = EnfrentamientoManager()
+    class Meta:
+        """Metadatos"""
+        db_table = 'enfrentamiento'
+        verbose_name = 'Enfrentamiento'
+        verbose_name_plural = 'Enfrentamientos'
+        indexes = [
+            models.Index(fields=['id_jugador', '-fecha_hora'], condition=Q(principal=True), name='enfrentamiento_historial_idx'),
+            models.Index(fields=['id_jugador', 'id_rival', '-fecha_hora'], name='enfrentamiento_cara_a_cara_idx'),
+            models.Index(fields=['id_pareja', 'id_pareja_rival', '-fecha_hora'], condition=Q(principal=True, representante=True), name='enfrentamiento_parejas_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=Q(id_partido_individual__isnull=False, id_partido_dobles__isnull=True) | Q(id_partido_individual__isnull=True, id_partido_dobles__isnull=False), name='enfrentamiento_un_solo_partido'),
+        ]
+
+@aplicar_docstring_como_comentario_de_tabla
+class ArchivoAlmacenado(models.Model):
+    """Recuento de referencias de los ficheros subidos, guardados una sola vez por su contenido (SHA-256)"""
+    id_archivo_almacenado = models.AutoField(primary_key=True)
+    nombre = models.CharField(unique=True, max_length=255, db_comment='Ruta del blob dentro de MEDIA_ROOT')
+    referencias = models.IntegerField(default=0)
+    fecha_alta = models.DateTimeField(default=timezone.now)
+    def __str__(self):
+        return str(self.nombre)
+    class Meta:
+        """Metadatos"""
+        db_table = 'archivo_almacenado'
+        verbose_name = 'Archivo almacenado'
+        verbose_name_plural = 'Archivos almacenados'
+
+@aplicar_docstring_como_comentario_de_tabla
+class ConfirmacionResultado(models.Model):
+    """Resultado de un partido enviado por cada lado al escanear el QR de confirmación; el partido se da por jugado cuando coinciden"""
+    id_confirmacion_resultado = models.AutoField(primary_key=True)
+    id_partido_individual = models.ForeignKey('PartidoIndividual', models.CASCADE, db_column='id_partido_individual', blank=True, null=True, db_index=False)
+    id_partido_dobles = models.ForeignKey('PartidoDobles', models.CASCADE, db_column='id_partido_dobles', blank=True, null=True, db_index=False)
+    local = models.BooleanField(db_comment='¿Lo envía el lado local?')
+    tods_resultado = models.CharField(max_length=MAXLEN_TODS)
+    id_persona = models.ForeignKey('Persona', models.RESTRICT, db_column='id_persona', db_comment='Quién lo envió')
+    fecha_hora = models.DateTimeField(default=timezone.now)
+    contabilizado = models.BooleanField(default=False, db_comment='Ya sumado a los rankings (nunca se suma dos veces)')
+    class Meta:
+        """Metadatos"""
+        db_table = 'confirmacion_resultado'
+        verbose_name = 'Confirmación de resultado'
+        verbose_name_plural = 'Confirmaciones de resultados'
+        # Una fila por lado y partido: estos índices únicos sirven también para buscar las confirmaciones de un partido
+        constraints = [
+            models.UniqueConstraint(fields=['id_partido_individual', 'local'], condition=Q(id_partido_individual__isnull=False), name='confirmacion_individual_lado_uniq'),
+            models.UniqueConstraint(fields=['id_partido_dobles', 'local'], condition=Q(id_partido_dobles__isnull=False), name='confirmacion_dobles_lado_uniq'),
+            models.CheckConstraint(condition=Q(id_partido_individual__isnull=False, id_partido_dobles__isnull=True) | Q(id_partido_individual__isnull=True, id_partido_dobles__isnull=False), name='confirmacion_un_solo_partido'),
+        ]
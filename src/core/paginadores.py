@@ -0,0 +1,31 @@
+"""Paginadores para los listados de la interfaz de administración"""
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+# A partir de este número de filas estimadas dejamos de hacer COUNT(*) en los listados sin filtrar
+UMBRAL_CONTEO_ESTIMADO = 100_000
+
+
+def filas_estimadas(modelo, alias='default'):
+    """Número de filas de la tabla de un modelo según las estadísticas de PostgreSQL (pg_class.reltuples)"""
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [modelo._meta.db_table])
+        fila = cursor.fetchone()
+    return fila[0] if fila else -1
+
+
+class PaginadorEstimado(Paginator):
+    """Paginador que, en tablas muy grandes y sin filtros, usa el número de filas estimado en vez de COUNT(*)"""
+
+    @cached_property
+    def count(self):
+        consulta = self.object_list
+        if isinstance(consulta, QuerySet) and not consulta.query.where and connections[consulta.db].vendor == 'postgresql':
+            estimacion = filas_estimadas(consulta.model, consulta.db)
+            if estimacion >= UMBRAL_CONTEO_ESTIMADO:
+                return estimacion
+        return super().count
@@ -0,0 +1,310 @@
+"""Particionado declarativo por rangos de fechas (PostgreSQL) de las tablas de histórico que crecen sin límite"""
+
+import datetime
+import logging
+import re
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.migrations.operations.base import Operation
+from django.utils import timezone
+
+
+# Tabla -> columna de partición. Los partidos (partido_individual, partido_dobles) no se particionan porque
+# enfrentamiento los referencia por su clave, y una clave foránea hacia una tabla particionada tendría que incluir la fecha
+# Envio queda sin particionar mientras token_qr sea único (ver restricciones_debilitadas)
+TABLAS_PARTICIONABLES = {
+    'envio':                     'fecha_hora',
+    'reserva_club':              'fecha_reserva',
+    'reserva_curso':             'fecha_reserva',
+    'reserva_jugador':           'fecha_reserva',
+    'reserva_torneo_dobles':     'fecha_reserva',
+    'reserva_torneo_equipos':    'fecha_reserva',
+    'reserva_torneo_individual': 'fecha_reserva',
+}
+
+INTERVALOS = ('mes', 'anio')
+SUFIJO_DEFECTO = 'pdefecto'
+ESQUEMA_ARCHIVO = 'archivo'
+
+logger = logging.getLogger(__name__)
+
+_LIMITES = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})[^']*'\) TO \('(\d{4}-\d{2}-\d{2})[^']*'\)")
+
+
+# Periodos
+
+def inicio_periodo(fecha, intervalo):
+    """Primer día del mes o del año que contiene la fecha"""
+    return datetime.date(fecha.year, fecha.month if intervalo == 'mes' else 1, 1)
+
+def siguiente_periodo(inicio, intervalo):
+    """Primer día del periodo siguiente"""
+    if intervalo == 'anio':
+        return datetime.date(inicio.year + 1, 1, 1)
+    return datetime.date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+
+def periodos(desde, hasta, intervalo):
+    """Inicios de los periodos que cubren desde 'desde' hasta 'hasta', ambos incluidos"""
+    inicio = inicio_periodo(desde, intervalo)
+    while inicio <= hasta:
+        yield inicio
+        inicio = siguiente_periodo(inicio, intervalo)
+
+def nombre_particion(tabla, inicio, intervalo):
+    """Nombre de la partición de una tabla para el periodo que empieza en 'inicio'"""
+    return f'{tabla}_p{inicio:%Y_%m}' if intervalo == 'mes' else f'{tabla}_p{inicio:%Y}'
+
+def horizonte(intervalo, futuras=None):
+    """Último día cubierto por las particiones creadas por adelantado a partir de hoy"""
+    inicio = inicio_periodo(timezone.localdate(), intervalo)
+    for _ in range(settings.PARTICIONES_FUTURAS if futuras is None else futuras):
+        inicio = siguiente_periodo(inicio, intervalo)
+    return siguiente_periodo(inicio, intervalo) - datetime.timedelta(days=1)
+
+
+# Consultas al catálogo
+
+def esta_particionada(cursor, tabla):
+    """Indica si la tabla ya es una tabla particionada"""
+    cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [tabla])
+    return cursor.fetchone() is not None
+
+def particiones(cursor, tabla):
+    """Lista de (nombre, desde, hasta) de las particiones por rango de una tabla, por orden de fecha; sin la de defecto"""
+    cursor.execute('''
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    ''', [tabla])
+    lista = []
+    for nombre, limites in cursor.fetchall():
+        encontrados = _LIMITES.search(limites)
+        if encontrados:
+            lista.append((nombre, datetime.date.fromisoformat(encontrados[1]), datetime.date.fromisoformat(encontrados[2])))
+    return sorted(lista, key=lambda particion: particion[1])
+
+def _restricciones(cursor, tabla):
+    """Restricciones de clave primaria, únicas y foráneas de una tabla: (nombre, tipo, columnas, definición)"""
+    cursor.execute('''
+        SELECT c.conname, c.contype,
+               ARRAY(SELECT a.attname FROM unnest(c.conkey) WITH ORDINALITY k(num, orden)
+                     JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.num ORDER BY k.orden),
+               pg_get_constraintdef(c.oid)
+        FROM pg_constraint c
+        WHERE c.conrelid = to_regclass(%s) AND c.contype IN ('p', 'u', 'f')
+        ORDER BY c.contype DESC, c.conname
+    ''', [tabla])
+    return cursor.fetchall()
+
+def _columnas_identidad(cursor, tabla):
+    """Columnas de identidad (claves generadas por secuencia) de una tabla"""
+    cursor.execute('''
+        SELECT attname FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attidentity <> '' AND NOT attisdropped
+    ''', [tabla])
+    return [columna for columna, in cursor.fetchall()]
+
+def restricciones_debilitadas(cursor, tabla):
+    """Restricciones únicas que dejarían de garantizar la unicidad si se particionase la tabla
+
+    Al particionar, cada clave única tiene que incluir la columna de partición, así que sólo impide repetir valores
+    dentro de la misma fecha. Las claves de una columna de identidad siguen siendo únicas porque las da su secuencia"""
+    columna, identidad = TABLAS_PARTICIONABLES[tabla], _columnas_identidad(cursor, tabla)
+    return [nombre for nombre, tipo, columnas, _ in _restricciones(cursor, tabla)
+            if tipo in ('p', 'u') and columna not in columnas and not (len(columnas) == 1 and columnas[0] in identidad)]
+
+def _indices_sueltos(cursor, tabla):
+    """Definiciones de los índices de una tabla que no respaldan ninguna restricción"""
+    cursor.execute('''
+        SELECT pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        WHERE i.indrelid = to_regclass(%s) AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+    ''', [tabla])
+    return [definicion for definicion, in cursor.fetchall()]
+
+
+# Creación de particiones
+
+def crear_particion(cursor, tabla, inicio, intervalo):
+    """Crea y adjunta la partición de un periodo, moviendo a ella las filas que hubieran caído en la de defecto; devuelve si la crea"""
+    nombre = nombre_particion(tabla, inicio, intervalo)
+    columna, fin = TABLAS_PARTICIONABLES[tabla], siguiente_periodo(inicio, intervalo)
+    # Todo en una transacción: si algo falla no quedan ni una tabla suelta sin adjuntar ni filas fuera de la de defecto.
+    # El bloqueo (el mismo que toma ATTACH) hace esperar a otro proceso que esté creando la misma partición
+    with transaction.atomic(using=cursor.db.alias):
+        cursor.execute(f'LOCK TABLE "{tabla}" IN SHARE UPDATE EXCLUSIVE MODE')
+        cursor.execute('SELECT to_regclass(%s)', [nombre])
+        if cursor.fetchone()[0]:
+            return False
+        # Se crea suelta y se adjunta después: ATTACH bloquea la tabla madre menos que CREATE TABLE ... PARTITION OF
+        cursor.execute(f'CREATE TABLE "{nombre}" (LIKE "{tabla}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(f'''
+            WITH movidas AS (DELETE FROM "{tabla}_{SUFIJO_DEFECTO}" WHERE "{columna}" >= %s AND "{columna}" < %s RETURNING *)
+            INSERT INTO "{nombre}" SELECT * FROM movidas
+        ''', [inicio, fin])
+        cursor.execute(f'''ALTER TABLE "{tabla}" ATTACH PARTITION "{nombre}" FOR VALUES FROM ('{inicio}') TO ('{fin}')''')
+    return True
+
+def crear_particiones(cursor, tabla, intervalo, desde=None, hasta=None):
+    """Crea las particiones que falten entre 'desde' (por defecto la última existente) y 'hasta' (por defecto el horizonte); devuelve sus nombres"""
+    existentes = particiones(cursor, tabla)
+    desde = desde or (existentes[-1][1] if existentes else timezone.localdate())
+    creadas = []
+    for inicio in periodos(desde, hasta or horizonte(intervalo), intervalo):
+        if crear_particion(cursor, tabla, inicio, intervalo):
+            creadas.append(nombre_particion(tabla, inicio, intervalo))
+    return creadas
+
+def crear_particiones_futuras(using='default', intervalo=None):
+    """Asegura en todas las tablas particionadas las particiones hasta el horizonte configurado; devuelve {tabla: creadas}"""
+    conexion = connections[using]
+    intervalo = intervalo or settings.PARTICIONADO_INTERVALO
+    if conexion.vendor != 'postgresql' or not intervalo:
+        return {}
+    creadas = {}
+    with conexion.cursor() as cursor:
+        for tabla in TABLAS_PARTICIONABLES:
+            if esta_particionada(cursor, tabla):
+                creadas[tabla] = crear_particiones(cursor, tabla, intervalo)
+    return creadas
+
+
+# Conversión de tablas
+
+def _rehacer_tabla(cursor, tabla, particion_por=None):
+    """Renombra la tabla y crea otra igual (particionada o no) en su lugar; devuelve lo que hay que recrear en ella"""
+    restricciones, indices = _restricciones(cursor, tabla), _indices_sueltos(cursor, tabla)
+    cursor.execute("SELECT obj_description(to_regclass(%s), 'pg_class')", [tabla])
+    comentario = cursor.fetchone()[0]
+    antigua = f'{tabla}_antigua'
+    cursor.execute(f'ALTER TABLE "{tabla}" RENAME TO "{antigua}"')
+    particionado = f' PARTITION BY RANGE ("{particion_por}")' if particion_por else ''
+    cursor.execute(f'''
+        CREATE TABLE "{tabla}" (LIKE "{antigua}" INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS
+                                INCLUDING COMMENTS INCLUDING STORAGE){particionado}
+    ''')
+    if comentario:
+        cursor.execute(f'COMMENT ON TABLE "{tabla}" IS %s', [comentario])
+    if particion_por:
+        cursor.execute(f'CREATE TABLE "{tabla}_{SUFIJO_DEFECTO}" PARTITION OF "{tabla}" DEFAULT')
+    return restricciones, indices, antigua
+
+def _completar_tabla(cursor, tabla, antigua, restricciones, indices, columnas_restriccion):
+    """Copia los datos de la tabla antigua, la borra y recrea en la nueva sus restricciones e índices"""
+    cursor.execute(f'INSERT INTO "{tabla}" OVERRIDING SYSTEM VALUE SELECT * FROM "{antigua}"')
+    cursor.execute(f'DROP TABLE "{antigua}"')
+    for nombre, tipo, columnas, definicion in restricciones:
+        if tipo == 'f':
+            cursor.execute(f'ALTER TABLE "{tabla}" ADD CONSTRAINT "{nombre}" {definicion}')
+        else:
+            lista = ', '.join(f'"{columna}"' for columna in columnas_restriccion(columnas))
+            cursor.execute(f'ALTER TABLE "{tabla}" ADD CONSTRAINT "{nombre}" {"PRIMARY KEY" if tipo == "p" else "UNIQUE"} ({lista})')
+    for definicion in indices:
+        # Los índices de una tabla particionada se definen ON ONLY, y en una normal no se admite
+        cursor.execute(definicion.replace(' ON ONLY ', ' ON ', 1))
+    # La columna de identidad nueva empieza de cero: la llevamos detrás de la mayor clave copiada
+    for columna in _columnas_identidad(cursor, tabla):
+        cursor.execute(f'''
+            SELECT setval(pg_get_serial_sequence(%s, %s), coalesce(max("{columna}"), 0) + 1, false) FROM "{tabla}"
+        ''', [tabla, columna])
+    cursor.execute(f'ANALYZE "{tabla}"')
+
+def particionar_tabla(cursor, tabla, intervalo, futuras=None):
+    """Convierte una tabla normal en particionada por su columna de fecha, con una partición por periodo con datos
+
+    Se niega (ValueError) si alguna restricción única dejaría de serlo: p. ej. token_qr de envio, que sólo sería único por fecha"""
+    columna = TABLAS_PARTICIONABLES[tabla]
+    debilitadas = restricciones_debilitadas(cursor, tabla)
+    if debilitadas:
+        raise ValueError(f'No se particiona {tabla}: dejarían de ser únicas en toda la tabla {", ".join(debilitadas)}')
+    cursor.execute(f'SELECT min("{columna}"), max("{columna}") FROM "{tabla}"')
+    primera, ultima = cursor.fetchone()
+    # Las claves primaria y únicas de una tabla particionada tienen que incluir la columna de partición
+    def columnas_restriccion(columnas):
+        return columnas if columna in columnas else [*columnas, columna]
+    restricciones, indices, antigua = _rehacer_tabla(cursor, tabla, particion_por=columna)
+    hoy = timezone.localdate()
+    desde = min(filter(None, (_fecha(primera), hoy)))
+    hasta = max(filter(None, (_fecha(ultima), horizonte(intervalo, futuras))))
+    for inicio in periodos(desde, hasta, intervalo):
+        crear_particion(cursor, tabla, inicio, intervalo)
+    _completar_tabla(cursor, tabla, antigua, restricciones, indices, columnas_restriccion)
+
+def desparticionar_tabla(cursor, tabla, claves):
+    """Vuelve a convertir una tabla particionada en una tabla normal; 'claves' son las tuplas de columnas únicas del modelo"""
+    columna = TABLAS_PARTICIONABLES[tabla]
+    # Quitamos la columna de partición que se añadió al final de las claves que no la tenían en el modelo
+    def columnas_restriccion(columnas):
+        if columnas[-1] == columna and tuple(columnas[:-1]) in claves:
+            return columnas[:-1]
+        return columnas
+    restricciones, indices, antigua = _rehacer_tabla(cursor, tabla)
+    _completar_tabla(cursor, tabla, antigua, restricciones, indices, columnas_restriccion)
+
+def _fecha(valor):
+    """Fecha de un valor de tipo date o timestamp (o None); los límites de las particiones se interpretan en UTC como la conexión"""
+    return valor.date() if isinstance(valor, datetime.datetime) else valor
+
+def claves_modelo(modelo):
+    """Tuplas de columnas de la clave primaria y las restricciones únicas de un modelo"""
+    opciones = modelo._meta
+    claves = {(opciones.pk.column,)}
+    claves.update((campo.column,) for campo in opciones.local_fields if campo.unique)
+    claves.update(tuple(opciones.get_field(nombre).column for nombre in grupo) for grupo in opciones.unique_together)
+    return claves
+
+
+# Archivado
+
+def archivar_particiones(cursor, tabla, antes_de):
+    """Separa de la tabla las particiones que terminan antes de la fecha dada; devuelve sus nombres (siguen existiendo sueltas)"""
+    separadas = []
+    for nombre, _, hasta in particiones(cursor, tabla):
+        if hasta <= antes_de:
+            cursor.execute(f'ALTER TABLE "{tabla}" DETACH PARTITION "{nombre}"')
+            separadas.append(nombre)
+    return separadas
+
+
+class ParticionarPorRango(Operation):
+    """Operación de migración que particiona una tabla si así lo indica PICKLEFREE_PARTICIONADO (sólo en PostgreSQL)"""
+    reversible = True
+    reduces_to_sql = False
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def deconstruct(self):
+        return self.__class__.__name__, [], {'model_name': self.model_name}
+
+    def state_forwards(self, app_label, state):
+        # No cambia el estado de los modelos: para Django la tabla sigue siendo la misma
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        intervalo = settings.PARTICIONADO_INTERVALO
+        if schema_editor.connection.vendor != 'postgresql' or not intervalo:
+            return
+        tabla = to_state.apps.get_model(app_label, self.model_name)._meta.db_table
+        with schema_editor.connection.cursor() as cursor:
+            if esta_particionada(cursor, tabla):
+                return
+            debilitadas = restricciones_debilitadas(cursor, tabla)
+            if debilitadas:
+                logger.warning('No se particiona %s: dejarían de ser únicas en toda la tabla %s', tabla, ', '.join(debilitadas))
+                return
+            particionar_tabla(cursor, tabla, intervalo)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        modelo = to_state.apps.get_model(app_label, self.model_name)
+        with schema_editor.connection.cursor() as cursor:
+            if esta_particionada(cursor, modelo._meta.db_table):
+                desparticionar_tabla(cursor, modelo._meta.db_table, claves_modelo(modelo))
+
+    def describe(self):
+        return f'Particiona por rango de fechas la tabla de {self.model_name} (si está configurado)'
+
+    @property
+    def migration_name_fragment(self):
+        return f'particionar_{self.model_name.lower()}'
@@ -0,0 +1,131 @@
+"""Perfil de un jugador (datos, clubes, equipos, parejas, rating, rankings, reservas, cursos y partidos) con un número fijo de consultas y cacheado"""
+
+from django.core.cache import cache
+from django.db.models import F, OuterRef, Prefetch, Q, Subquery
+from django.utils import timezone
+from core.miniaturas import url_miniatura
+from core.models import (ClaseJugador, Enfrentamiento, Jugador, MatriculaJugador, Membresia, Pareja, PartidoDobles, PartidoIndividual, Persona,
+                         Pertenencia, RankingJugadorClub, Rating, ReservaJugador)
+
+
+# Los cambios directos invalidan el perfil; el tiempo máximo acota lo que no se invalida (p. ej. el nombre de un club)
+SEGUNDOS_CACHE_PERFIL = 60 * 60
+LIMITE_RESERVAS = 10
+LIMITE_CLASES = 10
+LIMITE_PARTIDOS = 10
+
+
+def clave_cache_perfil(id_jugador):
+    """Clave de caché del perfil de un jugador"""
+    return f'picklefree:perfil:{id_jugador}'
+
+def vigentes(hoy):
+    """Filtro de las filas activas y sin fecha de baja pasada (pertenencias, membresías, parejas, matrículas)"""
+    return Q(activa=True) & (Q(fecha_baja__isnull=True) | Q(fecha_baja__gte=hoy))
+
+def consulta_perfil(hoy):
+    """Jugador con todo lo que muestra su perfil: un JOIN para la persona y una consulta por cada relación precargada"""
+    ultimo_ranking = (RankingJugadorClub.objects.filter(id_jugador=OuterRef('id_jugador'), id_club=OuterRef('id_club'))
+                      .order_by('-fecha').values('fecha')[:1])
+    parejas = Pareja.objects.filter(vigentes(hoy))
+    return Jugador.objects.select_related('id_persona', 'id_tipo_lateralidad').prefetch_related(
+        Prefetch('pertenencia_set', Pertenencia.objects.filter(vigentes(hoy)).select_related('id_club').order_by('fecha_alta'), to_attr='pertenencias'),
+        Prefetch('membresia_set', Membresia.objects.filter(vigentes(hoy)).select_related('id_equipo', 'id_tipo_membresia').order_by('fecha_alta'),
+                 to_attr='membresias'),
+        Prefetch('pareja_id_jugador_izquierdo_set', parejas.select_related('id_jugador_derecho__id_persona'), to_attr='parejas_izquierdo'),
+        Prefetch('pareja_id_jugador_derecho_set', parejas.select_related('id_jugador_izquierdo__id_persona'), to_attr='parejas_derecho'),
+        Prefetch('rating_set', Rating.objects.order_by('-fecha')[:1], to_attr='ultimo_rating'),
+        Prefetch('rankingjugadorclub_set', RankingJugadorClub.objects.filter(fecha=Subquery(ultimo_ranking)).select_related('id_club').order_by('posicion'),
+                 to_attr='rankings_club'),
+        Prefetch('reservajugador_set', ReservaJugador.objects.filter(fecha_reserva__gte=hoy, fecha_cancelacion__isnull=True)
+                 .select_related('id_pista__id_instalacion').order_by('fecha_reserva', 'hora_inicio')[:LIMITE_RESERVAS], to_attr='proximas_reservas'),
+        Prefetch('matriculajugador_set', MatriculaJugador.objects.filter(vigentes(hoy)).select_related('id_curso').order_by('fecha_alta'),
+                 to_attr='matriculas'),
+        Prefetch('clasejugador_set', ClaseJugador.objects.select_related('id_curso', 'id_pista')
+                 .order_by(F('fecha_hora').desc(nulls_last=True))[:LIMITE_CLASES], to_attr='ultimas_clases'),
+        Prefetch('enfrentamiento_id_jugador_set', Enfrentamiento.objects.filter(principal=True)
+                 .select_related('id_rival__id_persona', 'id_pareja_rival', 'id_partido_individual', 'id_partido_dobles')
+                 .order_by('-fecha_hora')[:LIMITE_PARTIDOS], to_attr='ultimos_partidos'),
+    )
+
+def nombre_persona(persona):
+    """Nombre y apellidos de una persona"""
+    return ' '.join(filter(None, (persona.nombre, persona.apellido_primero, persona.apellido_segundo)))
+
+def _pareja(pareja, companero):
+    """Pareja vista desde el jugador del perfil"""
+    return {'id': pareja.pk, 'nombre': pareja.nombre, 'companero': companero.pk, 'companero_nombre': nombre_persona(companero.id_persona)}
+
+def _partido(enfrentamiento):
+    """Partido reciente del jugador, con el rival (jugador o pareja) y el resultado"""
+    partido = enfrentamiento.id_partido_individual or enfrentamiento.id_partido_dobles
+    return {
+        'tipo': 'individual' if enfrentamiento.id_partido_individual_id else 'dobles',
+        'id': partido.pk,
+        'fecha_hora': enfrentamiento.fecha_hora,
+        'local': enfrentamiento.local,
+        'ganador': enfrentamiento.ganador,
+        'rival': (enfrentamiento.id_pareja_rival.nombre if enfrentamiento.id_pareja_rival_id
+                  else nombre_persona(enfrentamiento.id_rival.id_persona)),
+        'resultado': partido.tods_resultado,
+    }
+
+def datos_perfil(jugador):
+    """Perfil de un jugador ya cargado con consulta_perfil, sólo con tipos básicos (se guarda en caché)"""
+    persona = jugador.id_persona
+    rating = jugador.ultimo_rating[0] if jugador.ultimo_rating else None
+    return {
+        'jugador': {'id': jugador.pk, 'num_federado': jugador.num_federado, 'lateralidad': jugador.id_tipo_lateralidad.nombre,
+                    'nombre': nombre_persona(persona), 'foto': url_miniatura(persona.foto) or None, 'activo': jugador.activo},
+        'clubes': [{'id': p.id_club_id, 'nombre': p.id_club.nombre, 'desde': p.fecha_alta} for p in jugador.pertenencias],
+        'equipos': [{'id': m.id_equipo_id, 'nombre': m.id_equipo.nombre, 'tipo': m.id_tipo_membresia.nombre, 'desde': m.fecha_alta}
+                    for m in jugador.membresias],
+        'parejas': [_pareja(p, p.id_jugador_derecho) for p in jugador.parejas_izquierdo]
+                   + [_pareja(p, p.id_jugador_izquierdo) for p in jugador.parejas_derecho],
+        'rating': {'puntuacion': rating.wpr_puntuacion, 'incertidumbre': rating.wpr_incertidumbre, 'fecha': rating.fecha} if rating else None,
+        'rankings': [{'club': r.id_club_id, 'club_nombre': r.id_club.nombre, 'posicion': r.posicion, 'puntos': r.puntos,
+                      'victorias': r.victorias, 'empates': r.empates, 'derrotas': r.derrotas, 'fecha': r.fecha} for r in jugador.rankings_club],
+        'reservas': [{'id': r.pk, 'fecha': r.fecha_reserva, 'hora_inicio': r.hora_inicio, 'hora_fin': r.hora_fin, 'pista': r.id_pista.nombre,
+                      'instalacion': r.id_pista.id_instalacion.nombre, 'confirmada': r.fecha_confirmacion is not None}
+                     for r in jugador.proximas_reservas],
+        'cursos': [{'id': m.id_curso_id, 'nombre': m.id_curso.nombre, 'desde': m.fecha_alta} for m in jugador.matriculas],
+        'clases': [{'curso': c.id_curso.nombre, 'pista': c.id_pista.nombre, 'fecha_hora': c.fecha_hora} for c in jugador.ultimas_clases],
+        'partidos': [_partido(e) for e in jugador.ultimos_partidos],
+    }
+
+def perfil_jugador(id_jugador):
+    """Perfil de un jugador desde la caché o, si no está, cargado con un número fijo de consultas; None si no existe"""
+    clave = clave_cache_perfil(id_jugador)
+    perfil = cache.get(clave)
+    if perfil is None:
+        jugador = consulta_perfil(timezone.localdate()).filter(pk=id_jugador).first()
+        if jugador is None:
+            return None
+        perfil = datos_perfil(jugador)
+        cache.set(clave, perfil, timeout=SEGUNDOS_CACHE_PERFIL)
+    return perfil
+
+def invalidar_perfiles(ids_jugador):
+    """Descarta los perfiles cacheados de unos jugadores"""
+    cache.delete_many([clave_cache_perfil(id_jugador) for id_jugador in ids_jugador if id_jugador is not None])
+
+
+def _jugadores_pareja(*ids_pareja):
+    """Jugadores de unas parejas"""
+    return [jugador for par in Pareja.objects.filter(pk__in=ids_pareja).values_list('id_jugador_izquierdo', 'id_jugador_derecho') for jugador in par]
+
+# Por modelo, los jugadores cuyo perfil cambia con una fila (los enfrentamientos se regeneran al guardar el partido)
+_AFECTADOS = {
+    Persona:           lambda persona: list(Jugador.objects.filter(id_persona=persona).values_list('pk', flat=True)),
+    Jugador:           lambda jugador: [jugador.pk],
+    Pareja:            lambda pareja: [pareja.id_jugador_izquierdo_id, pareja.id_jugador_derecho_id],
+    PartidoIndividual: lambda partido: [partido.id_jugador_local_id, partido.id_jugador_visitante_id],
+    PartidoDobles:     lambda partido: _jugadores_pareja(partido.id_pareja_local_id, partido.id_pareja_visitante_id),
+    **{modelo: lambda fila: [fila.id_jugador_id]
+       for modelo in (Pertenencia, Membresia, Rating, RankingJugadorClub, ReservaJugador, MatriculaJugador, ClaseJugador)},
+}
+MODELOS_CON_PERFIL = tuple(_AFECTADOS)
+
+def jugadores_afectados(instancia):
+    """Ids de los jugadores cuyo perfil cambia con una fila"""
+    return _AFECTADOS[type(instancia)](instancia)
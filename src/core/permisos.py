@@ -0,0 +1,116 @@
+"""Caché de permisos a nivel de objeto (django-guardian) y asignación masiva por club"""
+
+from django.apps import apps
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.auth.models import Permission
+from django.db import transaction
+from django.db.models import CharField
+from django.db.models.functions import Cast
+from guardian.backends import ObjectPermissionBackend, check_support
+from guardian.core import ObjectPermissionChecker
+from guardian.ctypes import get_content_type
+from guardian.utils import get_group_obj_perms_model, get_identity, get_user_obj_perms_model
+from core.clubes import campo_club
+
+
+TAMANO_LOTE_PERMISOS = 1000
+ACCIONES_POR_DEFECTO = ('view', 'change')
+
+
+# Caché por petición y usuario
+
+def obtener_verificador(usuario):
+    """Verificador de guardian asociado a la instancia del usuario, que vive lo mismo que la petición (request.user)"""
+    verificador = getattr(usuario, '_verificador_permisos', None)
+    if verificador is None:
+        verificador = ObjectPermissionChecker(usuario)
+        usuario._verificador_permisos = verificador  # pylint: disable=protected-access
+    return verificador
+
+def olvidar_verificador(usuario):
+    """Descarta los permisos cacheados en la instancia del usuario (tras modificarlos)"""
+    if hasattr(usuario, '_verificador_permisos'):
+        del usuario._verificador_permisos  # pylint: disable=protected-access
+
+def precargar_permisos(usuario, objetos):
+    """Trae en una sola consulta los permisos del usuario sobre todos los objetos dados (del mismo modelo)"""
+    objetos = list(objetos)
+    if objetos and usuario.is_authenticated:
+        obtener_verificador(usuario).prefetch_perms(objetos)
+
+
+class BackendPermisosObjetoCacheados(ObjectPermissionBackend):
+    """Backend de guardian que reutiliza un único verificador por usuario y petición, en vez de uno por comprobación"""
+
+    def has_perm(self, user_obj, perm, obj=None):
+        soportado, usuario = check_support(user_obj, obj)
+        if not soportado:
+            return False
+        # Las comprobaciones de app_label de guardian las delegamos en la clase base sólo si hace falta
+        if '.' in perm and perm.split('.', 1)[0] != obj._meta.app_label:
+            return super().has_perm(user_obj, perm, obj)
+        return obtener_verificador(usuario).has_perm(perm, obj)
+
+    def get_all_permissions(self, user_obj, obj=None):
+        soportado, usuario = check_support(user_obj, obj)
+        if not soportado:
+            return set()
+        return obtener_verificador(usuario).get_perms(obj)
+
+
+class ChangeListPermisosPrecargados(ChangeList):
+    """ChangeList que precarga los permisos de objeto de la página mostrada"""
+
+    def get_results(self, request):
+        super().get_results(request)
+        precargar_permisos(request.user, self.result_list)
+
+
+class PrecargaPermisosAdminMixin:
+    """Mixin para ModelAdmin que usa ChangeListPermisosPrecargados en los listados"""
+
+    def get_changelist(self, request, **kwargs):
+        return ChangeListPermisosPrecargados
+
+
+# Asignación y retirada masiva por club
+
+def modelos_de_club():
+    """Pares (modelo, campo) de los modelos de core que apuntan directamente a un club, incluido el propio Club"""
+    modelos = apps.get_app_config('core').get_models()
+    return [(modelo, campo_club(modelo)) for modelo in modelos if campo_club(modelo)]
+
+def _permisos_y_modelo(modelo, usuario_o_grupo, acciones):
+    """Permisos pedidos del modelo, modelo de permisos de guardian a usar y filtro de identidad"""
+    usuario, grupo = get_identity(usuario_o_grupo)
+    tipo_contenido = get_content_type(modelo)
+    codenames = [f'{accion}_{modelo._meta.model_name}' for accion in acciones]
+    permisos = list(Permission.objects.filter(content_type=tipo_contenido, codename__in=codenames))
+    if usuario:
+        return permisos, tipo_contenido, get_user_obj_perms_model(modelo), {'user': usuario}
+    return permisos, tipo_contenido, get_group_obj_perms_model(modelo), {'group': grupo}
+
+def asignar_permisos_club(club, usuario_o_grupo, acciones=ACCIONES_POR_DEFECTO):
+    """Concede a un usuario o grupo los permisos de las acciones dadas sobre todos los objetos de un club, con bulk_create"""
+    club = getattr(club, 'pk', club)
+    with transaction.atomic():
+        for modelo, campo in modelos_de_club():
+            permisos, tipo_contenido, modelo_permiso, identidad = _permisos_y_modelo(modelo, usuario_o_grupo, acciones)
+            claves = [str(pk) for pk in modelo.objects.filter(**{campo: club}).values_list('pk', flat=True).iterator()]
+            filas = [modelo_permiso(permission=permiso, content_type=tipo_contenido, object_pk=clave, **identidad) for permiso in permisos for clave in claves]
+            # La restricción única de guardian descarta los permisos que ya existían
+            modelo_permiso.objects.bulk_create(filas, batch_size=TAMANO_LOTE_PERMISOS, ignore_conflicts=True)
+    olvidar_verificador(usuario_o_grupo)
+
+def revocar_permisos_club(club, usuario_o_grupo, acciones=ACCIONES_POR_DEFECTO):
+    """Retira a un usuario o grupo los permisos de las acciones dadas sobre todos los objetos de un club"""
+    club = getattr(club, 'pk', club)
+    borrados = 0
+    with transaction.atomic():
+        for modelo, campo in modelos_de_club():
+            permisos, tipo_contenido, modelo_permiso, identidad = _permisos_y_modelo(modelo, usuario_o_grupo, acciones)
+            # object_pk es texto: comparamos con una subconsulta de claves convertidas, sin traerlas a Python
+            claves = modelo.objects.filter(**{campo: club}).annotate(clave_texto=Cast('pk', CharField())).values('clave_texto')
+            borrados += modelo_permiso.objects.filter(permission__in=permisos, content_type=tipo_contenido, object_pk__in=claves, **identidad).delete()[0]
+    olvidar_verificador(usuario_o_grupo)
+    return borrados
@@ -0,0 +1,193 @@
+"""Vistas previas de los planos de instalaciones: imagen acotada y pirámide de teselas, generadas en segundo plano"""
+
+import io
+import json
+import logging
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import BrokenExecutor
+from pathlib import Path, PurePosixPath
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+from core.miniaturas import CARPETA_MINIATURAS, FALLIDA, SEGUNDOS_REINTENTO_FALLIDAS, resumen_contenido
+from core.trabajos import obtener_pool
+
+# Dependencias opcionales para rasterizar cada formato de plano (en requirements.txt): sin ellas, esos planos no tienen vista previa
+try:
+    import cairosvg
+except (ImportError, OSError):  # OSError: instalado, pero falta la biblioteca cairo del sistema
+    cairosvg = None
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+try:
+    import ezdxf
+    from ezdxf.addons.drawing import matplotlib as ezdxf_matplotlib
+except ImportError:
+    ezdxf = None
+
+
+logger = logging.getLogger(__name__)
+
+CARPETA_VISTAS_PLANOS = f'{CARPETA_MINIATURAS}/planos'
+LADO_MAXIMO_VISTA = 1600
+# La pirámide se genera desde una imagen de como mucho 4096 px de lado (48 MB en RGB por trabajo)
+LADO_MAXIMO_PIRAMIDE = 4096
+# PNG no se puede decodificar por partes: los más grandes se rechazan en vez de ocupar cientos de MB (40 Mpx = 120 MB en RGB)
+MAXIMO_PIXELES_PNG = 40_000_000
+TAMANO_TESELA = 256
+FORMATO_VISTA = 'webp'
+
+_pendientes = set()
+
+
+# Rasterizadores por extensión: leen el plano desde su ruta en disco y devuelven una imagen PIL (o None)
+
+def _rasterizar_png(ruta, lado):
+    """PNG: se comprueba el tamaño en la cabecera antes de decodificar y se reduce por factores enteros antes de remuestrear"""
+    with Image.open(ruta) as imagen:
+        if imagen.width * imagen.height > MAXIMO_PIXELES_PNG:
+            raise ValueError(f'Plano de {imagen.width}x{imagen.height} px: el máximo es {MAXIMO_PIXELES_PNG} píxeles')
+        imagen.draft('RGB', (lado, lado))
+        imagen.thumbnail((lado, lado), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        return imagen.convert('RGB')
+
+def _rasterizar_svg(ruta, lado):
+    """SVG: requiere cairosvg"""
+    if cairosvg is None:
+        return None
+    return Image.open(io.BytesIO(cairosvg.svg2png(url=str(ruta), output_width=lado))).convert('RGB')
+
+def _rasterizar_pdf(ruta, lado):
+    """PDF (primera página): con pypdfium2 si está instalado o, si no, con pdftoppm de poppler"""
+    if pypdfium2 is not None:
+        documento = pypdfium2.PdfDocument(str(ruta))
+        try:
+            pagina = documento[0]
+            return pagina.render(scale=lado / max(pagina.get_size())).to_pil().convert('RGB')
+        finally:
+            documento.close()
+    if shutil.which('pdftoppm'):
+        with tempfile.TemporaryDirectory() as carpeta:
+            salida = Path(carpeta) / 'pagina'
+            subprocess.run(['pdftoppm', '-png', '-singlefile', '-f', '1', '-l', '1', '-scale-to', str(lado), str(ruta), str(salida)], check=True, capture_output=True)
+            with Image.open(f'{salida}.png') as imagen:
+                return imagen.convert('RGB')
+    return None
+
+def _rasterizar_dxf(ruta, lado):
+    """DXF: requiere ezdxf (con matplotlib)"""
+    if ezdxf is None:
+        return None
+    with tempfile.TemporaryDirectory() as carpeta:
+        salida = Path(carpeta) / 'plano.png'
+        ezdxf_matplotlib.qsave(ezdxf.readfile(str(ruta)).modelspace(), str(salida), bg='#FFFFFF', dpi=300)
+        return _rasterizar_png(salida, lado)
+
+# Los DWG necesitan un conversor propietario, así que no tienen vista previa
+RASTERIZADORES = {
+    '.png': _rasterizar_png,
+    '.svg': _rasterizar_svg,
+    '.pdf': _rasterizar_pdf,
+    '.dxf': _rasterizar_dxf,
+}
+
+
+def clave_cache_planos(nombre):
+    """Clave de caché que guarda el resumen SHA-256 de un plano cuya vista previa ya existe (o la marca de fallida)"""
+    return f'planos:{nombre}'
+
+def tiene_rasterizador(nombre):
+    """¿Admite vista previa el formato del plano? (los DWG necesitan un conversor propietario y nunca la tienen)"""
+    return PurePosixPath(nombre).suffix.lower() in RASTERIZADORES
+
+def carpeta_vista_plano(resumen):
+    """Carpeta (dentro de MEDIA_ROOT) con la vista previa, las teselas y el manifiesto de un plano"""
+    return f'{CARPETA_VISTAS_PLANOS}/{resumen[:2]}/{resumen}'
+
+def _guardar_imagen(nombre, imagen):
+    """Guarda una imagen PIL en el almacenamiento en el formato de las vistas"""
+    salida = io.BytesIO()
+    imagen.save(salida, FORMATO_VISTA.upper(), quality=80)
+    default_storage.save(nombre, ContentFile(salida.getvalue()))
+
+def _generar_piramide(carpeta, imagen):
+    """Teselas de TAMANO_TESELA px por niveles (0 = resolución completa, cada nivel la mitad que el anterior)"""
+    nivel = 0
+    while True:
+        ancho, alto = imagen.size
+        for x in range(0, ancho, TAMANO_TESELA):
+            for y in range(0, alto, TAMANO_TESELA):
+                tesela = imagen.crop((x, y, min(x + TAMANO_TESELA, ancho), min(y + TAMANO_TESELA, alto)))
+                _guardar_imagen(f'{carpeta}/{nivel}/{x // TAMANO_TESELA}_{y // TAMANO_TESELA}.{FORMATO_VISTA}', tesela)
+        if max(ancho, alto) <= TAMANO_TESELA:
+            return nivel + 1
+        imagen = imagen.resize((max(1, ancho // 2), max(1, alto // 2)), Image.Resampling.LANCZOS)
+        nivel += 1
+
+def generar_vista_plano(nombre):
+    """Genera (si no existen ya) la vista previa y la pirámide de teselas de un plano; devuelve (nombre, resumen o None)"""
+    if not tiene_rasterizador(nombre):
+        return nombre, None
+    rasterizador = RASTERIZADORES[PurePosixPath(nombre).suffix.lower()]
+    resumen = resumen_contenido(nombre)
+    carpeta = carpeta_vista_plano(resumen)
+    if default_storage.exists(f'{carpeta}/manifiesto.json'):
+        return nombre, resumen
+    imagen = rasterizador(default_storage.path(nombre), LADO_MAXIMO_PIRAMIDE)
+    if imagen is None:
+        logger.info('Sin rasterizador disponible para el plano %s', nombre)
+        return nombre, None
+    vista = imagen.copy()
+    vista.thumbnail((LADO_MAXIMO_VISTA, LADO_MAXIMO_VISTA), Image.Resampling.LANCZOS)
+    _guardar_imagen(f'{carpeta}/vista.{FORMATO_VISTA}', vista)
+    niveles = _generar_piramide(carpeta, imagen)
+    # El manifiesto se escribe el último: su existencia indica que la vista está completa
+    manifiesto = {'ancho': imagen.width, 'alto': imagen.height, 'tesela': TAMANO_TESELA, 'niveles': niveles, 'formato': FORMATO_VISTA}
+    default_storage.save(f'{carpeta}/manifiesto.json', ContentFile(json.dumps(manifiesto).encode()))
+    return nombre, resumen
+
+def anotar_resultado(futuro, nombre):
+    """Anota en la caché el resumen del plano cuya vista previa se ha generado, o la marca de fallida; devuelve el resumen o None"""
+    if futuro.exception() is not None:
+        logger.warning('No se pudo generar la vista previa del plano %s', nombre, exc_info=futuro.exception())
+        if not isinstance(futuro.exception(), BrokenExecutor):
+            cache.set(clave_cache_planos(nombre), FALLIDA, timeout=SEGUNDOS_REINTENTO_FALLIDAS)
+        return None
+    _, resumen = futuro.result()
+    # Sin resumen falta la dependencia opcional del formato: se reintenta pasado un tiempo, por si se instala
+    cache.set(clave_cache_planos(nombre), resumen or FALLIDA, timeout=None if resumen else SEGUNDOS_REINTENTO_FALLIDAS)
+    return resumen
+
+def _al_terminar(futuro, nombre):
+    """Anota el resultado de un trabajo del pool y deja de considerarlo en curso"""
+    _pendientes.discard(nombre)
+    anotar_resultado(futuro, nombre)
+
+def encolar_vista_plano(nombre):
+    """Encarga al pool la vista previa de un plano, si su formato la admite y no está ya hecha, en curso o fallida hace poco"""
+    if not nombre or not tiene_rasterizador(nombre) or nombre in _pendientes or cache.get(clave_cache_planos(nombre)) is not None:
+        return
+    _pendientes.add(nombre)
+    futuro = obtener_pool().submit(generar_vista_plano, nombre)
+    futuro.add_done_callback(lambda futuro: _al_terminar(futuro, nombre))
+
+def url_vista_plano(campo):
+    """URL de la vista previa acotada de un plano ('' mientras se genera o si su formato no la admite)"""
+    if not campo:
+        return ''
+    resumen = cache.get(clave_cache_planos(campo.name))
+    if resumen is None:
+        encolar_vista_plano(campo.name)
+    elif resumen != FALLIDA:
+        return default_storage.url(f'{carpeta_vista_plano(resumen)}/vista.{FORMATO_VISTA}')
+    return ''
+
+def url_manifiesto_plano(campo):
+    """URL del manifiesto JSON de la pirámide de teselas (las teselas están en <carpeta>/<nivel>/<x>_<y>.webp)"""
+    resumen = cache.get(clave_cache_planos(campo.name)) if campo else None
+    return default_storage.url(f'{carpeta_vista_plano(resumen)}/manifiesto.json') if resumen and resumen != FALLIDA else ''
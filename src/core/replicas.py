@@ -0,0 +1,126 @@
+"""Envío de lecturas a la réplica de la base de datos: router, vistas designadas y primaria fija tras escribir"""
+
+import contextvars
+import time
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+ALIAS_REPLICA = 'replica'
+COOKIE_PRIMARIA = 'picklefree_primaria'
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS')
+
+# Modelos de sólo consulta en las páginas públicas, que toleran el retraso de la réplica en cualquier vista
+MODELOS_EN_REPLICA = {
+    'core.enfrentamiento',
+    'core.rankingjugadorclub',
+    'core.rankingjugadortorneo',
+    'core.rankingparejaclub',
+    'core.rankingparejatorneo',
+    'core.rating',
+}
+
+
+class EstadoLectura:
+    """Cómo se enrutan las lecturas de la petición en curso"""
+
+    def __init__(self, primaria=False):
+        self.primaria = primaria  # todas las lecturas a la primaria (petición que escribe o escribió hace poco)
+        self.vista = False        # la vista está designada para leer de la réplica
+        self.escrito = False      # se ha escrito algo en esta petición
+
+_estado = contextvars.ContextVar('estado_lectura', default=None)
+
+
+def replica_configurada():
+    """Indica si hay un alias de réplica en DATABASES"""
+    return ALIAS_REPLICA in settings.DATABASES
+
+def leer_de_replica(vista):
+    """Decorador que designa una vista de función para leer de la réplica (en las vistas de clase, leer_de_replica = True)"""
+    vista.leer_de_replica = True
+    return vista
+
+def _designada(vista):
+    """Indica si una vista (de función o generada con as_view()) está designada para leer de la réplica"""
+    return getattr(vista, 'leer_de_replica', False) or getattr(getattr(vista, 'view_class', None), 'leer_de_replica', False)
+
+def primaria_hasta(request):
+    """Instante hasta el que la petición debe leer de la primaria según su cookie (0 si no la trae o no es válida)"""
+    try:
+        return float(request.COOKIES.get(COOKIE_PRIMARIA) or 0)
+    except ValueError:
+        return 0
+
+def _con_estado(contenido, estado):
+    """Itera un contenido en streaming restableciendo el estado de lectura, que ya no está activo al consumirlo"""
+    iterador = iter(contenido)
+    while True:
+        token = _estado.set(estado)
+        try:
+            trozo = next(iterador)
+        except StopIteration:
+            return
+        finally:
+            _estado.reset(token)
+        yield trozo
+
+
+class RouterReplica:
+    """Router que lee de la réplica en las peticiones de consulta (para MODELOS_EN_REPLICA o en vistas designadas) y escribe en la primaria"""
+
+    def db_for_read(self, model, **hints):
+        if not replica_configurada():
+            return None
+        estado = _estado.get()
+        if estado is None or estado.primaria or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if estado.vista or model._meta.label_lower in MODELOS_EN_REPLICA:
+            return ALIAS_REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        estado = _estado.get()
+        if estado is not None:
+            # A partir de aquí la petición lee lo que acaba de escribir, y las siguientes del mismo navegador también
+            estado.primaria = estado.escrito = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, ALIAS_REPLICA}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == ALIAS_REPLICA:
+            return False
+        return None
+
+
+class LecturaReplicaMiddleware:
+    """Middleware que decide por petición si se puede leer de la réplica y fija la primaria durante un tiempo tras escribir"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.retraso = getattr(settings, 'REPLICA_RETRASO_MAXIMO', 10)
+
+    def __call__(self, request):
+        if not replica_configurada():
+            return self.get_response(request)
+        reciente = primaria_hasta(request) > time.time()
+        estado = EstadoLectura(primaria=reciente or request.method not in METODOS_SEGUROS)
+        token = _estado.set(estado)
+        try:
+            response = self.get_response(request)
+        finally:
+            _estado.reset(token)
+        if estado.escrito:
+            response.set_cookie(COOKIE_PRIMARIA, str(time.time() + self.retraso), max_age=self.retraso, httponly=True, samesite='Lax')
+        if response.streaming and not response.is_async:
+            response.streaming_content = _con_estado(response.streaming_content, estado)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        estado = _estado.get()
+        if estado is not None and _designada(view_func):
+            estado.vista = True
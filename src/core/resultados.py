@@ -0,0 +1,233 @@
+"""Confirmación de resultados escaneando el QR de confirmación del partido, y suma incremental del partido a los rankings"""
+
+import hashlib
+import logging
+import re
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+from core.models import (Club, Configuracion, ConfirmacionResultado, PartidoDobles, PartidoIndividual, RankingJugadorClub, RankingJugadorTorneo,
+                         RankingParejaClub, RankingParejaTorneo, TorneoDobles, TorneoIndividual)
+from core.perfiles import invalidar_perfiles, jugadores_afectados
+from core.trabajos import obtener_pool
+
+
+# Claves de los estados en el fixture estado_partido.json
+ESTADO_POR_JUGAR = 1
+ESTADO_JUGADO = 2
+
+# Por tipo de partido: modelo, campo en ConfirmacionResultado, participantes, torneo y rankings de torneo y de club
+PARTIDOS = {
+    'individual': {
+        'modelo': PartidoIndividual, 'confirmacion': 'id_partido_individual', 'local': 'id_jugador_local', 'visitante': 'id_jugador_visitante',
+        'torneo': 'id_torneo_individual', 'modelo_torneo': TorneoIndividual, 'participante': 'id_jugador',
+        'ranking_torneo': RankingJugadorTorneo, 'ranking_club': RankingJugadorClub,
+    },
+    'dobles': {
+        'modelo': PartidoDobles, 'confirmacion': 'id_partido_dobles', 'local': 'id_pareja_local', 'visitante': 'id_pareja_visitante',
+        'torneo': 'id_torneo_dobles', 'modelo_torneo': TorneoDobles, 'participante': 'id_pareja',
+        'ranking_torneo': RankingParejaTorneo, 'ranking_club': RankingParejaClub,
+    },
+}
+
+RE_JUEGO = re.compile(r'^(\d+)-(\d+)(?:\(\d+\))?$')
+
+logger = logging.getLogger(__name__)
+
+
+class ErrorConfirmacion(Exception):
+    """Confirmación rechazada, con el código HTTP con el que responder"""
+
+    def __init__(self, mensaje, estado):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def gana_local(resultado):
+    """Indica si el resultado TODS ('11-7 9-11 11-8', tanteo del local primero) da la victoria al local"""
+    juegos = [RE_JUEGO.match(juego) for juego in resultado.split()]
+    if not juegos or not all(juegos):
+        raise ErrorConfirmacion(f'Resultado no válido: {resultado!r} (formato: 11-7 9-11 11-8)', 400)
+    ganados = sum(1 if int(juego[1]) > int(juego[2]) else -1 if int(juego[1]) < int(juego[2]) else 0 for juego in juegos)
+    if ganados == 0:
+        raise ErrorConfirmacion(f'El resultado {resultado!r} no tiene ganador', 400)
+    return ganados > 0
+
+def personas_lado(partido, tipo, lado):
+    """Personas que juegan en un lado del partido (el jugador, o los dos de la pareja)"""
+    participante = getattr(partido, PARTIDOS[tipo][lado])
+    if tipo == 'individual':
+        return {participante.id_persona_id}
+    return {participante.id_jugador_izquierdo.id_persona_id, participante.id_jugador_derecho.id_persona_id}
+
+def lado_de_persona(partido, tipo, persona):
+    """True si la persona juega como local, False si como visitante y None si no juega el partido"""
+    if persona in personas_lado(partido, tipo, 'local'):
+        return True
+    if persona in personas_lado(partido, tipo, 'visitante'):
+        return False
+    return None
+
+def relaciones_partido(tipo):
+    """select_related necesario para saber quién juega en cada lado"""
+    if tipo == 'individual':
+        return ['id_jugador_local', 'id_jugador_visitante']
+    return [f'{lado}__{jugador}' for lado in ('id_pareja_local', 'id_pareja_visitante') for jugador in ('id_jugador_izquierdo', 'id_jugador_derecho')]
+
+def version_partido(partido, confirmaciones):
+    """Versión del estado visible del partido (para If-Match): cambia con el estado, el resultado o cualquier confirmación"""
+    firma = [partido.id_estado_partido_id, partido.tods_resultado, *sorted((lado, c.tods_resultado) for lado, c in confirmaciones.items())]
+    return hashlib.md5(repr(firma).encode(), usedforsecurity=False).hexdigest()
+
+def datos_confirmacion(partido, tipo, confirmaciones):
+    """Estado del partido y de las confirmaciones de cada lado"""
+    return {
+        'tipo': tipo,
+        'id': partido.pk,
+        'estado': partido.id_estado_partido_id,
+        'resultado': partido.tods_resultado,
+        'confirmaciones': {'local': getattr(confirmaciones.get(True), 'tods_resultado', None),
+                           'visitante': getattr(confirmaciones.get(False), 'tods_resultado', None)},
+    }
+
+def obtener_partido(tipo, token, bloquear=False):
+    """Partido por su token de confirmación (bloqueando su fila si se va a modificar) y sus confirmaciones por lado"""
+    if tipo not in PARTIDOS:
+        raise ErrorConfirmacion(f'Tipo de partido desconocido: {tipo}', 404)
+    definicion = PARTIDOS[tipo]
+    partidos = definicion['modelo'].objects.select_related(*relaciones_partido(tipo))
+    if bloquear:
+        partidos = partidos.select_for_update(of=('self',))
+    partido = partidos.filter(token_qr_confirmacion=token).first()
+    if partido is None:
+        raise ErrorConfirmacion('Partido no encontrado', 404)
+    confirmaciones = {c.local: c for c in ConfirmacionResultado.objects.filter(**{definicion['confirmacion']: partido})}
+    return partido, confirmaciones
+
+def confirmar_resultado(tipo, token, persona, resultado, version=None):
+    """Registra el resultado que envía un lado; si coincide con el del otro, el partido pasa a jugado y se encargan los rankings"""
+    # Repetir el mismo envío no cambia nada y se acepta aunque su version (el ETag que vio el cliente) ya no sea la actual,
+    # pues el primer envío la cambió; cualquier otro envío con version se rechaza si algo cambió desde entonces
+    resultado = ' '.join(resultado.split())
+    local_gana = gana_local(resultado)
+    with transaction.atomic():
+        # El bloqueo de la fila del partido sólo dura esta transacción: serializa los dos lados si escanean a la vez
+        partido, confirmaciones = obtener_partido(tipo, token, bloquear=True)
+        definicion = PARTIDOS[tipo]
+        lado = lado_de_persona(partido, tipo, persona)
+        if lado is None:
+            raise ErrorConfirmacion('Sólo pueden confirmar el resultado quienes juegan el partido', 403)
+        jugado = partido.id_estado_partido_id == ESTADO_JUGADO
+        if (partido.tods_resultado == resultado if jugado else getattr(confirmaciones.get(lado), 'tods_resultado', None) == resultado):
+            return partido, confirmaciones
+        if version is not None and version != version_partido(partido, confirmaciones):
+            raise ErrorConfirmacion('El partido ha cambiado desde que se consultó', 412)
+        if jugado:
+            raise ErrorConfirmacion('El partido ya tiene otro resultado confirmado', 409)
+        if partido.id_estado_partido_id != ESTADO_POR_JUGAR:
+            raise ErrorConfirmacion('El partido no está pendiente de jugarse', 409)
+        propia = confirmaciones.get(lado)
+        if propia is None:
+            confirmaciones[lado] = ConfirmacionResultado.objects.create(
+                **{definicion['confirmacion']: partido}, local=lado, tods_resultado=resultado, id_persona_id=persona)
+        elif propia.tods_resultado != resultado:
+            propia.tods_resultado, propia.id_persona_id, propia.fecha_hora = resultado, persona, timezone.now()
+            propia.save(update_fields=['tods_resultado', 'id_persona', 'fecha_hora'])
+        otra = confirmaciones.get(not lado)
+        if otra is not None and otra.tods_resultado == resultado:
+            # Sin configuración de puntos los rankings no se podrían sumar: mejor rechazarlo ahora que dejarlo a medias
+            torneo = getattr(partido, f'{definicion["torneo"]}_id')
+            if torneo is not None and configuracion_puntos(club_del_torneo(tipo, torneo)) is None:
+                raise ErrorConfirmacion('No hay configuración de puntos activa para el club del torneo ni global', 503)
+            ganador = definicion['local'] if local_gana else definicion['visitante']
+            partido.tods_resultado = resultado
+            partido.id_estado_partido_id = ESTADO_JUGADO
+            partido.id_ganador_id = getattr(partido, f'{ganador}_id')
+            partido.save(update_fields=['tods_resultado', 'id_estado_partido', 'id_ganador'])
+            transaction.on_commit(lambda: encolar_rankings(tipo, partido.pk))
+    return partido, confirmaciones
+
+
+def _al_terminar(futuro, tipo, clave):
+    """Deja constancia de los rankings que no se pudieron actualizar"""
+    if futuro.exception() is not None:
+        logger.error('No se pudieron actualizar los rankings del partido %s %s', tipo, clave, exc_info=futuro.exception())
+
+def encolar_rankings(tipo, clave):
+    """Encarga al pool la suma del partido a los rankings"""
+    futuro = obtener_pool().submit(actualizar_rankings, tipo, clave)
+    futuro.add_done_callback(lambda futuro: _al_terminar(futuro, tipo, clave))
+
+def club_del_torneo(tipo, torneo):
+    """Clave del club que organiza un torneo"""
+    return PARTIDOS[tipo]['modelo_torneo'].objects.filter(pk=torneo).values_list('id_club', flat=True).first()
+
+def configuracion_puntos(club):
+    """Configuración de puntos activa del club o, si no tiene, la global"""
+    return (Configuracion.objects.filter(Q(id_club=club) | Q(id_club__isnull=True), activa=True)
+            .order_by(F('id_club').asc(nulls_last=True)).first())
+
+def sumar(modelo, filtro, periodo, valor, gano, puntos, hoy):
+    """Suma una victoria o derrota a la fila acumulada del periodo (creándola a partir de la anterior) y a las posteriores"""
+    incremento = {'victorias': F('victorias') + int(gano), 'derrotas': F('derrotas') + int(not gano), 'puntos': F('puntos') + puntos}
+    if not modelo.objects.filter(**filtro, **{periodo: valor}).update(**incremento):
+        anterior = modelo.objects.filter(**filtro, **{f'{periodo}__lt': valor}).order_by(f'-{periodo}').first()
+        acumulado = {campo: getattr(anterior, campo) if anterior else 0 for campo in ('victorias', 'empates', 'derrotas', 'puntos')}
+        modelo.objects.create(**filtro, **{periodo: valor, 'fecha': hoy, 'posicion': 0}, **{
+            **acumulado, 'victorias': acumulado['victorias'] + int(gano), 'derrotas': acumulado['derrotas'] + int(not gano),
+            'puntos': acumulado['puntos'] + puntos})
+    # Partido confirmado tarde: las filas acumuladas de periodos posteriores también lo incluyen
+    modelo.objects.filter(**filtro, **{f'{periodo}__gt': valor}).update(**incremento)
+
+def recolocar(modelo, grupo, participante, periodo, valor):
+    """Recalcula la posición de las filas del periodo, frente a la última fila hasta ese periodo de cada participante del grupo"""
+    ultima = (modelo.objects.filter(**grupo, **{participante: OuterRef(participante), f'{periodo}__lte': valor})
+              .order_by(f'-{periodo}').values(periodo)[:1])
+    filas = modelo.objects.filter(**grupo, **{periodo: Subquery(ultima)}).order_by('-puntos', '-victorias', 'derrotas', participante)
+    cambiadas = []
+    for posicion, fila in enumerate(filas, start=1):
+        if getattr(fila, periodo) == valor and fila.posicion != posicion:
+            fila.posicion = posicion
+            cambiadas.append(fila)
+    modelo.objects.bulk_update(cambiadas, ['posicion'])
+
+def actualizar_rankings(tipo, clave):
+    """Suma un partido confirmado de un torneo a los rankings del torneo y del club, una sola vez aunque se encargue varias"""
+    definicion = PARTIDOS[tipo]
+    with transaction.atomic():
+        # Marcar las confirmaciones como contabilizadas en la misma transacción que la suma impide contarlo dos veces
+        if not ConfirmacionResultado.objects.filter(**{definicion['confirmacion']: clave}, contabilizado=False).update(contabilizado=True):
+            return False
+        partido = definicion['modelo'].objects.get(pk=clave)
+        torneo_id = getattr(partido, f'{definicion["torneo"]}_id')
+        if torneo_id is None:
+            return True
+        # Los rankings de un torneo y de su club se actualizan de uno en uno: se bloquean el torneo y su club (siempre en ese orden)
+        torneo = definicion['modelo_torneo'].objects.select_for_update().only('id_club').get(pk=torneo_id)
+        list(Club.objects.select_for_update().filter(pk=torneo.id_club_id).values_list('pk'))
+        configuracion = configuracion_puntos(torneo.id_club_id)
+        if configuracion is None:
+            # Deshace también la marca de contabilizado: contabilizar_resultados lo sumará cuando haya configuración
+            raise Configuracion.DoesNotExist(f'Sin configuración de puntos activa para el club {torneo.id_club_id} ni global')
+        hoy = timezone.localdate()
+        ronda = partido.ronda_o_jornada or 0
+        participante = definicion['participante']
+        for lado in ('local', 'visitante'):
+            clave_participante = getattr(partido, f'{definicion[lado]}_id')
+            gano = clave_participante == partido.id_ganador_id
+            puntos = configuracion.puntos_victoria if gano else configuracion.puntos_derrota
+            sumar(definicion['ranking_torneo'], {f'{participante}_id': clave_participante, f'{definicion["torneo"]}_id': torneo_id},
+                  'ronda_o_jornada', ronda, gano, puntos, hoy)
+            sumar(definicion['ranking_club'], {f'{participante}_id': clave_participante, 'id_club_id': torneo.id_club_id}, 'fecha', hoy, gano, puntos, hoy)
+        recolocar(definicion['ranking_torneo'], {definicion['torneo']: torneo_id}, participante, 'ronda_o_jornada', ronda)
+        recolocar(definicion['ranking_club'], {'id_club': torneo.id_club_id}, participante, 'fecha', hoy)
+        # update() y bulk_update() no emiten señales: los perfiles (que muestran los rankings de club) se invalidan aquí
+        afectados = jugadores_afectados(partido)
+        transaction.on_commit(lambda: invalidar_perfiles(afectados))
+    return True
+
+def pendientes_de_contabilizar(tipo):
+    """Claves de los partidos jugados con confirmaciones aún sin sumar a los rankings (p. ej. si el trabajo del pool falló)"""
+    campo = PARTIDOS[tipo]['confirmacion']
+    return list(ConfirmacionResultado.objects.filter(contabilizado=False, **{f'{campo}__id_estado_partido': ESTADO_JUGADO})
+                .values_list(campo, flat=True).distinct().order_by(campo))
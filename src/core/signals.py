@@ -0,0 +1,187 @@
+"""Señales de core para mantener al día las tablas derivadas"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from djf_surveys.models import Answer, Question, Survey, UserAnswer
+from core.almacenamiento import actualizar_referencias, campos_fichero, modelos_con_ficheros
+from core.calendarios import MODELOS_CON_CALENDARIO, entidades_afectadas, marcar_cambio
+from core.clubes import invalidar_clubes_de_usuarios, modelos_con_clubes, usuarios_afectados
+from core.encuestas import anotar_cambio, confirmar_cambio, datos_pregunta, olvidar_pregunta, sumar_encuestado, sumar_respuesta
+from core.marcador import MODELOS_CON_MARCADOR, notificar_partido
+from core.miniaturas import encolar_miniaturas, modelos_con_foto
+from core.perfiles import MODELOS_CON_PERFIL, invalidar_perfiles, jugadores_afectados
+from core.particionado import crear_particiones_futuras
+from core.planos import encolar_vista_plano
+from core.models import Enfrentamiento, Instalacion, Pareja, PartidoDobles, PartidoIndividual
+
+
+@receiver(post_save, sender=PartidoIndividual)
+def sincronizar_enfrentamientos_individual(sender, instance, raw=False, **kwargs):
+    """Regenera los enfrentamientos de un partido individual al guardarlo"""
+    if not raw:
+        Enfrentamiento.objects.sincronizar_partido_individual(instance)
+
+@receiver(post_save, sender=PartidoDobles)
+def sincronizar_enfrentamientos_dobles(sender, instance, raw=False, **kwargs):
+    """Regenera los enfrentamientos de un partido de dobles al guardarlo"""
+    if not raw:
+        Enfrentamiento.objects.sincronizar_partido_dobles(instance)
+
+@receiver(post_save, sender=Pareja)
+def sincronizar_enfrentamientos_pareja(sender, instance, created=False, raw=False, **kwargs):
+    """Si cambian los miembros de una pareja, regenera los enfrentamientos de todos sus partidos"""
+    if raw or created:
+        return
+    partidos = PartidoDobles.objects.filter(pk__in=Enfrentamiento.objects.filter(id_pareja=instance, principal=True, representante=True).values('id_partido_dobles')).select_related('id_pareja_local', 'id_pareja_visitante')
+    with transaction.atomic():
+        for partido in partidos:
+            Enfrentamiento.objects.sincronizar_partido_dobles(partido)
+
+def anotar_usuarios_clubes(sender, instance, raw=False, **kwargs):
+    """Antes de guardar o borrar, anota los usuarios que dependían de la fila (por si el cambio los desvincula)"""
+    if not raw:
+        instance._usuarios_clubes = usuarios_afectados(sender, instance.pk)  # pylint: disable=protected-access
+
+def invalidar_clubes(sender, instance, raw=False, **kwargs):
+    """Un cambio en la cadena Persona → Directivo/Técnico → Mandato/Contrato invalida los clubes cacheados de sus usuarios, antes y después"""
+    if not raw:
+        usuarios = getattr(instance, '_usuarios_clubes', set()) | usuarios_afectados(sender, instance.pk)
+        if usuarios:
+            transaction.on_commit(lambda: invalidar_clubes_de_usuarios(usuarios))
+
+for modelo_con_clubes in modelos_con_clubes():
+    pre_save.connect(anotar_usuarios_clubes, sender=modelo_con_clubes, dispatch_uid=f'clubes_previos_{modelo_con_clubes.__name__}')
+    pre_delete.connect(anotar_usuarios_clubes, sender=modelo_con_clubes, dispatch_uid=f'clubes_previos_borrado_{modelo_con_clubes.__name__}')
+    post_save.connect(invalidar_clubes, sender=modelo_con_clubes, dispatch_uid=f'clubes_{modelo_con_clubes.__name__}')
+    post_delete.connect(invalidar_clubes, sender=modelo_con_clubes, dispatch_uid=f'clubes_borrado_{modelo_con_clubes.__name__}')
+
+def encolar_miniaturas_foto(sender, instance, raw=False, **kwargs):
+    """Tras guardar un objeto con foto, encarga sus miniaturas una vez confirmada la transacción"""
+    if not raw and instance.foto:
+        transaction.on_commit(lambda: encolar_miniaturas(instance.foto.name))
+
+for modelo_con_foto in modelos_con_foto():
+    post_save.connect(encolar_miniaturas_foto, sender=modelo_con_foto, dispatch_uid=f'miniaturas_{modelo_con_foto.__name__}')
+
+# Recuento de referencias de los blobs: sólo cambia cuando el fichero de una fila pasa de verdad de un nombre a otro
+
+def anotar_ficheros_previos(sender, instance, raw=False, **kwargs):
+    """Antes de guardar una fila existente, anota los ficheros que tiene ahora en la base de datos"""
+    instance._ficheros_previos = {}  # pylint: disable=protected-access
+    if not raw and not instance._state.adding and instance.pk is not None:  # pylint: disable=protected-access
+        previos = sender._base_manager.filter(pk=instance.pk).values(*(campo.attname for campo in campos_fichero(sender))).first()
+        instance._ficheros_previos = previos or {}  # pylint: disable=protected-access
+
+def contar_referencias_ficheros(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Tras guardar, resta la referencia de cada fichero sustituido y suma la del nuevo"""
+    if raw:
+        return
+    previos = getattr(instance, '_ficheros_previos', {})
+    for campo in campos_fichero(sender):
+        if update_fields is None or campo.name in update_fields:
+            actualizar_referencias(previos.get(campo.attname) or '', getattr(instance, campo.attname).name or '')
+
+def descontar_referencias_ficheros(sender, instance, **kwargs):
+    """Tras borrar una fila, resta la referencia de cada uno de sus ficheros"""
+    for campo in campos_fichero(sender):
+        actualizar_referencias(getattr(instance, campo.attname).name or '', '')
+
+for modelo_con_ficheros in modelos_con_ficheros():
+    pre_save.connect(anotar_ficheros_previos, sender=modelo_con_ficheros, dispatch_uid=f'ficheros_previos_{modelo_con_ficheros._meta.label}')
+    post_save.connect(contar_referencias_ficheros, sender=modelo_con_ficheros, dispatch_uid=f'ficheros_{modelo_con_ficheros._meta.label}')
+    post_delete.connect(descontar_referencias_ficheros, sender=modelo_con_ficheros, dispatch_uid=f'ficheros_borrado_{modelo_con_ficheros._meta.label}')
+
+@receiver(post_save, sender=Instalacion)
+def encolar_vista_plano_instalacion(sender, instance, raw=False, **kwargs):
+    """Tras guardar una instalación con plano, encarga su vista previa una vez confirmada la transacción"""
+    if not raw and instance.plano:
+        transaction.on_commit(lambda: encolar_vista_plano(instance.plano.name))
+
+
+# Resúmenes de encuestas: cada cambio se anota dentro de su transacción y, al confirmarse, las altas se suman al resumen
+# cacheado y cualquier otro cambio lo invalida
+
+@receiver(post_save, sender=UserAnswer)
+def sumar_encuestado_resumen(sender, instance, created=False, raw=False, **kwargs):
+    """Cuenta un nuevo encuestado en el resumen de su encuesta"""
+    if created and not raw:
+        anotar_cambio(instance.survey_id)
+        transaction.on_commit(lambda: sumar_encuestado(instance.survey_id))
+
+@receiver(post_save, sender=Answer)
+def sumar_respuesta_resumen(sender, instance, created=False, raw=False, **kwargs):
+    """Suma una respuesta nueva al resumen de su encuesta; si se ha editado una existente, lo invalida"""
+    datos = None if raw else datos_pregunta(instance.question_id)
+    if datos is None:
+        return
+    id_encuesta, tipo = datos
+    anotar_cambio(id_encuesta)
+    if created:
+        transaction.on_commit(lambda: sumar_respuesta(id_encuesta, instance.question_id, tipo, instance.value))
+    else:
+        transaction.on_commit(lambda: confirmar_cambio(id_encuesta))
+
+@receiver(post_delete, sender=Answer)
+def invalidar_resumen_respuesta(sender, instance, **kwargs):
+    """Invalida el resumen de la encuesta de una respuesta borrada"""
+    datos = datos_pregunta(instance.question_id)
+    if datos is not None:
+        anotar_cambio(datos[0])
+        transaction.on_commit(lambda: confirmar_cambio(datos[0]))
+
+@receiver(post_delete, sender=UserAnswer)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidar_resumen_encuesta(sender, instance, **kwargs):
+    """Invalida el resumen de la encuesta al borrar un encuestado o cambiar sus preguntas"""
+    if sender is Question:
+        olvidar_pregunta(instance.pk)
+    anotar_cambio(instance.survey_id)
+    transaction.on_commit(lambda: confirmar_cambio(instance.survey_id))
+
+@receiver(post_delete, sender=Survey)
+def invalidar_resumen_encuesta_borrada(sender, instance, **kwargs):
+    """Descarta el resumen de una encuesta borrada"""
+    anotar_cambio(instance.pk)
+    transaction.on_commit(lambda: confirmar_cambio(instance.pk))
+
+# Calendarios iCalendar: al confirmar cada cambio se actualiza la marca de las entidades afectadas
+
+def marcar_calendarios(sender, instance, raw=False, **kwargs):
+    """Marca como modificados los calendarios afectados por el cambio, cuando se confirme la transacción"""
+    if not raw:
+        entidades = entidades_afectadas(instance)
+        transaction.on_commit(lambda: marcar_cambio(entidades))
+
+for modelo_con_calendario in MODELOS_CON_CALENDARIO:
+    post_save.connect(marcar_calendarios, sender=modelo_con_calendario, dispatch_uid=f'calendarios_{modelo_con_calendario.__name__}')
+    post_delete.connect(marcar_calendarios, sender=modelo_con_calendario, dispatch_uid=f'calendarios_borrado_{modelo_con_calendario.__name__}')
+
+# Perfiles de jugador: al confirmar cada cambio se descartan los perfiles cacheados de los jugadores afectados
+
+def invalidar_perfiles_afectados(sender, instance, raw=False, **kwargs):
+    """Descarta los perfiles de los jugadores afectados por el cambio, cuando se confirme la transacción"""
+    if not raw:
+        jugadores = jugadores_afectados(instance)
+        transaction.on_commit(lambda: invalidar_perfiles(jugadores))
+
+for modelo_con_perfil in MODELOS_CON_PERFIL:
+    post_save.connect(invalidar_perfiles_afectados, sender=modelo_con_perfil, dispatch_uid=f'perfiles_{modelo_con_perfil.__name__}')
+    post_delete.connect(invalidar_perfiles_afectados, sender=modelo_con_perfil, dispatch_uid=f'perfiles_borrado_{modelo_con_perfil.__name__}')
+
+# Marcador en directo: cada partido guardado se publica por NOTIFY, que PostgreSQL entrega al confirmar la transacción
+
+def publicar_marcador(sender, instance, raw=False, using='default', **kwargs):
+    """Publica el estado del partido para los espectadores del marcador en directo"""
+    if not raw:
+        notificar_partido(instance, using)
+
+for modelo_con_marcador in MODELOS_CON_MARCADOR.values():
+    post_save.connect(publicar_marcador, sender=modelo_con_marcador, dispatch_uid=f'marcador_{modelo_con_marcador.__name__}')
+
+@receiver(post_migrate)
+def crear_particiones_tras_migrar(sender, using='default', **kwargs):
+    """Tras migrar core, crea las particiones futuras que falten en las tablas particionadas"""
+    if sender.name == 'core':
+        crear_particiones_futuras(using)
@@ -0,0 +1,17 @@
+"""Etiquetas de plantilla para usar las miniaturas de las fotos"""
+
+from django import template
+from core.miniaturas import srcset_miniatura, url_miniatura
+
+register = template.Library()
+
+
+@register.simple_tag
+def miniatura(campo, tamano='mediana', formato='webp'):
+    """URL de la miniatura del tamaño pedido: {% miniatura club.foto 'pequena' %}"""
+    return url_miniatura(campo, tamano, formato)
+
+@register.simple_tag
+def srcset(campo, formato='webp'):
+    """Valor del atributo srcset para que el navegador elija el tamaño: <img srcset="{% srcset club.foto %}" ...>"""
+    return srcset_miniatura(campo, formato)
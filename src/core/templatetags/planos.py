@@ -0,0 +1,17 @@
+"""Etiquetas de plantilla para mostrar las vistas previas de los planos"""
+
+from django import template
+from core.planos import url_manifiesto_plano, url_vista_plano
+
+register = template.Library()
+
+
+@register.simple_tag
+def vista_plano(campo):
+    """URL de la vista previa acotada de un plano: {% vista_plano instalacion.plano %}"""
+    return url_vista_plano(campo)
+
+@register.simple_tag
+def manifiesto_plano(campo):
+    """URL del manifiesto de teselas para un visor con zoom: {% manifiesto_plano instalacion.plano %}"""
+    return url_manifiesto_plano(campo)
@@ -1,3 +1,1528 @@
-from django.test import TestCase
+"""Pruebas de core"""
 
-# Create your tests here.
+import csv
+import datetime
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from unittest import mock, skipIf
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, Permission, User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from djf_surveys.models import TYPE_FIELD, Answer, Question, Survey, UserAnswer
+from guardian.models import UserObjectPermission
+from PIL import Image
+from core import exportacion, miniaturas, planos
+from core.almacenamiento import CARPETA_BLOBS
+from core.api import codificar_cursor
+from core.calendarios import _escapar, _linea
+from core.carga_masiva import cargar_filas, cargar_fixtures, reiniciar_secuencias, siguiente_clave
+from core.clubes import RUTAS_CLUB, rutas_club
+from core.datos_sinteticos import GeneradorDatos, volumenes
+from core.duplicados import claves_bloque, detectar_duplicados, ficha_persona, puntuar, roles_repetidos
+from core.encuestas import calcular_resumen, clave_cache_resumen, datos_pregunta, invalidar_resumen, media, resumen_encuesta
+from core.exportacion import SIN_USUARIO, exportar_csv, exportar_parquet, filas_encuestados
+from core.instrumentacion import InstrumentacionConsultasMiddleware, Metricas, RegistroConsultas, huella
+from core.management.commands.auditar_indices import indices_redundantes
+from core.marcador import clave_suscripcion
+from core.models import (ArchivoAlmacenado, Categoria, Club, ConfirmacionResultado, Configuracion, Directivo, Enfrentamiento, Instalacion, Jugador,
+                         Mandato, Pareja, PartidoDobles, PartidoIndividual, Persona, Pertenencia, Pista, Posesion, Provincia, RankingJugadorClub,
+                         ReservaClub, ReservaJugador, Tecnico, TipoSexo, TorneoIndividual, nuevo_token_qr)
+from core.paginadores import UMBRAL_CONTEO_ESTIMADO, PaginadorEstimado, filas_estimadas
+from core.particionado import (ParticionarPorRango, archivar_particiones, crear_particiones, esta_particionada, inicio_periodo, particionar_tabla,
+                               particiones, restricciones_debilitadas, siguiente_periodo)
+from core.permisos import asignar_permisos_club, precargar_permisos, revocar_permisos_club
+from core.replicas import ALIAS_REPLICA, COOKIE_PRIMARIA, EstadoLectura, LecturaReplicaMiddleware, RouterReplica, _estado, leer_de_replica
+from core.resultados import (ESTADO_JUGADO, ESTADO_POR_JUGAR, ErrorConfirmacion, actualizar_rankings, confirmar_resultado, gana_local,
+                             obtener_partido, version_partido)
+from core.views import autorizado_metricas
+
+
+FIXTURES_BASICOS = ['provincia', 'tipo_identificacion', 'tipo_sexo', 'tipo_lateralidad', 'estado_partido', 'tipo_titulacion', 'tipo_competicion',
+                    'configuracion']
+DIRECCION = {'direccion_calle_num': 'Calle Mayor 1', 'direccion_localidad': 'Logroño', 'direccion_codigopostal': '26001',
+             'direccion_provincia_id': 26, 'direccion_pais': 'ES'}
+
+
+def crear_persona(numero, **campos):
+    """Persona de prueba con datos únicos derivados de un número"""
+    return Persona.objects.create(**{
+        'id_tipo_identificacion_id': 1, 'docidentidad_valor': f'{numero:08d}T', 'nombre': 'Lucía', 'apellido_primero': 'García',
+        'id_tipo_sexo_id': 2, 'nacimiento_pais': 'ES', 'email': f'persona{numero}@prueba.test', 'telefono_movil': f'+3460000{numero:04d}',
+        **DIRECCION, **campos})
+
+def crear_jugador(numero):
+    """Jugador de prueba (con su persona)"""
+    return Jugador.objects.create(id_persona=crear_persona(numero), id_tipo_lateralidad_id=1)
+
+def crear_club(numero):
+    """Club de prueba"""
+    return Club.objects.create(nombre=f'Club {numero}', email=f'club{numero}@prueba.test', **DIRECCION)
+
+def crear_torneo(club):
+    """Torneo individual de prueba de un club"""
+    hoy = timezone.localdate()
+    instalacion = Instalacion.objects.create(nombre=f'Instalación de {club.nombre}', email=f'instalacion{club.pk}@prueba.test', **DIRECCION)
+    director = Tecnico.objects.create(id_persona=crear_persona(9000 + club.pk), id_tipo_titulacion_id=1)
+    return TorneoIndividual.objects.create(
+        id_club=club, id_director=director, id_instalacion=instalacion, id_categoria=Categoria.objects.create(nombre='Absoluta'),
+        nombre='Torneo de prueba', id_tipo_competicion_id=1, rondas_o_jornadas=3, torneo_inicio=hoy, torneo_fin=hoy,
+        inscripcion_inicio=hoy, inscripcion_fin=hoy, aforo_minimo=2, aforo_maximo=16)
+
+def crear_pareja(izquierdo, derecho):
+    """Pareja de prueba de dos jugadores"""
+    return Pareja.objects.create(id_jugador_izquierdo=izquierdo, id_jugador_derecho=derecho, nombre=f'Pareja {izquierdo.pk}-{derecho.pk}')
+
+def crear_partido_individual(local, visitante, **campos):
+    """Partido individual pendiente, que de momento gana el local"""
+    return PartidoIndividual.objects.create(**{
+        'id_jugador_local': local, 'id_jugador_visitante': visitante, 'id_ganador': local, 'id_estado_partido_id': ESTADO_POR_JUGAR,
+        'fecha_hora': timezone.now(), 'tods_formato': 'SET3-S:11/TB', **campos})
+
+def crear_partido_dobles(local, visitante, **campos):
+    """Partido de dobles pendiente, que de momento gana la pareja local"""
+    return PartidoDobles.objects.create(**{
+        'id_pareja_local': local, 'id_pareja_visitante': visitante, 'id_ganador': local, 'id_estado_partido_id': ESTADO_POR_JUGAR,
+        'fecha_hora': timezone.now(), 'tods_formato': 'SET3-S:11/TB', **campos})
+
+
+# Enfrentamientos (core/managers.py y core/signals.py)
+
+class SincronizarEnfrentamientosTests(TestCase):
+    """Las señales mantienen la tabla de enfrentamientos al guardar partidos y parejas"""
+    fixtures = FIXTURES_BASICOS
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.a, cls.b, cls.c, cls.d, cls.e = (crear_jugador(numero) for numero in range(1, 6))
+
+    def test_partido_individual(self):
+        partido = crear_partido_individual(self.a, self.b)
+        filas = set(Enfrentamiento.objects.filter(id_partido_individual=partido).values_list('id_jugador', 'id_rival', 'local', 'ganador'))
+        self.assertEqual(filas, {(self.a.pk, self.b.pk, True, True), (self.b.pk, self.a.pk, False, False)})
+        partido.id_ganador = self.b
+        partido.save()
+        self.assertEqual(list(Enfrentamiento.objects.filter(id_partido_individual=partido, ganador=True).values_list('id_jugador', flat=True)),
+                         [self.b.pk])
+        self.assertEqual(Enfrentamiento.objects.filter(id_partido_individual=partido).count(), 2)
+
+    def test_historial_y_cara_a_cara(self):
+        primero = crear_partido_individual(self.a, self.b, fecha_hora=timezone.now() - datetime.timedelta(days=1))
+        segundo = crear_partido_individual(self.c, self.a)
+        crear_partido_individual(self.b, self.c)
+        self.assertEqual([fila.id_partido_individual_id for fila in Enfrentamiento.objects.historial(self.a)], [segundo.pk, primero.pk])
+        self.assertEqual([fila.id_partido_individual_id for fila in Enfrentamiento.objects.cara_a_cara(self.a, self.b)], [primero.pk])
+
+    def test_partido_de_dobles(self):
+        local, visitante = crear_pareja(self.a, self.b), crear_pareja(self.c, self.d)
+        partido = crear_partido_dobles(local, visitante)
+        filas = Enfrentamiento.objects.filter(id_partido_dobles=partido)
+        self.assertEqual(filas.count(), 8)
+        # Una fila principal por jugador y una representante por pareja
+        self.assertEqual(sorted(filas.filter(principal=True).values_list('id_jugador', flat=True)), [self.a.pk, self.b.pk, self.c.pk, self.d.pk])
+        self.assertEqual(filas.filter(principal=True, representante=True).count(), 2)
+        self.assertEqual(set(filas.filter(ganador=True).values_list('id_jugador', flat=True)), {self.a.pk, self.b.pk})
+        self.assertEqual([fila.id_partido_dobles_id for fila in Enfrentamiento.objects.cara_a_cara_parejas(visitante, local)], [partido.pk])
+
+    def test_cambiar_un_miembro_de_la_pareja(self):
+        local, visitante = crear_pareja(self.a, self.b), crear_pareja(self.c, self.d)
+        partido = crear_partido_dobles(local, visitante)
+        local.id_jugador_derecho = self.e
+        local.save()
+        jugadores = set(Enfrentamiento.objects.filter(id_partido_dobles=partido).values_list('id_jugador', flat=True))
+        self.assertEqual(jugadores, {self.a.pk, self.e.pk, self.c.pk, self.d.pk})
+        self.assertFalse(Enfrentamiento.objects.cara_a_cara(self.c, self.b).exists())
+        self.assertTrue(Enfrentamiento.objects.cara_a_cara(self.c, self.e).exists())
+
+    def test_borrar_el_partido(self):
+        partido = crear_partido_individual(self.a, self.b)
+        partido.delete()
+        self.assertFalse(Enfrentamiento.objects.exists())
+
+
+# Parejas por su par de jugadores (core/managers.py)
+
+class ParejaPorJugadoresTests(TestCase):
+    """Búsqueda y alta de parejas por la clave canónica (menor, mayor), una a una y en bloque"""
+    fixtures = FIXTURES_BASICOS
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.a, cls.b, cls.c, cls.d = (crear_jugador(numero) for numero in range(1, 5))
+
+    def test_buscar_en_cualquier_orden(self):
+        pareja = crear_pareja(self.b, self.a)
+        self.assertEqual(Pareja.objects.buscar(self.a, self.b), pareja)
+        self.assertEqual(Pareja.objects.buscar(self.b.pk, self.a.pk), pareja)
+        self.assertIsNone(Pareja.objects.buscar(self.a, self.c))
+
+    def test_pareja_repetida(self):
+        crear_pareja(self.a, self.b)
+        with self.assertRaises(ValidationError):
+            Pareja(id_jugador_izquierdo=self.b, id_jugador_derecho=self.a, nombre='Repetida').clean()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            crear_pareja(self.b, self.a)
+
+    def test_obtener_o_crear(self):
+        pareja, creada = Pareja.objects.obtener_o_crear(self.a, self.b)
+        self.assertTrue(creada)
+        self.assertEqual((pareja.id_jugador_izquierdo_id, pareja.id_jugador_derecho_id), (self.a.pk, self.b.pk))
+        self.assertEqual(Pareja.objects.obtener_o_crear(self.b, self.a), (pareja, False))
+
+    def test_buscar_en_bloque_sin_cruces(self):
+        ab, cd = crear_pareja(self.a, self.b), crear_pareja(self.d, self.c)
+        # Con (a, d) en la tabla, un filtro menor IN (a, c) AND mayor IN (b, d) la devolvería aunque nadie la ha pedido
+        crear_pareja(self.a, self.d)
+        with self.assertNumQueries(1):
+            encontradas = Pareja.objects.buscar_en_bloque([(self.b, self.a), (self.c.pk, self.d.pk), (self.b, self.c)])
+        self.assertEqual(encontradas, {(self.a.pk, self.b.pk): ab, (self.c.pk, self.d.pk): cd})
+
+    def test_obtener_o_crear_en_bloque(self):
+        ab = crear_pareja(self.a, self.b)
+        parejas = Pareja.objects.obtener_o_crear_en_bloque([(self.b, self.a), (self.c, self.d), (self.d, self.c)])
+        self.assertEqual(set(parejas), {(self.a.pk, self.b.pk), (self.c.pk, self.d.pk)})
+        self.assertEqual(parejas[(self.a.pk, self.b.pk)], ab)
+        self.assertEqual(Pareja.objects.count(), 2)
+
+
+class ReconstruirEnfrentamientosTests(TestCase):
+    """Reconstrucción de la tabla de enfrentamientos tras cambios que no pasan por save()"""
+    fixtures = FIXTURES_BASICOS
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.a, cls.b, cls.c = (crear_jugador(numero) for numero in range(1, 4))
+
+    def test_reconstruir_unos_partidos(self):
+        partido, otro = crear_partido_individual(self.a, self.b), crear_partido_individual(self.a, self.c)
+        PartidoIndividual.objects.filter(pk=partido.pk).update(id_ganador=self.b)
+        Enfrentamiento.objects.filter(id_partido_individual=otro).delete()
+        self.assertEqual(Enfrentamiento.objects.reconstruir(partidos_individuales=PartidoIndividual.objects.filter(pk=partido.pk)), 2)
+        self.assertTrue(Enfrentamiento.objects.filter(id_partido_individual=partido, id_jugador=self.b, ganador=True).exists())
+        self.assertFalse(Enfrentamiento.objects.filter(id_partido_individual=otro).exists())
+
+    def test_reconstruir_la_tabla(self):
+        crear_partido_individual(self.a, self.b)
+        crear_partido_dobles(crear_pareja(self.a, self.b), crear_pareja(self.c, crear_jugador(4)))
+        Enfrentamiento.objects.all().delete()
+        self.assertEqual(Enfrentamiento.objects.reconstruir(), 10)
+
+
+# Interfaz de administración deducida de los metadatos (core/admin.py y core/paginadores.py)
+
+class AdminDeducidoTests(SimpleTestCase):
+    """Columnas, búsquedas y widgets de clave foránea deducidos de cada modelo"""
+
+    def test_columnas_y_claves_foraneas(self):
+        modelo_admin = admin.site._registry[Jugador]
+        self.assertEqual(modelo_admin.list_display[0], '__str__')
+        self.assertNotIn('token_qr', modelo_admin.list_display)
+        self.assertNotIn('comentarios', modelo_admin.list_display)
+        self.assertEqual(list(modelo_admin.list_select_related), ['id_persona', 'id_tipo_lateralidad'])
+        # Las tablas de tipos siguen con desplegable; Persona, grande y con búsqueda, por autocompletado
+        self.assertEqual(list(modelo_admin.autocomplete_fields), ['id_persona'])
+        self.assertEqual(list(modelo_admin.raw_id_fields), [])
+        self.assertIn('id_persona__docidentidad_valor', modelo_admin.search_fields)
+
+    def test_sin_interfaz(self):
+        self.assertNotIn(Enfrentamiento, admin.site._registry)
+
+
+class PaginadorEstimadoTests(TestCase):
+    """Conteo estimado de los listados sin filtrar en tablas grandes"""
+    fixtures = FIXTURES_BASICOS
+
+    @classmethod
+    def setUpTestData(cls):
+        for numero in range(3):
+            crear_club(numero)
+
+    def test_tabla_pequena_cuenta_de_verdad(self):
+        self.assertEqual(PaginadorEstimado(Club.objects.order_by('pk'), 2).count, 3)
+
+    def test_tabla_grande_sin_filtros_estima(self):
+        with mock.patch('core.paginadores.filas_estimadas', return_value=UMBRAL_CONTEO_ESTIMADO), self.assertNumQueries(0):
+            self.assertEqual(PaginadorEstimado(Club.objects.order_by('pk'), 2).count, UMBRAL_CONTEO_ESTIMADO)
+
+    def test_con_filtros_cuenta_de_verdad(self):
+        with mock.patch('core.paginadores.filas_estimadas', return_value=UMBRAL_CONTEO_ESTIMADO) as estimacion:
+            self.assertEqual(PaginadorEstimado(Club.objects.filter(nombre='Club 1').order_by('pk'), 2).count, 1)
+        estimacion.assert_not_called()
+
+    def test_estadisticas_de_postgresql(self):
+        self.assertIsInstance(filas_estimadas(Club), int)
+
+
+# Permisos de objeto (core/permisos.py)
+
+class PermisosClubTests(TestCase):
+    """Caché por usuario de los permisos de guardian y asignación y retirada masiva por club"""
+    fixtures = FIXTURES_BASICOS
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('gestor')
+        cls.club, cls.otro_club = crear_club(1), crear_club(2)
+        a, b, c, d = (crear_jugador(numero) for numero in range(1, 5))
+        cls.pareja = Pareja.objects.create(id_jugador_izquierdo=a, id_jugador_derecho=b, nombre='Del club', id_club=cls.club)
+        cls.pareja_ajena = Pareja.objects.create(id_jugador_izquierdo=c, id_jugador_derecho=d, nombre='Ajena', id_club=cls.otro_club)
+
+    def usuario_nuevo(self):
+        """El usuario tal como llega a una petición nueva (sin permisos cacheados)"""
+        return User.objects.get(pk=self.usuario.pk)
+
+    def test_asignar_permisos_del_club(self):
+        asignar_permisos_club(self.club, self.usuario)
+        usuario = self.usuario_nuevo()
+        self.assertTrue(usuario.has_perm('core.change_club', self.club))
+        self.assertTrue(usuario.has_perm('core.view_pareja', self.pareja))
+        self.assertFalse(usuario.has_perm('core.delete_pareja', self.pareja))
+        self.assertFalse(usuario.has_perm('core.view_pareja', self.pareja_ajena))
+        self.assertFalse(usuario.has_perm('core.view_club', self.otro_club))
+
+    def test_asignar_dos_veces(self):
+        asignar_permisos_club(self.club, self.usuario)
+        concedidos = UserObjectPermission.objects.filter(user=self.usuario).count()
+        asignar_permisos_club(self.club, self.usuario)
+        self.assertEqual(UserObjectPermission.objects.filter(user=self.usuario).count(), concedidos)
+
+    def test_revocar_permisos_del_club(self):
+        asignar_permisos_club(self.club, self.usuario)
+        asignar_permisos_club(self.otro_club, self.usuario)
+        concedidos = UserObjectPermission.objects.filter(user=self.usuario).count()
+        borrados = revocar_permisos_club(self.club, self.usuario)
+        self.assertEqual(borrados, concedidos // 2)
+        usuario = self.usuario_nuevo()
+        self.assertFalse(usuario.has_perm('core.view_pareja', self.pareja))
+        self.assertTrue(usuario.has_perm('core.view_pareja', self.pareja_ajena))
+
+    def test_revocar_con_subconsulta(self):
+        asignar_permisos_club(self.club, self.usuario)
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as consultas:
+            revocar_permisos_club(self.club, self.usuario)
+        # Las claves de los objetos no viajan como literales: el borrado lleva su propia subconsulta
+        borrados = [consulta['sql'] for consulta in consultas if consulta['sql'].startswith('DELETE')]
+        self.assertTrue(borrados)
+        self.assertTrue(all('IN (SELECT' in sql for sql in borrados))
+
+    def test_verificador_cacheado(self):
+        asignar_permisos_club(self.club, self.usuario)
+        usuario = self.usuario_nuevo()
+        self.assertTrue(usuario.has_perm('core.view_pareja', self.pareja))
+        with self.assertNumQueries(0):
+            self.assertTrue(usuario.has_perm('core.change_pareja', self.pareja))
+            self.assertEqual(usuario.get_all_permissions(self.pareja), {'view_pareja', 'change_pareja'})
+
+    def test_precargar_una_pagina(self):
+        asignar_permisos_club(self.club, self.usuario)
+        usuario = self.usuario_nuevo()
+        precargar_permisos(usuario, [self.pareja, self.pareja_ajena])
+        with self.assertNumQueries(0):
+            self.assertTrue(usuario.has_perm('core.view_pareja', self.pareja))
+            self.assertFalse(usuario.has_perm('core.view_pareja', self.pareja_ajena))
+
+    def test_asignar_olvida_la_cache(self):
+        usuario = self.usuario_nuevo()
+        self.assertFalse(usuario.has_perm('core.view_pareja', self.pareja))
+        asignar_permisos_club(self.club, usuario)
+        self.assertTrue(usuario.has_perm('core.view_pareja', self.pareja))
+
+
+# Ámbito de club en el admin (core/clubes.py)
+
+class FiltroClubAdminTests(TestCase):
+    """Cada listado del admin muestra a un directivo sólo las filas de sus clubes"""
+    fixtures = FIXTURES_BASICOS + ['tipo_directivo', 'tipo_posesion', 'tipo_pista', 'tipo_suelo']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('directivo', is_staff=True)
+        cls.club, cls.otro_club = crear_club(1), crear_club(2)
+        directivo = Directivo.objects.create(id_persona=crear_persona(100, auth_user=cls.usuario.pk))
+        Mandato.objects.create(id_directivo=directivo, id_club=cls.club, id_tipo_directivo_id=1)
+        cls.jugador, cls.jugador_ajeno = crear_jugador(1), crear_jugador(2)
+        # Dos pertenencias al mismo club (una pasada) no deben repetir al jugador en el listado
+        Pertenencia.objects.create(id_jugador=cls.jugador, id_club=cls.club, activa=False)
+        Pertenencia.objects.create(id_jugador=cls.jugador, id_club=cls.club)
+        Pertenencia.objects.create(id_jugador=cls.jugador_ajeno, id_club=cls.otro_club)
+        cls.pista, cls.pista_ajena = (cls.crear_pista(club) for club in (cls.club, cls.otro_club))
+        cls.partido = crear_partido_individual(cls.jugador, cls.jugador_ajeno, id_pista=cls.pista)
+        crear_partido_individual(cls.jugador_ajeno, cls.jugador, id_pista=cls.pista_ajena)
+
+    @staticmethod
+    def crear_pista(club):
+        """Pista de una instalación que posee el club"""
+        instalacion = Instalacion.objects.create(nombre=f'Instalación de {club.nombre}', email=f'instalacion{club.pk}@prueba.test', **DIRECCION)
+        Posesion.objects.create(id_instalacion=instalacion, id_club=club, id_tipo_posesion_id=1)
+        return Pista.objects.create(id_instalacion=instalacion, id_tipo_pista_id=1, id_tipo_suelo_id=1, iluminada=True, tiene_llave=False,
+                                    dimensiones_longitud=13.41, dimensiones_archura=6.1, dimensiones_altura=0)
+
+    def peticion(self, usuario=None):
+        """Petición del admin hecha por el usuario (por defecto, el directivo)"""
+        request = RequestFactory().get('/admin/')
+        request.user = User.objects.get(pk=(usuario or self.usuario).pk)
+        request.session = {}
+        return request
+
+    def filas(self, modelo, request=None):
+        """Claves de las filas que el admin del modelo muestra en la petición"""
+        return sorted(admin.site._registry[modelo].get_queryset(request or self.peticion()).values_list('pk', flat=True))
+
+    def test_todos_los_modelos_tienen_camino_al_club(self):
+        for modelo in admin.site._registry:
+            if modelo._meta.app_label != 'core':
+                continue
+            with self.subTest(modelo=modelo.__name__):
+                rutas = rutas_club(modelo)
+                self.assertIsNotNone(rutas)
+                for ruta in rutas:
+                    # Filtrar por una instancia de Club sólo es válido si el camino termina en una clave foránea a Club
+                    str(modelo._base_manager.filter(**{ruta: self.club.pk if ruta == 'pk' else self.club}).query)
+
+    def test_filtro_directo(self):
+        self.assertEqual(self.filas(Club), [self.club.pk])
+        self.assertEqual(self.filas(Pertenencia), sorted(Pertenencia.objects.filter(id_club=self.club).values_list('pk', flat=True)))
+
+    def test_filtro_por_camino(self):
+        self.assertEqual(self.filas(Jugador), [self.jugador.pk])
+        self.assertEqual(self.filas(Pista), [self.pista.pk])
+        self.assertEqual(self.filas(PartidoIndividual), [self.partido.pk])
+        self.assertEqual(self.filas(Persona), sorted([self.jugador.id_persona_id, Persona.objects.get(auth_user=self.usuario.pk).pk]))
+
+    def test_tablas_globales(self):
+        modelo_admin = admin.site._registry[TipoSexo]
+        self.assertTrue(modelo_admin.acceso_denegado(self.peticion()))
+        self.assertEqual(self.filas(TipoSexo), [])
+        self.usuario.user_permissions.add(Permission.objects.get(codename='ver_filas_sin_club'))
+        self.assertFalse(modelo_admin.acceso_denegado(self.peticion()))
+        self.assertEqual(len(self.filas(TipoSexo)), TipoSexo.objects.count())
+
+    def test_sin_camino_solo_superusuarios(self):
+        self.usuario.user_permissions.add(Permission.objects.get(codename='view_jugador'))
+        modelo_admin = admin.site._registry[Jugador]
+        self.assertTrue(modelo_admin.has_view_permission(self.peticion()))
+        with mock.patch.dict(RUTAS_CLUB, {'Jugador': None}):
+            self.assertFalse(modelo_admin.has_view_permission(self.peticion()))
+            self.assertEqual(self.filas(Jugador), [])
+            superusuario = User.objects.create_superuser('admin')
+            self.assertTrue(modelo_admin.has_view_permission(self.peticion(superusuario)))
+            self.assertEqual(self.filas(Jugador, self.peticion(superusuario)), [self.jugador.pk, self.jugador_ajeno.pk])
+
+
+# Ficheros de prueba en un MEDIA_ROOT temporal
+
+def imagen_png(ancho=800, alto=600, color='red'):
+    """Bytes de una imagen PNG de un solo color"""
+    salida = io.BytesIO()
+    Image.new('RGB', (ancho, alto), color).save(salida, 'PNG')
+    return salida.getvalue()
+
+
+class MediaTemporalMixin:
+    """Guarda los ficheros de cada prueba en un MEDIA_ROOT temporal y parte de una caché vacía"""
+
+    def setUp(self):
+        super().setUp()
+        carpeta = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(carpeta.cleanup)
+        self.media = Path(carpeta.name)
+        ajustes = override_settings(MEDIA_ROOT=carpeta.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        cache.clear()
+
+
+# Miniaturas de las fotos (core/miniaturas.py)
+
+class MiniaturasTests(MediaTemporalMixin, TestCase):
+    """Generación de miniaturas por contenido y URLs mientras se generan o si fallan"""
+
+    def setUp(self):
+        super().setUp()
+        miniaturas._pendientes.clear()  # pylint: disable=protected-access
+        self.contenido = imagen_png(1200, 900)
+        self.foto = Club(foto=default_storage.save('fotos_clubes/logo.png', ContentFile(self.contenido))).foto
+
+    def test_generar_miniaturas(self):
+        nombre, resumen = miniaturas.generar_miniaturas(self.foto.name)
+        self.assertEqual((nombre, resumen), (self.foto.name, hashlib.sha256(self.contenido).hexdigest()))
+        for tamano, ancho in miniaturas.TAMANOS_MINIATURA.items():
+            for formato in miniaturas.FORMATOS_MINIATURA:
+                with default_storage.open(miniaturas.nombre_miniatura(resumen, tamano, formato)) as fichero:
+                    self.assertEqual(Image.open(fichero).width, ancho)
+
+    def test_mientras_se_generan(self):
+        with mock.patch.object(miniaturas, 'obtener_pool') as pool:
+            self.assertEqual(miniaturas.url_miniatura(self.foto), self.foto.url)
+            self.assertEqual(miniaturas.url_miniatura(self.foto, respaldo_original=False), '')
+            self.assertEqual(miniaturas.srcset_miniatura(self.foto), '')
+        # Un único encargo aunque la foto se pida varias veces mientras está en curso
+        pool.return_value.submit.assert_called_once_with(miniaturas.generar_miniaturas, self.foto.name)
+
+    def test_ya_generadas(self):
+        futuro = Future()
+        futuro.set_result(miniaturas.generar_miniaturas(self.foto.name))
+        resumen = miniaturas.anotar_resultado(futuro, self.foto.name)
+        self.assertEqual(miniaturas.url_miniatura(self.foto, 'pequena'),
+                         default_storage.url(miniaturas.nombre_miniatura(resumen, 'pequena', 'webp')))
+        self.assertEqual(miniaturas.srcset_miniatura(self.foto).count('w, '), len(miniaturas.TAMANOS_MINIATURA) - 1)
+
+    def test_foto_fallida_no_se_reencarga(self):
+        futuro = Future()
+        futuro.set_exception(OSError('imagen corrupta'))
+        with self.assertLogs('core.miniaturas', 'WARNING'):
+            self.assertIsNone(miniaturas.anotar_resultado(futuro, self.foto.name))
+        with mock.patch.object(miniaturas, 'obtener_pool') as pool:
+            self.assertEqual(miniaturas.url_miniatura(self.foto), self.foto.url)
+            self.assertEqual(miniaturas.srcset_miniatura(self.foto), '')
+        pool.return_value.submit.assert_not_called()
+
+    def test_pool_roto_se_reintenta(self):
+        futuro = Future()
+        futuro.set_exception(BrokenProcessPool('el pool ha muerto'))
+        with self.assertLogs('core.miniaturas', 'WARNING'):
+            miniaturas.anotar_resultado(futuro, self.foto.name)
+        self.assertIsNone(cache.get(miniaturas.clave_cache_miniaturas(self.foto.name)))
+
+
+# Almacenamiento por contenido (core/almacenamiento.py)
+
+class AlmacenamientoPorContenidoTests(MediaTemporalMixin, TestCase):
+    """Deduplicación de ficheros por SHA-256 y recuento de referencias por fila"""
+    fixtures = FIXTURES_BASICOS
+
+    def setUp(self):
+        super().setUp()
+        # Las miniaturas que se encargan al confirmar no son cosa de estas pruebas
+        parche = mock.patch('core.signals.encolar_miniaturas')
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.club, self.otro_club = crear_club(1), crear_club(2)
+        self.logo, self.otro_logo = imagen_png(color='red'), imagen_png(color='blue')
+
+    def subir(self, club, contenido, nombre='logo.png'):
+        """Sube una foto al club, confirmando la transacción (django-cleanup borra al confirmar); devuelve el nombre del blob"""
+        with self.captureOnCommitCallbacks(execute=True):
+            club.foto.save(nombre, ContentFile(contenido))
+        return club.foto.name
+
+    def referencias(self, nombre):
+        """Recuento de referencias de un blob (None si no tiene registro)"""
+        return ArchivoAlmacenado.objects.filter(nombre=nombre).values_list('referencias', flat=True).first()
+
+    def test_nombre_por_contenido(self):
+        nombre = self.subir(self.club, self.logo)
+        resumen = hashlib.sha256(self.logo).hexdigest()
+        self.assertEqual(nombre, f'{CARPETA_BLOBS}/{resumen[:2]}/{resumen[2:4]}/{resumen}.png')
+        self.assertEqual(self.referencias(nombre), 1)
+
+    def test_misma_fila_mismo_contenido(self):
+        nombre = self.subir(self.club, self.logo)
+        self.assertEqual(self.subir(self.club, self.logo, 'LOGO-OTRA-VEZ.PNG'), nombre)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.club.save()
+        self.assertEqual(self.referencias(nombre), 1)
+        # Y al cambiarlo por otro, el blob queda sin referencias y se borra
+        self.subir(self.club, self.otro_logo)
+        self.assertEqual(self.referencias(nombre), None)
+        self.assertFalse(default_storage.exists(nombre))
+
+    def test_compartido_entre_filas(self):
+        nombre = self.subir(self.club, self.logo)
+        self.assertEqual(self.subir(self.otro_club, self.logo), nombre)
+        self.assertEqual(self.referencias(nombre), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.club.delete()
+        self.assertEqual(self.referencias(nombre), 1)
+        self.assertTrue(default_storage.exists(nombre))
+        nuevo = self.subir(self.otro_club, self.otro_logo)
+        self.assertFalse(default_storage.exists(nombre))
+        self.assertEqual(self.referencias(nuevo), 1)
+
+    def test_guardar_otros_campos(self):
+        nombre = self.subir(self.club, self.logo)
+        self.club.nombre = 'Otro nombre'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.club.save(update_fields=['nombre'])
+        self.assertEqual(self.referencias(nombre), 1)
+
+    def test_fila_sin_recuento(self):
+        # Una fila que apunta al blob sin haber pasado por save() (p.ej. cargada con COPY) también lo protege
+        nombre = self.subir(self.club, self.logo)
+        Club.objects.filter(pk=self.otro_club.pk).update(foto=nombre)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.club.delete()
+        self.assertTrue(default_storage.exists(nombre))
+
+    def test_miniaturas_sin_direccionar(self):
+        nombre = default_storage.save('miniaturas/ab/prueba.webp', ContentFile(b'miniatura'))
+        self.assertEqual(nombre, 'miniaturas/ab/prueba.webp')
+        self.assertFalse(ArchivoAlmacenado.objects.exists())
+
+
+# Vistas previas de los planos (core/planos.py)
+
+class VistaPlanoTests(MediaTemporalMixin, SimpleTestCase):
+    """Vista acotada, pirámide de teselas y manifiesto de los planos de instalaciones"""
+
+    def setUp(self):
+        super().setUp()
+        planos._pendientes.clear()  # pylint: disable=protected-access
+        self.plano = default_storage.save('planos_instalaciones/plano.png', ContentFile(imagen_png(1000, 700)))
+
+    def test_vista_y_piramide(self):
+        nombre, resumen = planos.generar_vista_plano(self.plano)
+        self.assertEqual(nombre, self.plano)
+        carpeta = planos.carpeta_vista_plano(resumen)
+        with default_storage.open(f'{carpeta}/manifiesto.json') as fichero:
+            manifiesto = json.load(fichero)
+        # 1000 px → 500 → 250: tres niveles, el último de una sola tesela
+        self.assertEqual(manifiesto, {'ancho': 1000, 'alto': 700, 'tesela': 256, 'niveles': 3, 'formato': 'webp'})
+        self.assertEqual(len(default_storage.listdir(f'{carpeta}/0')[1]), 4 * 3)
+        self.assertEqual(default_storage.listdir(f'{carpeta}/2')[1], ['0_0.webp'])
+        with default_storage.open(f'{carpeta}/vista.webp') as fichero:
+            self.assertEqual(Image.open(fichero).size, (1000, 700))
+
+    def test_ya_generada(self):
+        _, resumen = planos.generar_vista_plano(self.plano)
+        rasterizador = mock.Mock()
+        with mock.patch.dict(planos.RASTERIZADORES, {'.png': rasterizador}):
+            self.assertEqual(planos.generar_vista_plano(self.plano), (self.plano, resumen))
+        rasterizador.assert_not_called()
+
+    def test_png_demasiado_grande(self):
+        with mock.patch.object(planos, 'MAXIMO_PIXELES_PNG', 1000 * 700 - 1), self.assertRaises(ValueError):
+            planos.generar_vista_plano(self.plano)
+
+    def test_formato_sin_vista(self):
+        dwg = default_storage.save('planos_instalaciones/plano.dwg', ContentFile(b'AC1032'))
+        self.assertEqual(planos.generar_vista_plano(dwg), (dwg, None))
+        with mock.patch.object(planos, 'obtener_pool') as pool:
+            self.assertEqual(planos.url_vista_plano(Instalacion(plano=dwg).plano), '')
+        pool.assert_not_called()
+
+    def test_urls(self):
+        campo = Instalacion(plano=self.plano).plano
+        with mock.patch.object(planos, 'obtener_pool') as pool:
+            self.assertEqual(planos.url_vista_plano(campo), '')
+            self.assertEqual(planos.url_manifiesto_plano(campo), '')
+        pool.return_value.submit.assert_called_once_with(planos.generar_vista_plano, self.plano)
+        futuro = Future()
+        futuro.set_result(planos.generar_vista_plano(self.plano))
+        resumen = planos.anotar_resultado(futuro, self.plano)
+        self.assertTrue(planos.url_vista_plano(campo).endswith(f'{planos.carpeta_vista_plano(resumen)}/vista.webp'))
+        self.assertTrue(planos.url_manifiesto_plano(campo).endswith('manifiesto.json'))
+
+    def test_sin_dependencia_opcional(self):
+        futuro = Future()
+        futuro.set_result((self.plano, None))
+        self.assertIsNone(planos.anotar_resultado(futuro, self.plano))
+        self.assertEqual(cache.get(planos.clave_cache_planos(self.plano)), miniaturas.FALLIDA)
+
+
+# Encuestas (core/encuestas.py y core/exportacion.py)
+
+class EncuestaMixin:
+    """Encuesta con una pregunta de opción única, una de valoración y una de texto libre, y dos encuestados"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.encuesta = Survey.objects.create(name='Satisfacción')
+        cls.opcion = Question.objects.create(survey=cls.encuesta, label='¿Repetirías?', type_field=TYPE_FIELD.radio, choices='Sí, No', key='repetir')
+        cls.valoracion = Question.objects.create(survey=cls.encuesta, label='Valoración', type_field=TYPE_FIELD.rating, choices='5', key='valoracion')
+        cls.texto = Question.objects.create(survey=cls.encuesta, label='Comentarios', type_field=TYPE_FIELD.text, key='comentarios', required=False)
+        cls.usuarios = [User.objects.create_user(f'encuestado{numero}') for numero in range(3)]
+        cls.responder(cls.usuarios[0], 'sí', '5', 'Muy bien')
+        cls.responder(cls.usuarios[1], 'no', '3', None)
+
+    @classmethod
+    def responder(cls, usuario, opcion, valoracion, texto):
+        """Un encuestado con sus respuestas (sin la de texto si es None)"""
+        encuestado = UserAnswer.objects.create(survey=cls.encuesta, user=usuario)
+        for pregunta, valor in ((cls.opcion, opcion), (cls.valoracion, valoracion), (cls.texto, texto)):
+            if valor is not None:
+                Answer.objects.create(question=pregunta, user_answer=encuestado, value=valor)
+        return encuestado
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class ResumenEncuestaTests(EncuestaMixin, TestCase):
+    """Resumen agregado de una encuesta, su caché y las actualizaciones incrementales al confirmarse cada cambio"""
+
+    def test_calcular_resumen(self):
+        with self.assertNumQueries(4):
+            resumen = calcular_resumen(self.encuesta.pk)
+        self.assertEqual(resumen['encuestados'], 2)
+        self.assertEqual(resumen['preguntas'][self.opcion.pk]['distribucion'], {'sí': 1, 'no': 1})
+        self.assertEqual(media(resumen['preguntas'][self.valoracion.pk]), 4)
+        self.assertEqual(resumen['preguntas'][self.texto.pk]['total'], 1)
+        self.assertEqual(resumen['preguntas'][self.texto.pk]['distribucion'], {})
+
+    def test_cacheado(self):
+        resumen = resumen_encuesta(self.encuesta.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(resumen_encuesta(self.encuesta.pk), resumen)
+
+    def test_alta_incremental(self):
+        resumen_encuesta(self.encuesta.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.responder(self.usuarios[2], 'sí', '1', 'Regular')
+        with self.assertNumQueries(0):
+            resumen = resumen_encuesta(self.encuesta.pk)
+        self.assertEqual(resumen, calcular_resumen(self.encuesta.pk))
+        self.assertEqual(resumen['encuestados'], 3)
+        self.assertEqual(resumen['preguntas'][self.opcion.pk]['distribucion'], {'sí': 2, 'no': 1})
+
+    def test_edicion_invalida(self):
+        resumen_encuesta(self.encuesta.pk)
+        respuesta = Answer.objects.get(question=self.opcion, value='no')
+        respuesta.value = 'sí'
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta.save()
+        self.assertIsNone(cache.get(clave_cache_resumen(self.encuesta.pk)))
+        self.assertEqual(resumen_encuesta(self.encuesta.pk)['preguntas'][self.opcion.pk]['distribucion'], {'sí': 2})
+
+    def test_cambio_en_curso_no_se_cachea(self):
+        # La transacción de una respuesta nueva aún no se ha confirmado: el recálculo no debe quedarse en la caché
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.responder(self.usuarios[2], 'sí', '1', None)
+            resumen_encuesta(self.encuesta.pk)
+            self.assertIsNone(cache.get(clave_cache_resumen(self.encuesta.pk)))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(resumen_encuesta(self.encuesta.pk)['encuestados'], 3)
+
+    def test_cambio_confirmado_durante_el_calculo(self):
+        def calcular_con_un_cambio(id_encuesta):
+            resumen = calcular_resumen(id_encuesta)
+            invalidar_resumen(id_encuesta)
+            return resumen
+        with mock.patch('core.encuestas.calcular_resumen', calcular_con_un_cambio):
+            resumen_encuesta(self.encuesta.pk)
+        self.assertIsNone(cache.get(clave_cache_resumen(self.encuesta.pk)))
+
+    def test_tipo_de_pregunta_cacheado(self):
+        self.assertEqual(datos_pregunta(self.opcion.pk), (self.encuesta.pk, TYPE_FIELD.radio))
+        with self.assertNumQueries(0):
+            datos_pregunta(self.opcion.pk)
+        self.opcion.type_field = TYPE_FIELD.select
+        self.opcion.save()
+        self.assertEqual(datos_pregunta(self.opcion.pk), (self.encuesta.pk, TYPE_FIELD.select))
+
+
+class ExportarRespuestasTests(EncuestaMixin, TestCase):
+    """Exportación en streaming de las respuestas, una fila por encuestado"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Un encuestado anónimo que no contestó nada también tiene su fila
+        UserAnswer.objects.create(survey=cls.encuesta)
+        cls.preguntas = list(cls.encuesta.questions.all())
+
+    def test_filas_pivotadas(self):
+        filas = [[fila[0]] + fila[2:] for fila in filas_encuestados(self.encuesta, self.preguntas)]
+        self.assertEqual(filas, [['encuestado0', 'Sí', '5', 'Muy bien'], ['encuestado1', 'No', '3', ''], [SIN_USUARIO, '', '', '']])
+
+    def test_csv(self):
+        lineas = list(csv.reader(io.StringIO(''.join(exportar_csv(self.encuesta, self.preguntas)))))
+        self.assertEqual(lineas[0], ['user', 'update_at', '¿Repetirías?', 'Valoración', 'Comentarios'])
+        self.assertEqual([linea[0] for linea in lineas[1:]], ['encuestado0', 'encuestado1', SIN_USUARIO])
+
+    @skipIf(exportacion.pyarrow is None, 'pyarrow no está instalado')
+    def test_parquet_por_lotes(self):
+        with mock.patch.object(exportacion, 'TAMANO_LOTE_EXPORTACION', 2):
+            trozos = list(exportar_parquet(self.encuesta, self.preguntas))
+        tabla = exportacion.pyarrow.parquet.read_table(io.BytesIO(b''.join(trozos)))
+        self.assertEqual(tabla.num_rows, 3)
+        self.assertEqual(tabla.column('¿Repetirías?').to_pylist(), ['Sí', 'No', ''])
+        self.assertEqual(exportacion.pyarrow.parquet.ParquetFile(io.BytesIO(b''.join(trozos))).num_row_groups, 2)
+
+
+# Ajustes (picklefree/settings.py), evaluados en un proceso aparte con las variables de entorno de cada caso
+
+def cargar_ajustes(*nombres, **entorno):
+    """Ajustes pedidos tal como los calcula settings.py con sólo las variables PICKLEFREE_* dadas ({'error': clase} si falla)"""
+    variables = {clave: valor for clave, valor in os.environ.items() if not clave.startswith('PICKLEFREE_')}
+    codigo = ('import json, sys\n'
+              'try:\n    from picklefree import settings\n'
+              'except Exception as error:\n    print(json.dumps({"error": type(error).__name__}))\n    sys.exit()\n'
+              'print(json.dumps({nombre: getattr(settings, nombre, None) for nombre in sys.argv[1:]}, default=str))')
+    salida = subprocess.run([sys.executable, '-c', codigo, *nombres], env={**variables, **entorno}, cwd=settings.BASE_DIR,
+                            capture_output=True, text=True, check=True)
+    return json.loads(salida.stdout)
+
+
+class PoolConexionesTests(SimpleTestCase):
+    """Pool de conexiones de psycopg o conexiones persistentes según el entorno"""
+
+    def test_pool_por_defecto(self):
+        bases = cargar_ajustes('DATABASES')['DATABASES']
+        self.assertEqual(bases['default']['OPTIONS']['pool'], {'min_size': 2, 'max_size': 10, 'timeout': 10, 'max_idle': 600, 'max_lifetime': 3600})
+        self.assertNotIn('CONN_MAX_AGE', bases['default'])
+        self.assertTrue(bases['default']['CONN_HEALTH_CHECKS'])
+
+    def test_pool_dimensionado_por_entorno(self):
+        bases = cargar_ajustes('DATABASES', PICKLEFREE_DB_POOL_MIN='4', PICKLEFREE_DB_POOL_MAX='32')['DATABASES']
+        self.assertEqual((bases['default']['OPTIONS']['pool']['min_size'], bases['default']['OPTIONS']['pool']['max_size']), (4, 32))
+
+    def test_sin_pool_conexiones_persistentes(self):
+        bases = cargar_ajustes('DATABASES', PICKLEFREE_DB_POOL='0', PICKLEFREE_DB_CONN_MAX_AGE='120')['DATABASES']
+        self.assertNotIn('OPTIONS', bases['default'])
+        self.assertEqual(bases['default']['CONN_MAX_AGE'], 120)
+
+    def test_perfil_test_sin_pool(self):
+        bases = cargar_ajustes('DATABASES', PICKLEFREE_PERFIL='test')['DATABASES']
+        self.assertNotIn('OPTIONS', bases['default'])
+
+    def test_la_replica_hereda_el_pool(self):
+        bases = cargar_ajustes('DATABASES', PICKLEFREE_DB_REPLICA_HOST='replica.interna')['DATABASES']
+        self.assertEqual(bases['replica']['HOST'], 'replica.interna')
+        self.assertEqual(bases['replica']['OPTIONS'], bases['default']['OPTIONS'])
+
+
+class PerfilAjustesTests(SimpleTestCase):
+    """Perfiles dev, test y prod: obligaciones de producción, caché y seguridad"""
+
+    def test_perfil_desconocido(self):
+        self.assertEqual(cargar_ajustes(PICKLEFREE_PERFIL='preproduccion'), {'error': 'ImproperlyConfigured'})
+
+    def test_produccion_exige_clave_y_contrasena(self):
+        self.assertEqual(cargar_ajustes(PICKLEFREE_PERFIL='prod', PICKLEFREE_DB_PASSWORD='x'), {'error': 'ImproperlyConfigured'})
+        self.assertEqual(cargar_ajustes(PICKLEFREE_PERFIL='prod', PICKLEFREE_SECRET_KEY='x'), {'error': 'ImproperlyConfigured'})
+
+    def test_produccion(self):
+        ajustes = cargar_ajustes('DEBUG', 'SESSION_COOKIE_SECURE', 'CSRF_COOKIE_SECURE', 'CACHES', 'ALLOWED_HOSTS',
+                                 PICKLEFREE_PERFIL='prod', PICKLEFREE_SECRET_KEY='x', PICKLEFREE_DB_PASSWORD='x',
+                                 PICKLEFREE_ALLOWED_HOSTS='picklefree.es, www.picklefree.es')
+        self.assertIs(ajustes['DEBUG'], False)
+        self.assertIs(ajustes['SESSION_COOKIE_SECURE'], True)
+        self.assertIs(ajustes['CSRF_COOKIE_SECURE'], True)
+        self.assertEqual(ajustes['ALLOWED_HOSTS'], ['picklefree.es', 'www.picklefree.es'])
+        self.assertEqual(ajustes['CACHES']['default']['BACKEND'], 'django.core.cache.backends.filebased.FileBasedCache')
+
+    def test_cache_redis(self):
+        cache_redis = cargar_ajustes('CACHES', PICKLEFREE_CACHE_URL='redis://cache:6379/1')['CACHES']['default']
+        self.assertEqual((cache_redis['BACKEND'], cache_redis['LOCATION']), ('django.core.cache.backends.redis.RedisCache', 'redis://cache:6379/1'))
+
+    def test_perfil_test(self):
+        ajustes = cargar_ajustes('DEBUG', 'CACHES', 'PASSWORD_HASHERS', PICKLEFREE_PERFIL='test', PICKLEFREE_CACHE_URL='redis://cache:6379/1')
+        self.assertIs(ajustes['DEBUG'], False)
+        self.assertEqual(ajustes['CACHES']['default']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+        self.assertEqual(ajustes['PASSWORD_HASHERS'], ['django.contrib.auth.hashers.MD5PasswordHasher'])
+
+    def test_desarrollo(self):
+        ajustes = cargar_ajustes('DEBUG', 'SESSION_COOKIE_SECURE')
+        self.assertIs(ajustes['DEBUG'], True)
+        self.assertIs(ajustes['SESSION_COOKIE_SECURE'], None)
+
+
+# Instrumentación de consultas (core/instrumentacion.py) y métricas (core/views.py)
+
+class InstrumentacionConsultasTests(TestCase):
+    """Registro de las consultas de cada petición muestreada, consultas repetidas y métricas por vista"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_huella_ignora_parametros_y_longitud_de_listas(self):
+        self.assertEqual(huella('SELECT *  FROM t\nWHERE id IN (%s, %s, %s)'), huella('SELECT * FROM t WHERE id IN (%s,%s)'))
+        self.assertNotEqual(huella('SELECT * FROM t WHERE id = %s'), huella('SELECT * FROM u WHERE id = %s'))
+
+    def test_registro_detecta_repetidas(self):
+        registro = RegistroConsultas()
+        with registro.activar():
+            for numero in range(3):
+                Club.objects.filter(pk=numero).first()
+            Provincia.objects.count()
+        resumen = registro.resumen()
+        self.assertEqual(resumen['consultas'], 4)
+        self.assertEqual(list(resumen['duplicadas'].values()), [3])
+        self.assertEqual(len(resumen['lentas']), 4)
+
+    def atender(self, vista):
+        """Pasa una petición por el middleware con todas las peticiones muestreadas; devuelve los registros emitidos"""
+        with override_settings(INSTRUMENTACION_MUESTREO=1.0), self.assertLogs('picklefree.consultas', 'INFO') as registros:
+            InstrumentacionConsultasMiddleware(vista)(self.factory.get('/clubes/'))
+        return registros.records
+
+    def test_middleware_registra_la_peticion(self):
+        def vista(request):
+            Provincia.objects.count()
+            return HttpResponse()
+        registro, = self.atender(vista)
+        self.assertEqual(registro.levelname, 'INFO')
+        self.assertEqual((registro.datos['ruta'], registro.datos['estado'], registro.datos['consultas']), ('/clubes/', 200, 1))
+
+    def test_middleware_avisa_de_consultas_repetidas(self):
+        def vista(request):
+            for numero in range(2):
+                Club.objects.filter(pk=numero).first()
+            return HttpResponse()
+        registro, = self.atender(vista)
+        self.assertEqual(registro.levelname, 'WARNING')
+        self.assertEqual(list(registro.datos['duplicadas'].values()), [2])
+
+    @override_settings(INSTRUMENTACION_MUESTREO=0)
+    def test_sin_muestreo_no_registra(self):
+        with self.assertNoLogs('picklefree.consultas'):
+            InstrumentacionConsultasMiddleware(lambda request: HttpResponse())(self.factory.get('/'))
+
+    def test_metricas_prometheus(self):
+        metricas = Metricas()
+        metricas.anotar('clubes', {'consultas': 5, 'duplicadas': {'SELECT 1': 3}, 'tiempo_bd_ms': 20}, 100)
+        texto = metricas.exponer()
+        self.assertIn(f'picklefree_consultas_sql_total{{vista="clubes",pid="{os.getpid()}"}} 5', texto)
+        self.assertIn(f'picklefree_consultas_sql_duplicadas_total{{vista="clubes",pid="{os.getpid()}"}} 2', texto)
+        self.assertIn('# TYPE picklefree_tiempo_bd_segundos_total counter', texto)
+
+    @override_settings(INSTRUMENTACION_TOKEN_METRICAS='secreto', INSTRUMENTACION_IPS_METRICAS=['10.0.0.1'])
+    def test_acceso_a_las_metricas(self):
+        def pedir(**cabeceras):
+            request = self.factory.get('/metricas/', **cabeceras)
+            request.user = AnonymousUser()
+            return autorizado_metricas(request)
+        self.assertTrue(pedir(HTTP_AUTHORIZATION='Bearer secreto'))
+        self.assertFalse(pedir(HTTP_AUTHORIZATION='Bearer otro'))
+        self.assertTrue(pedir(REMOTE_ADDR='10.0.0.1'))
+        self.assertFalse(pedir())
+
+
+# Carga masiva con COPY (core/carga_masiva.py) y datos sintéticos (core/datos_sinteticos.py)
+
+class CargarFilasTests(TestCase):
+    """Inserción de filas con COPY y puesta al día de las secuencias"""
+    fixtures = FIXTURES_BASICOS
+
+    def test_copy_con_claves_explicitas(self):
+        inicio = siguiente_clave(Club)
+        # Campos por nombre o por attname (direccion_provincia_id)
+        campos = ('id_club', 'token_qr', 'nombre', 'email', 'direccion_calle_num', 'direccion_localidad', 'direccion_codigopostal',
+                  'direccion_provincia_id', 'direccion_pais', 'fecha_alta', 'activo')
+        filas = ((club, nuevo_token_qr(), f'Club {club}', f'club{club}@prueba.test', 'Calle Mayor 1', 'Logroño', '26001', 26, 'ES',
+                  timezone.localdate(), True)
+                 for club in range(inicio, inicio + 3))
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as consultas:
+            self.assertEqual(cargar_filas(Club, campos, filas), 3)
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(list(Club.objects.order_by('pk').values_list('nombre', flat=True)), [f'Club {club}' for club in range(inicio, inicio + 3)])
+        reiniciar_secuencias([Club])
+        self.assertEqual(crear_club(99).pk, inicio + 3)
+
+    def test_sin_filas(self):
+        self.assertEqual(cargar_filas(Categoria, ('nombre', 'fecha_alta'), iter(())), 0)
+        self.assertFalse(Categoria.objects.exists())
+
+
+class GeneradorDatosTests(TestCase):
+    """Datos sintéticos coherentes a escala reducida"""
+    fixtures = FIXTURES_BASICOS + ['tipo_pista', 'tipo_suelo', 'tipo_mensaje']
+
+    def test_sin_fixtures(self):
+        Provincia.objects.all().delete()
+        with self.assertRaises(ValueError):
+            GeneradorDatos(escala=0.0001).generar()
+
+    def test_generar(self):
+        volumen = volumenes(0.0001)
+        conteos = GeneradorDatos(escala=0.0001).generar()
+        self.assertEqual(conteos['persona'], volumen['personas'])
+        self.assertEqual(conteos['partido_individual'], volumen['partidos_individuales'])
+        self.assertEqual(conteos['reserva_jugador'] + conteos['reserva_club'], ReservaJugador.objects.count() + ReservaClub.objects.count())
+        self.assertEqual(Pertenencia.objects.filter(activa=True).values('id_jugador').distinct().count(), conteos['jugador'])
+        # Los enfrentamientos cargados a la vez que los partidos son los que regeneraría la señal
+        cargados = set(Enfrentamiento.objects.values_list('id_partido_individual', 'id_jugador', 'id_rival', 'local', 'ganador'))
+        self.assertEqual(len(cargados), 2 * conteos['partido_individual'])
+        Enfrentamiento.objects.reconstruir()
+        self.assertEqual(set(Enfrentamiento.objects.values_list('id_partido_individual', 'id_jugador', 'id_rival', 'local', 'ganador')), cargados)
+        # Las secuencias quedan por encima de las claves cargadas
+        self.assertGreater(crear_persona(5000).pk, max(Persona.objects.exclude(email='persona5000@prueba.test').values_list('pk', flat=True)))
+
+
+class CargarFixturesTests(TestCase):
+    """Carga de fixtures con COPY en una transacción, con restricciones diferidas y fusión por clave primaria"""
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.carpeta = Path(carpeta.name)
+
+    def fixture(self, nombre, objetos):
+        """Escribe un fixture JSON en la carpeta temporal y devuelve su ruta"""
+        ruta = self.carpeta / f'{nombre}.json'
+        ruta.write_text(json.dumps(objetos), encoding='utf-8')
+        return ruta
+
+    def provincia(self, nombre):
+        """Fixture con la provincia 26"""
+        return self.fixture('provincia', [{'model': 'core.provincia', 'pk': 26, 'fields': {'nombre': nombre, 'codigo_ine': '26'}}])
+
+    def test_el_orden_entre_ficheros_no_importa(self):
+        club = self.fixture('club', [{'model': 'core.club', 'pk': 500, 'fields': {
+            'nombre': 'Club 500', 'email': 'club500@prueba.test', 'direccion_calle_num': 'Calle Mayor 1', 'direccion_localidad': 'Logroño',
+            'direccion_codigopostal': '26001', 'direccion_provincia': 26, 'direccion_pais': 'ES'}}])
+        # El club referencia una provincia que está en un fichero posterior
+        self.assertEqual(cargar_fixtures([club, self.provincia('La Rioja')]), {Club: 1, Provincia: 1})
+        self.assertEqual(Club.objects.get(pk=500).direccion_provincia.nombre, 'La Rioja')
+        # Las secuencias quedan por encima de las claves cargadas
+        self.assertEqual(crear_club(1).pk, 501)
+
+    def test_recargar_actualiza(self):
+        cargar_fixtures([self.provincia('Rioja')])
+        cargar_fixtures([self.provincia('La Rioja')])
+        self.assertEqual(list(Provincia.objects.values_list('pk', 'nombre')), [(26, 'La Rioja')])
+
+    def test_referencia_rota_deshace_todo(self):
+        tipo = self.fixture('tipo', [{'model': 'core.tiposexo', 'pk': 1, 'fields': {'nombre': 'Masculino'}}])
+        club = self.fixture('club', [{'model': 'core.club', 'pk': 500, 'fields': {
+            'nombre': 'Club 500', 'email': 'club500@prueba.test', 'direccion_calle_num': 'Calle Mayor 1', 'direccion_localidad': 'Logroño',
+            'direccion_codigopostal': '26001', 'direccion_provincia': 99, 'direccion_pais': 'ES'}}])
+        with self.assertRaises(IntegrityError):
+            cargar_fixtures([tipo, club])
+        self.assertFalse(TipoSexo.objects.exists())
+
+
+class InicializarBdTests(TestCase):
+    """Comando inicializar_bd sobre la base de datos de pruebas, ya migrada"""
+
+    def test_carga_todos_los_fixtures(self):
+        salida = io.StringIO()
+        call_command('inicializar_bd', sin_migrar=True, stdout=salida)
+        fixtures = sorted(Path(settings.BASE_DIR, 'core', 'fixtures').glob('*.json'))
+        objetos = sum(len(json.loads(ruta.read_text(encoding='utf-8'))) for ruta in fixtures)
+        self.assertIn(f'{len(fixtures)} fixtures cargados ({objetos} objetos)', salida.getvalue())
+        provincias = Provincia.objects.count()
+        self.assertEqual(provincias, len(json.loads(Path(settings.BASE_DIR, 'core', 'fixtures', 'provincia.json').read_text(encoding='utf-8'))))
+        # Volver a ejecutarlo no duplica nada
+        call_command('inicializar_bd', sin_migrar=True, stdout=io.StringIO())
+        self.assertEqual(Provincia.objects.count(), provincias)
+
+
+# Índices (core/models.py) y su auditoría (core/management/commands/auditar_indices.py)
+
+class IndicesTests(TestCase):
+    """Índices compuestos que sustituyen a los de las claves ajenas"""
+    fixtures = FIXTURES_BASICOS
+
+    def plan(self, consulta):
+        """Plan de PostgreSQL para una consulta, sin permitirle recorrer la tabla entera (en pruebas las tablas son diminutas)"""
+        with transaction.atomic(), connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            return consulta.explain()
+
+    def test_pertenencias_por_club_usan_el_indice_compuesto(self):
+        club = crear_club(1)
+        Pertenencia.objects.create(id_jugador=crear_jugador(1), id_club=club)
+        # Tanto las búsquedas sólo por club (borrados, RESTRICT, ámbito del admin) como las de miembros activos
+        self.assertIn('pertenencia_club_activa_idx', self.plan(Pertenencia.objects.filter(id_club=club)))
+        self.assertIn('pertenencia_club_activa_idx', self.plan(Pertenencia.objects.filter(id_club=club, activa=True)))
+
+    def test_indices_redundantes(self):
+        filas = [('t', 't_a', [1], False, False), ('t', 't_ab', [1, 2], False, False), ('t', 't_b_parcial', [2], False, True),
+                 ('t', 't_b', [2], False, False), ('t', 't_ba_unico', [2, 1], True, False), ('u', 'u_a', [1], False, False)]
+        self.assertEqual(indices_redundantes(filas), [('t', 't_a', 't_ab'), ('t', 't_b', 't_ba_unico')])
+
+
+    def recorridos(self, tabla):
+        """Recorridos secuenciales de una tabla según las estadísticas acumuladas (vaciando antes las pendientes)"""
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute('SELECT pg_stat_force_next_flush()')
+            cursor.execute('SELECT pg_stat_clear_snapshot()')
+            cursor.execute('SELECT seq_scan FROM pg_stat_user_tables WHERE relname = %s', [tabla])
+            return cursor.fetchone()[0]
+
+    def test_reiniciar_solo_las_tablas_auditadas(self):
+        Club.objects.count()
+        User.objects.count()
+        self.assertGreater(self.recorridos('club'), 0)
+        salida = io.StringIO()
+        call_command('auditar_indices', reiniciar=True, stdout=salida)
+        self.assertIn('Estadísticas reiniciadas', salida.getvalue())
+        self.assertEqual(self.recorridos('club'), 0)
+        self.assertGreater(self.recorridos('auth_user'), 0)
+
+
+# Particionado por fecha (core/particionado.py)
+
+class ParticionadoTests(TestCase):
+    """Conversión de tablas en particionadas por mes, particiones futuras, archivado y claves únicas que lo impiden"""
+    fixtures = FIXTURES_BASICOS + ['tipo_pista', 'tipo_suelo']
+
+    @classmethod
+    def setUpTestData(cls):
+        instalacion = Instalacion.objects.create(nombre='Instalación', email='instalacion@prueba.test', **DIRECCION)
+        cls.pista = Pista.objects.create(id_instalacion=instalacion, id_tipo_pista_id=1, id_tipo_suelo_id=1, iluminada=True, tiene_llave=False,
+                                         dimensiones_longitud=13.41, dimensiones_archura=6.1, dimensiones_altura=0)
+        cls.jugador = crear_jugador(1)
+        cls.mes = inicio_periodo(timezone.localdate(), 'mes')
+        cls.pasado = cls.mes - datetime.timedelta(days=40)
+        cls.reservas = [cls.reservar(fecha).pk for fecha in (cls.pasado, cls.mes)]
+
+    @classmethod
+    def reservar(cls, fecha):
+        """Reserva del jugador de 10 a 11 en la fecha dada"""
+        return ReservaJugador.objects.create(id_pista=cls.pista, id_jugador=cls.jugador, fecha_reserva=fecha, hora_inicio=datetime.time(10),
+                                             hora_fin=datetime.time(11))
+
+    def setUp(self):
+        self.cursor = connections[DEFAULT_DB_ALIAS].cursor()
+        self.addCleanup(self.cursor.close)
+        # ALTER TABLE no se admite con comprobaciones de claves ajenas aún pendientes en la transacción de la prueba
+        self.cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    def test_particionar_reservas(self):
+        particionar_tabla(self.cursor, 'reserva_jugador', 'mes', futuras=1)
+        self.assertTrue(esta_particionada(self.cursor, 'reserva_jugador'))
+        inicios = [desde for _, desde, _ in particiones(self.cursor, 'reserva_jugador')]
+        self.assertEqual(inicios[0], inicio_periodo(self.pasado, 'mes'))
+        self.assertEqual(inicios[-1], siguiente_periodo(self.mes, 'mes'))
+        self.assertEqual(sorted(ReservaJugador.objects.values_list('pk', flat=True)), self.reservas)
+        # La clave única ya incluía la fecha, así que sigue impidiendo reservar dos veces la misma franja
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.reservar(self.mes)
+        self.assertGreater(self.reservar(self.mes + datetime.timedelta(days=1)).pk, max(self.reservas))
+
+    def test_crear_y_archivar_particiones(self):
+        particionar_tabla(self.cursor, 'reserva_jugador', 'mes', futuras=0)
+        hasta = siguiente_periodo(siguiente_periodo(self.mes, 'mes'), 'mes')
+        self.assertEqual(len(crear_particiones(self.cursor, 'reserva_jugador', 'mes', hasta=hasta)), 2)
+        self.assertEqual(crear_particiones(self.cursor, 'reserva_jugador', 'mes', hasta=hasta), [])
+        separadas = archivar_particiones(self.cursor, 'reserva_jugador', self.mes)
+        self.assertIn(f'reserva_jugador_p{self.pasado:%Y_%m}', separadas)
+        self.assertEqual(list(ReservaJugador.objects.values_list('pk', flat=True)), self.reservas[1:])
+
+    def test_envio_no_se_particiona(self):
+        # token_qr sólo sería único dentro de cada fecha
+        self.assertEqual(restricciones_debilitadas(self.cursor, 'envio'), ['envio_token_qr_key'])
+        self.assertEqual(restricciones_debilitadas(self.cursor, 'reserva_jugador'), [])
+        with self.assertRaises(ValueError):
+            particionar_tabla(self.cursor, 'envio', 'mes')
+        self.assertFalse(esta_particionada(self.cursor, 'envio'))
+
+    @override_settings(PARTICIONADO_INTERVALO='mes')
+    def test_la_migracion_avisa_y_no_particiona_envio(self):
+        editor, estado = mock.Mock(connection=connections[DEFAULT_DB_ALIAS]), mock.Mock(apps=apps)
+        with self.assertLogs('core.particionado', 'WARNING') as registros:
+            ParticionarPorRango('Envio').database_forwards('core', editor, estado, estado)
+        self.assertIn('envio_token_qr_key', registros.output[0])
+        self.assertFalse(esta_particionada(self.cursor, 'envio'))
+
+    def test_comando_crear_particiones(self):
+        salida = io.StringIO()
+        call_command('crear_particiones', intervalo='mes', futuras=1, convertir=True, stdout=salida)
+        self.assertIn('envio: no se particiona', salida.getvalue())
+        self.assertIn('reserva_jugador: particionada por mes', salida.getvalue())
+        self.assertTrue(esta_particionada(self.cursor, 'reserva_club'))
+
+
+# Réplica de lectura (core/replicas.py); en el perfil test la réplica es un espejo de default
+
+class RouterReplicaTests(SimpleTestCase):
+    """Enrutado de lecturas y escrituras según el estado de lectura de la petición"""
+
+    def setUp(self):
+        self.router = RouterReplica()
+
+    def leer(self, modelo, estado):
+        """Base de datos a la que el router manda una lectura del modelo con el estado dado"""
+        token = _estado.set(estado)
+        try:
+            return self.router.db_for_read(modelo)
+        finally:
+            _estado.reset(token)
+
+    def test_fuera_de_peticion_lee_de_la_primaria(self):
+        self.assertEqual(self.router.db_for_read(Enfrentamiento), DEFAULT_DB_ALIAS)
+
+    def test_modelos_en_replica(self):
+        self.assertEqual(self.leer(Enfrentamiento, EstadoLectura()), ALIAS_REPLICA)
+        self.assertEqual(self.leer(Club, EstadoLectura()), DEFAULT_DB_ALIAS)
+
+    def test_vista_designada_lee_todo_de_la_replica(self):
+        estado = EstadoLectura()
+        estado.vista = True
+        self.assertEqual(self.leer(Club, estado), ALIAS_REPLICA)
+
+    def test_primaria_fija(self):
+        self.assertEqual(self.leer(Enfrentamiento, EstadoLectura(primaria=True)), DEFAULT_DB_ALIAS)
+
+    def test_dentro_de_una_transaccion_lee_de_la_primaria(self):
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+            self.assertEqual(self.leer(Enfrentamiento, EstadoLectura()), DEFAULT_DB_ALIAS)
+
+    def test_escribir_fija_la_primaria(self):
+        estado = EstadoLectura()
+        token = _estado.set(estado)
+        try:
+            self.assertEqual(self.router.db_for_write(Club), DEFAULT_DB_ALIAS)
+        finally:
+            _estado.reset(token)
+        self.assertTrue(estado.primaria)
+        self.assertTrue(estado.escrito)
+        self.assertEqual(self.leer(Enfrentamiento, estado), DEFAULT_DB_ALIAS)
+
+    def test_no_se_migra_la_replica(self):
+        self.assertIs(self.router.allow_migrate(ALIAS_REPLICA, 'core'), False)
+        self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'core'))
+
+
+class LecturaReplicaMiddlewareTests(SimpleTestCase):
+    """Decisión por petición de leer de la réplica y primaria fija tras escribir"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = RouterReplica()
+
+    def atender(self, request, escribe=False, vista=None):
+        """Pasa la petición por el middleware; devuelve la respuesta y a qué base de datos fueron sus lecturas de Enfrentamiento y Club"""
+        lecturas = {}
+        def vista_por_defecto(request):
+            if escribe:
+                self.router.db_for_write(Club)
+            lecturas['enfrentamiento'] = self.router.db_for_read(Enfrentamiento)
+            lecturas['club'] = self.router.db_for_read(Club)
+            return HttpResponse()
+        vista = vista(vista_por_defecto) if vista else vista_por_defecto
+        def get_response(request):
+            middleware.process_view(request, vista, (), {})
+            return vista(request)
+        middleware = LecturaReplicaMiddleware(get_response)
+        return middleware(request), lecturas
+
+    def test_consulta_lee_de_la_replica(self):
+        respuesta, lecturas = self.atender(self.factory.get('/'))
+        self.assertEqual(lecturas, {'enfrentamiento': ALIAS_REPLICA, 'club': DEFAULT_DB_ALIAS})
+        self.assertNotIn(COOKIE_PRIMARIA, respuesta.cookies)
+
+    def test_vista_designada(self):
+        _, lecturas = self.atender(self.factory.get('/'), vista=leer_de_replica)
+        self.assertEqual(lecturas, {'enfrentamiento': ALIAS_REPLICA, 'club': ALIAS_REPLICA})
+
+    def test_metodo_que_escribe_lee_de_la_primaria(self):
+        _, lecturas = self.atender(self.factory.post('/'))
+        self.assertEqual(lecturas['enfrentamiento'], DEFAULT_DB_ALIAS)
+
+    def test_escribir_deja_la_cookie_de_primaria(self):
+        respuesta, lecturas = self.atender(self.factory.get('/'), escribe=True)
+        self.assertEqual(lecturas['enfrentamiento'], DEFAULT_DB_ALIAS)
+        self.assertGreater(float(respuesta.cookies[COOKIE_PRIMARIA].value), time.time())
+
+    def test_cookie_vigente_fija_la_primaria(self):
+        request = self.factory.get('/')
+        request.COOKIES[COOKIE_PRIMARIA] = str(time.time() + 60)
+        _, lecturas = self.atender(request)
+        self.assertEqual(lecturas['enfrentamiento'], DEFAULT_DB_ALIAS)
+
+    def test_cookie_caducada(self):
+        request = self.factory.get('/')
+        request.COOKIES[COOKIE_PRIMARIA] = str(time.time() - 60)
+        _, lecturas = self.atender(request)
+        self.assertEqual(lecturas['enfrentamiento'], ALIAS_REPLICA)
+
+    def test_cookie_mal_formada_se_ignora(self):
+        request = self.factory.get('/')
+        request.COOKIES[COOKIE_PRIMARIA] = 'no-es-un-numero'
+        _, lecturas = self.atender(request)
+        self.assertEqual(lecturas['enfrentamiento'], ALIAS_REPLICA)
+
+
+# Calendarios iCalendar (core/calendarios.py)
+
+class FormatoIcalTests(SimpleTestCase):
+    """Escapado de textos y plegado de líneas según RFC 5545"""
+
+    def test_escapado(self):
+        self.assertEqual(_escapar('Pista 1; Club A, B\\C'), 'Pista 1\\; Club A\\, B\\\\C')
+        self.assertEqual(_escapar('uno\r\ndos\ntres\rcuatro'), 'uno\\ndos\\ntres\\ncuatro')
+
+    def test_linea_corta(self):
+        self.assertEqual(_linea('SUMMARY', 'Partido'), 'SUMMARY:Partido\r\n')
+
+    def test_plegado(self):
+        for valor in ('x' * 200, 'ñ' * 100, 'Torneo de pádel 🏓 ' * 10):
+            with self.subTest(valor=valor[:10]):
+                linea = _linea('DESCRIPTION', valor)
+                self.assertTrue(linea.endswith('\r\n'))
+                fisicas = linea[:-2].split('\r\n')
+                self.assertTrue(all(len(fisica.encode()) <= 75 for fisica in fisicas))
+                self.assertTrue(all(fisica.startswith(' ') for fisica in fisicas[1:]))
+                self.assertEqual(fisicas[0] + ''.join(fisica[1:] for fisica in fisicas[1:]), f'DESCRIPTION:{valor}')
+
+
+# API JSON (core/api.py)
+
+class ApiListadoTests(TestCase):
+    """Paginación por clave, selección de campos y ETag del listado de la API"""
+    fixtures = FIXTURES_BASICOS
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clubes = [crear_club(numero) for numero in range(5)]
+
+    def test_paginacion_por_clave(self):
+        ids, url, paginas = [], '/api/clubes/?limite=2&campos=nombre', 0
+        while url:
+            respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            datos = respuesta.json()
+            self.assertLessEqual(len(datos['datos']), 2)
+            self.assertEqual(set(datos['datos'][0]), {'id', 'nombre'})
+            ids.extend(fila['id'] for fila in datos['datos'])
+            paginas += 1
+            url = datos['siguiente'] and f'/api/clubes/?limite=2&campos=nombre&cursor={datos["siguiente"]}'
+            self.assertEqual('Link' in respuesta, bool(datos['siguiente']))
+        self.assertEqual(ids, sorted(club.pk for club in self.clubes))
+        self.assertEqual(paginas, 3)
+
+    def test_cursor_sigue_tras_la_ultima_clave(self):
+        respuesta = self.client.get(f'/api/clubes/?cursor={codificar_cursor(self.clubes[2].pk)}')
+        self.assertEqual([fila['id'] for fila in respuesta.json()['datos']], [club.pk for club in self.clubes[3:]])
+
+    def test_etag_responde_304(self):
+        respuesta = self.client.get('/api/clubes/')
+        etiqueta = respuesta['ETag']
+        self.assertEqual(self.client.get('/api/clubes/', HTTP_IF_NONE_MATCH=etiqueta).status_code, 304)
+        Club.objects.filter(pk=self.clubes[0].pk).update(nombre='Otro nombre')
+        cambiada = self.client.get('/api/clubes/', HTTP_IF_NONE_MATCH=etiqueta)
+        self.assertEqual(cambiada.status_code, 200)
+        self.assertNotEqual(cambiada['ETag'], etiqueta)
+
+    def test_peticiones_no_validas(self):
+        for url in ('/api/clubes/?cursor=%%%', '/api/clubes/?limite=0', '/api/clubes/?limite=x', '/api/clubes/?campos=clave_secreta'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get('/api/nada/').status_code, 404)
+
+
+# Marcador en directo (core/marcador.py)
+
+class ClaveSuscripcionTests(SimpleTestCase):
+    """Clave de suscripción a partir de los parámetros de la petición"""
+
+    def test_claves_validas(self):
+        self.assertIsNone(clave_suscripcion({}))
+        self.assertEqual(clave_suscripcion({'tipo': 'individual', 'torneo': '7'}), ('individual', 'torneo', 7))
+        self.assertEqual(clave_suscripcion({'tipo': 'dobles', 'partido': '3'}), ('dobles', 'partido', 3))
+
+    def test_claves_no_validas(self):
+        for parametros in ({'tipo': 'individual'}, {'torneo': '7'}, {'tipo': 'equipos', 'torneo': '7'},
+                           {'tipo': 'individual', 'torneo': '7', 'partido': '3'}, {'tipo': 'individual', 'partido': 'tres'}):
+            with self.subTest(parametros=parametros), self.assertRaises(ValueError):
+                clave_suscripcion(parametros)
+
+
+# Confirmación de resultados (core/resultados.py)
+
+class GanaLocalTests(SimpleTestCase):
+    """Ganador de un resultado TODS"""
+
+    def test_ganador(self):
+        self.assertTrue(gana_local('11-7 9-11 11-8'))
+        self.assertFalse(gana_local('7-11 11-9 8-11'))
+        self.assertTrue(gana_local('11-7 12-10(6)'))
+
+    def test_resultados_no_validos(self):
+        for resultado in ('', 'once a siete', '11-7 9-11', '11-7 x'):
+            with self.subTest(resultado=resultado), self.assertRaises(ErrorConfirmacion) as contexto:
+                gana_local(resultado)
+            self.assertEqual(contexto.exception.estado, 400)
+
+
+class ConfirmarResultadoTests(TestCase):
+    """Máquina de estados de la confirmación de un partido por sus dos lados"""
+    fixtures = FIXTURES_BASICOS
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.local, cls.visitante, cls.ajeno = crear_jugador(1), crear_jugador(2), crear_jugador(3)
+
+    def crear_partido(self, **campos):
+        """Partido pendiente entre local y visitante"""
+        return PartidoIndividual.objects.create(
+            id_jugador_local=self.local, id_jugador_visitante=self.visitante, id_ganador=self.local, id_estado_partido_id=ESTADO_POR_JUGAR,
+            fecha_hora=timezone.now(), tods_formato='SET3-S:11/TB', **campos)
+
+    def confirmar(self, partido, jugador, resultado, version=None):
+        return confirmar_resultado('individual', partido.token_qr_confirmacion, jugador.id_persona_id, resultado, version)
+
+    def assertRechazada(self, estado, *args):
+        with self.assertRaises(ErrorConfirmacion) as contexto:
+            self.confirmar(*args)
+        self.assertEqual(contexto.exception.estado, estado)
+
+    def test_solo_confirman_quienes_juegan(self):
+        self.assertRechazada(403, self.crear_partido(), self.ajeno, '11-7 11-5')
+
+    def test_coinciden_los_dos_lados(self):
+        partido = self.crear_partido()
+        self.confirmar(partido, self.local, '7-11 5-11')
+        partido.refresh_from_db()
+        self.assertEqual(partido.id_estado_partido_id, ESTADO_POR_JUGAR)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.confirmar(partido, self.visitante, '7-11  5-11')
+        partido.refresh_from_db()
+        self.assertEqual((partido.id_estado_partido_id, partido.tods_resultado, partido.id_ganador_id),
+                         (ESTADO_JUGADO, '7-11 5-11', self.visitante.pk))
+        self.assertTrue(callbacks)
+
+    def test_no_coinciden(self):
+        partido = self.crear_partido()
+        self.confirmar(partido, self.local, '11-7 11-5')
+        self.confirmar(partido, self.visitante, '11-7 11-6')
+        partido.refresh_from_db()
+        self.assertEqual(partido.id_estado_partido_id, ESTADO_POR_JUGAR)
+        # El lado local corrige su envío y ahora coinciden
+        self.confirmar(partido, self.local, '11-7 11-6')
+        partido.refresh_from_db()
+        self.assertEqual(partido.id_estado_partido_id, ESTADO_JUGADO)
+
+    def test_reintento_con_version_antigua(self):
+        partido = self.crear_partido()
+        version = version_partido(*obtener_partido('individual', partido.token_qr_confirmacion))
+        self.confirmar(partido, self.local, '11-7 11-5', version)
+        self.confirmar(partido, self.local, '11-7 11-5', version)
+        self.assertRechazada(412, partido, self.local, '11-7 11-6', version)
+        self.confirmar(partido, self.visitante, '11-7 11-5')
+        self.confirmar(partido, self.visitante, '11-7 11-5', version)
+
+    def test_partido_ya_jugado(self):
+        partido = self.crear_partido()
+        self.confirmar(partido, self.local, '11-7 11-5')
+        self.confirmar(partido, self.visitante, '11-7 11-5')
+        self.assertRechazada(409, partido, self.local, '11-7 11-6')
+
+    def test_rankings_del_torneo(self):
+        torneo = crear_torneo(crear_club(1))
+        partido = self.crear_partido(id_torneo_individual=torneo, ronda_o_jornada=1)
+        self.confirmar(partido, self.local, '11-7 11-5')
+        self.confirmar(partido, self.visitante, '11-7 11-5')
+        self.assertTrue(actualizar_rankings('individual', partido.pk))
+        self.assertFalse(actualizar_rankings('individual', partido.pk))
+        puntos = dict(RankingJugadorClub.objects.filter(id_club=torneo.id_club).values_list('id_jugador', 'puntos'))
+        self.assertEqual(puntos, {self.local.pk: 3, self.visitante.pk: 0})
+        self.assertFalse(ConfirmacionResultado.objects.filter(id_partido_individual=partido, contabilizado=False).exists())
+
+    def test_sin_configuracion_de_puntos(self):
+        Configuracion.objects.update(activa=False)
+        partido = self.crear_partido(id_torneo_individual=crear_torneo(crear_club(1)), ronda_o_jornada=1)
+        self.confirmar(partido, self.local, '11-7 11-5')
+        self.assertRechazada(503, partido, self.visitante, '11-7 11-5')
+        partido.refresh_from_db()
+        self.assertEqual(partido.id_estado_partido_id, ESTADO_POR_JUGAR)
+
+
+# Personas duplicadas (core/duplicados.py)
+
+def ficha(pk, nombre='Lucía', apellido_primero='García', apellido_segundo='López', nacimiento=None, documento='', **campos):
+    """Ficha de una persona a partir de unos pocos datos"""
+    return ficha_persona({
+        'pk': pk, 'nombre': nombre, 'apellido_primero': apellido_primero, 'apellido_segundo': apellido_segundo, 'nacimiento_fecha': nacimiento,
+        'docidentidad_valor': documento, 'email': None, 'email_adicional': None,
+        'telefono_fijo': None, 'telefono_movil': None, 'telefono_otro': None, **campos})
+
+
+class PuntuarTests(SimpleTestCase):
+    """Puntuación de parecido entre dos personas"""
+
+    def test_misma_persona(self):
+        puntuacion, motivos = puntuar(ficha(1, documento='12.345.678-z', nacimiento=datetime.date(1990, 1, 1)),
+                                      ficha(2, nombre='LUCIA', documento='12345678Z', nacimiento=datetime.date(1990, 1, 1)))
+        self.assertEqual(puntuacion, 1.0)
+        self.assertIn('documento', motivos)
+        self.assertIn('nacimiento', motivos)
+
+    def test_nacimiento_distinto_resta(self):
+        igual, _ = puntuar(ficha(1), ficha(2))
+        distinto, motivos = puntuar(ficha(1, nacimiento=datetime.date(1990, 1, 1)), ficha(2, nacimiento=datetime.date(1991, 1, 1)))
+        self.assertLess(distinto, igual)
+        self.assertIn('nacimiento distinto', motivos)
+
+    def test_personas_distintas(self):
+        puntuacion, _ = puntuar(ficha(1), ficha(2, nombre='Hugo', apellido_primero='Pérez', apellido_segundo='Ruiz'))
+        self.assertLess(puntuacion, 0.3)
+
+    def test_claves_de_bloque(self):
+        claves = claves_bloque(ficha(1, nacimiento=datetime.date(1990, 1, 1), telefono_movil='+34600000001', email='Lucia+club@x.test'))
+        self.assertIn(('nombre', 'lucia garcia lopez'), claves)
+        self.assertIn(('nacimiento', datetime.date(1990, 1, 1), 'g'), claves)
+        self.assertIn(('telefono', '+34600000001'), claves)
+        self.assertIn(('email', 'lucia'), claves)
+
+
+class DetectarDuplicadosTests(TestCase):
+    """Detección por bloques sobre la tabla de personas"""
+    fixtures = FIXTURES_BASICOS
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.a = crear_persona(1, apellido_segundo='López', nacimiento_fecha=datetime.date(1990, 1, 1))
+        cls.b = crear_persona(2, nombre='LUCIA', apellido_segundo='Lopez', nacimiento_fecha=datetime.date(1990, 1, 1))
+        cls.c = crear_persona(3, nombre='Hugo', apellido_primero='Pérez', nacimiento_fecha=datetime.date(1980, 5, 5))
+
+    def test_detecta_la_pareja(self):
+        candidatos, descartados = detectar_duplicados()
+        self.assertEqual([(candidato.id_a, candidato.id_b) for candidato in candidatos], [(self.a.pk, self.b.pk)])
+        self.assertEqual(descartados, 0)
+
+    def test_descarta_los_bloques_grandes(self):
+        # Con bloques de una persona como mucho no se compara ninguna pareja
+        candidatos, descartados = detectar_duplicados(maximo_bloque=1)
+        self.assertEqual(candidatos, [])
+        self.assertGreater(descartados, 0)
+
+
+class FusionarPersonasTests(TestCase):
+    """Comando fusionar_personas y aviso de papeles repetidos en la persona conservada"""
+    fixtures = FIXTURES_BASICOS
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jugador_a, cls.jugador_b = crear_jugador(1), crear_jugador(2)
+        cls.a, cls.b = cls.jugador_a.id_persona, cls.jugador_b.id_persona
+
+    def fusionar(self, *args):
+        """Ejecuta el comando y devuelve su salida"""
+        salida = io.StringIO()
+        call_command('fusionar_personas', *map(str, args), stdout=salida)
+        return salida.getvalue()
+
+    def test_avisa_de_jugadores_repetidos(self):
+        salida = self.fusionar(self.a.pk, self.b.pk)
+        self.assertIn('Jugadores: 1', salida)
+        self.assertIn(f'Jugadores: la persona {self.a.pk} queda con 2 filas ({self.jugador_a.pk}, {self.jugador_b.pk})', salida)
+        self.assertFalse(Persona.objects.filter(pk=self.b.pk).exists())
+        self.assertEqual(roles_repetidos(self.a.pk), {'Jugadores': [self.jugador_a.pk, self.jugador_b.pk]})
+
+    def test_simular_tambien_avisa(self):
+        salida = self.fusionar(self.a.pk, self.b.pk, '--simular')
+        self.assertIn('queda con 2 filas', salida)
+        self.assertTrue(Persona.objects.filter(pk=self.b.pk).exists())
+        self.assertEqual(roles_repetidos(self.a.pk), {})
+
+    def test_sin_papeles_repetidos(self):
+        c = crear_persona(3)
+        salida = self.fusionar(self.a.pk, c.pk)
+        self.assertNotIn('queda con', salida)
+        self.assertEqual(roles_repetidos(self.a.pk), {})
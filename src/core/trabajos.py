@@ -0,0 +1,25 @@
+"""Pool de procesos compartido para los trabajos pesados en segundo plano (miniaturas, vistas de planos...)"""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import django
+
+
+TRABAJADORES_EN_SEGUNDO_PLANO = 2
+
+_pool = None
+
+
+def _inicializar_trabajador():
+    """Prepara Django en cada proceso del pool"""
+    django.setup()
+
+def obtener_pool():
+    """Pool de procesos compartido, creado la primera vez que se necesita"""
+    global _pool  # pylint: disable=global-statement
+    # Si un proceso del pool muere de golpe, el pool queda roto para siempre: se sustituye por uno nuevo
+    if _pool is None or _pool._broken:  # pylint: disable=protected-access
+        # Por spawn, no por fork: un proceso hijo no debe heredar las conexiones abiertas (ni el pool) de la base de datos
+        _pool = ProcessPoolExecutor(max_workers=TRABAJADORES_EN_SEGUNDO_PLANO, mp_context=multiprocessing.get_context('spawn'),
+                                    initializer=_inicializar_trabajador)
+    return _pool
@@ -1,3 +1,130 @@
-from django.shortcuts import render
+"""Vistas de core"""
 
-# Create your views here.
+import hmac
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import add_never_cache_headers, get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_http_methods
+from django.views.static import serve
+from core.almacenamiento import CABECERA_CACHE_INMUTABLE, CARPETA_BLOBS
+from core.busqueda import sugerencias_personas
+from core.calendarios import CALENDARIOS, clave_cache_calendario, etiqueta_entidad, generar_y_cachear, marca_actual, nombre_calendario
+from core.instrumentacion import metricas
+from core.marcador import clave_suscripcion, flujo_marcador
+from core.miniaturas import CARPETA_MINIATURAS
+from core.models import Jugador, Persona
+from core.perfiles import perfil_jugador
+from core.resultados import ErrorConfirmacion, confirmar_resultado, datos_confirmacion, obtener_partido, version_partido
+
+
+def servir_media(request, path):
+    """Sirve MEDIA_ROOT (sólo en desarrollo) con caché inmutable para los ficheros direccionados por contenido"""
+    respuesta = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if path.startswith((f'{CARPETA_BLOBS}/', f'{CARPETA_MINIATURAS}/')):
+        respuesta['Cache-Control'] = CABECERA_CACHE_INMUTABLE
+    return respuesta
+
+def autorizado_metricas(request):
+    """Si la petición puede leer las métricas: personal, token de métricas o IP autorizada"""
+    if request.user.is_staff:
+        return True
+    token = settings.INSTRUMENTACION_TOKEN_METRICAS
+    tipo, _, enviado = request.headers.get('Authorization', '').partition(' ')
+    if token and tipo.lower() == 'bearer' and hmac.compare_digest(enviado.strip().encode(), token.encode()):
+        return True
+    return request.META.get('REMOTE_ADDR') in settings.INSTRUMENTACION_IPS_METRICAS
+
+def metricas_prometheus(request):
+    """Métricas de consultas SQL de este proceso en formato Prometheus, para el personal, con el token o desde las IPs autorizadas"""
+    if not autorizado_metricas(request):
+        raise PermissionDenied
+    return HttpResponse(metricas.exponer(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def calendario_ical(request, tipo, token):
+    """Calendario iCalendar de una entidad por su token_qr: 304 mientras no cambie, desde caché o generado en streaming"""
+    # Lee siempre de la primaria: con la réplica podría cachearse con una marca nueva un calendario aún sin el cambio
+    if tipo not in CALENDARIOS:
+        raise Http404
+    modelo, _, dependencias_de = CALENDARIOS[tipo]
+    entrada, entidad = cache.get(clave_cache_calendario(tipo, token)), None
+    if entrada and marca_actual([(tipo, entrada['clave']), *entrada['dependencias']]) <= entrada['marca']:
+        clave, marca, dependencias, contenido = entrada['clave'], entrada['marca'], entrada['dependencias'], entrada['contenido']
+    else:
+        entidad = get_object_or_404(modelo, token_qr=token)
+        dependencias = dependencias_de(entidad)
+        # La marca se toma antes de leer los eventos: un cambio posterior la supera y fuerza otra generación
+        clave, marca, contenido = entidad.pk, marca_actual([(tipo, entidad.pk), *dependencias]), None
+    etiqueta = quote_etag(etiqueta_entidad(tipo, clave, marca))
+    respuesta = get_conditional_response(request, etag=etiqueta, last_modified=int(marca))
+    if respuesta is None and contenido is not None:
+        respuesta = HttpResponse(contenido, content_type='text/calendar; charset=utf-8')
+    elif respuesta is None:
+        entidad = entidad or get_object_or_404(modelo, pk=clave, token_qr=token)
+        respuesta = StreamingHttpResponse(generar_y_cachear(tipo, token, entidad, nombre_calendario(entidad), marca, dependencias),
+                                          content_type='text/calendar; charset=utf-8')
+    respuesta['ETag'] = etiqueta
+    respuesta['Last-Modified'] = http_date(marca)
+    patch_cache_control(respuesta, private=True, max_age=settings.CALENDARIOS_MAX_AGE)
+    return respuesta
+
+async def marcador_en_directo(request):
+    """Marcador en directo por server-sent events: ?tipo=individual|dobles con torneo= o partido=, o sin filtros todos los partidos"""
+    # Cada conexión queda abierta: sólo es viable con un servidor ASGI, y los cambios llegan por LISTEN/NOTIFY de PostgreSQL
+    if not isinstance(request, ASGIRequest) or connection.vendor != 'postgresql':
+        return HttpResponse('El marcador en directo necesita un servidor ASGI y PostgreSQL', status=501, content_type='text/plain; charset=utf-8')
+    try:
+        clave = clave_suscripcion(request.GET)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error), content_type='text/plain; charset=utf-8')
+    respuesta = StreamingHttpResponse(flujo_marcador(clave), content_type='text/event-stream; charset=utf-8')
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
+
+@require_http_methods(['GET', 'POST'])
+def confirmacion_resultado(request, tipo, token):
+    """QR de confirmación de un partido: GET devuelve el estado con su ETag y POST (resultado=, If-Match opcional) envía el del propio lado"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Hay que iniciar sesión para confirmar el resultado'}, status=401)
+    persona = Persona.objects.filter(auth_user=request.user.pk).values_list('pk', flat=True).first()
+    try:
+        if request.method == 'POST':
+            version = request.headers.get('If-Match', '').removeprefix('W/').strip('"') or None
+            partido, confirmaciones = confirmar_resultado(tipo, token, persona, request.POST.get('resultado', ''), version)
+        else:
+            partido, confirmaciones = obtener_partido(tipo, token)
+    except ErrorConfirmacion as error:
+        return JsonResponse({'error': str(error)}, status=error.estado)
+    respuesta = JsonResponse(datos_confirmacion(partido, tipo, confirmaciones))
+    respuesta['ETag'] = quote_etag(version_partido(partido, confirmaciones))
+    add_never_cache_headers(respuesta)
+    return respuesta
+
+def perfil_del_jugador(request, clave=None):
+    """Perfil del jugador de la sesión (o de cualquier jugador, para el personal) en JSON, desde la caché"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Hay que iniciar sesión para ver el perfil'}, status=401)
+    if clave is None:
+        clave = Jugador.objects.filter(id_persona__auth_user=request.user.pk).values_list('pk', flat=True).first()
+    elif not request.user.is_staff:
+        raise PermissionDenied
+    perfil = perfil_jugador(clave) if clave is not None else None
+    if perfil is None:
+        raise Http404
+    respuesta = JsonResponse(perfil)
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    return respuesta
+
+def sugerencias_de_personas(request):
+    """Autocompletado de personas para el personal (?q=nombre, documento, email o teléfono), ordenadas por parecido"""
+    if not request.user.is_staff:
+        raise PermissionDenied
+    respuesta = JsonResponse({'resultados': sugerencias_personas(request.GET.get('q', ''))})
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    return respuesta
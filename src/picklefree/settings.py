@@ -10,22 +10,48 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+from copy import deepcopy
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
-# Quick-start development settings - unsuitable for production
-# See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
+def entorno_entero(nombre, defecto):
+    """Entero leído de una variable de entorno"""
+    return int(os.environ.get(nombre, defecto))
+
+def entorno_booleano(nombre, defecto):
+    """Booleano leído de una variable de entorno (1/true/si/yes/on)"""
+    return os.environ.get(nombre, str(defecto)).strip().lower() in ('1', 'true', 'si', 'sí', 'yes', 'on')
+
+
+def entorno_lista(nombre, defecto=''):
+    """Lista leída de una variable de entorno con valores separados por comas"""
+    return [valor.strip() for valor in os.environ.get(nombre, defecto).split(',') if valor.strip()]
+
+
+# Perfil de ejecución: dev (desarrollo local), test (pruebas automáticas) o prod (producción)
+
+PERFILES = ('dev', 'test', 'prod')
+
+PERFIL = os.environ.get('PICKLEFREE_PERFIL', 'dev')
+
+if PERFIL not in PERFILES:
+    raise ImproperlyConfigured(f'PICKLEFREE_PERFIL debe ser uno de {", ".join(PERFILES)} (es "{PERFIL}")')
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-djnt0g8r&phnnpt@q-bm@)fn6%yz$2r#v^5l&_hzy@pei_og#!'
+SECRET_KEY = os.environ.get('PICKLEFREE_SECRET_KEY', '' if PERFIL == 'prod' else 'django-insecure-djnt0g8r&phnnpt@q-bm@)fn6%yz$2r#v^5l&_hzy@pei_og#!')
+
+if not SECRET_KEY:
+    raise ImproperlyConfigured('En producción hay que definir PICKLEFREE_SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = entorno_booleano('PICKLEFREE_DEBUG', PERFIL == 'dev')
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = entorno_lista('PICKLEFREE_ALLOWED_HOSTS')
 
 
 # Application definition
@@ -39,6 +65,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Aplicaciones de terceros
     'django_countries',
@@ -60,11 +87,16 @@ INSTALLED_APPS = [
 
 AUTHENTICATION_BACKENDS = (
     'django.contrib.auth.backends.ModelBackend',  # backend por defecto
-    'guardian.backends.ObjectPermissionBackend',  # backend de guardian
+    'core.permisos.BackendPermisosObjetoCacheados',  # backend de guardian con caché por petición
 )
 
+# Guardian avisa si no encuentra su backend original, pero el nuestro hereda de él
+SILENCED_SYSTEM_CHECKS = ['guardian.W001']
+
 
 MIDDLEWARE = [
+    'core.instrumentacion.InstrumentacionConsultasMiddleware',  # la primera, para medir también el resto
+    'core.replicas.LecturaReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,12 +108,58 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'picklefree.urls'
 
+
+# Instrumentación de consultas SQL: fracción de peticiones muestreadas, umbral de consulta lenta
+# y quién puede leer /metricas/ (formato Prometheus) además del personal: quien envíe el token
+# (Authorization: Bearer <token>) o, sin proxy delante, las IPs de la lista. Detrás del proxy de producción
+# REMOTE_ADDR es siempre el del proxy, así que allí la lista está vacía por defecto y se usa el token
+
+INSTRUMENTACION_MUESTREO = float(os.environ.get('PICKLEFREE_MUESTREO_CONSULTAS', {'dev': 1.0, 'test': 0.0, 'prod': 0.05}[PERFIL]))
+
+INSTRUMENTACION_UMBRAL_LENTA_MS = entorno_entero('PICKLEFREE_UMBRAL_CONSULTA_LENTA_MS', 200)
+
+INSTRUMENTACION_IPS_METRICAS = entorno_lista('PICKLEFREE_IPS_METRICAS', '' if PERFIL == 'prod' else '127.0.0.1,::1')
+
+INSTRUMENTACION_TOKEN_METRICAS = os.environ.get('PICKLEFREE_TOKEN_METRICAS', '')
+
+
+# Registro: las consultas instrumentadas se escriben como líneas JSON
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'core.instrumentacion.FormateadorJSON',
+        },
+    },
+    'handlers': {
+        'consola_json': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'picklefree.consultas': {
+            'handlers': ['consola_json'],
+            'level': os.environ.get('PICKLEFREE_NIVEL_LOG_CONSULTAS', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Plantillas compiladas en memoria (en desarrollo Django las recarga igualmente al cambiar)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -101,14 +179,131 @@ WSGI_APPLICATION = 'picklefree.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE':   'django.db.backends.postgresql',
-        'NAME':     'picklefree',
-        'USER':     'picklefree_owner',
-        'PASSWORD': 'Rio+Congelado8826',
-        'HOST':     'localhost',
-        'PORT':     '5432'
+        'NAME':     os.environ.get('PICKLEFREE_DB_NAME', 'picklefree'),
+        'USER':     os.environ.get('PICKLEFREE_DB_USER', 'picklefree_owner'),
+        # Sin contraseña por defecto: fuera de producción se puede usar ~/.pgpass o la autenticación local de PostgreSQL
+        'PASSWORD': os.environ.get('PICKLEFREE_DB_PASSWORD', ''),
+        'HOST':     os.environ.get('PICKLEFREE_DB_HOST', 'localhost'),
+        'PORT':     os.environ.get('PICKLEFREE_DB_PORT', '5432'),
+        # Comprueba que la conexión sigue viva antes de reutilizarla (con pool, al prestarla)
+        'CONN_HEALTH_CHECKS': entorno_booleano('PICKLEFREE_DB_HEALTH_CHECKS', True),
+        # Las pruebas pueden clonar una plantilla ya preparada (manage.py inicializar_bd --guardar-plantilla)
+        'TEST': {
+            'TEMPLATE': os.environ.get('PICKLEFREE_DB_PLANTILLA_TEST'),
+        },
     }
 }
 
+if PERFIL == 'prod' and not DATABASES['default']['PASSWORD']:
+    raise ImproperlyConfigured('En producción hay que definir PICKLEFREE_DB_PASSWORD')
+
+# Pool de conexiones de psycopg 3: cada proceso mantiene abiertas entre min y max conexiones y las presta a cada petición,
+# así que ninguna petición paga el establecimiento de la conexión. Dimensionado de max por proceso:
+#   - WSGI: el número de hilos del worker (gunicorn --threads), pues cada hilo usa como mucho una conexión
+#   - ASGI: las peticiones concurrentes que acceden a la BD, limitado por max_connections de PostgreSQL / procesos
+# Sin pool (PICKLEFREE_DB_POOL=0) se usan conexiones persistentes durante PICKLEFREE_DB_CONN_MAX_AGE segundos
+
+if entorno_booleano('PICKLEFREE_DB_POOL', PERFIL != 'test'):
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size':     entorno_entero('PICKLEFREE_DB_POOL_MIN', 2),
+            'max_size':     entorno_entero('PICKLEFREE_DB_POOL_MAX', 10),
+            'timeout':      entorno_entero('PICKLEFREE_DB_POOL_TIMEOUT', 10),       # espera máxima por una conexión libre
+            'max_idle':     entorno_entero('PICKLEFREE_DB_POOL_MAX_IDLE', 600),     # cierra las sobrantes ociosas
+            'max_lifetime': entorno_entero('PICKLEFREE_DB_POOL_MAX_LIFETIME', 3600),  # recicla las conexiones
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = entorno_entero('PICKLEFREE_DB_CONN_MAX_AGE', 60)
+
+# Réplica de lectura (core/replicas.py) para rankings, estadísticas, páginas públicas y resultados de encuestas.
+# Se activa con PICKLEFREE_DB_REPLICA_HOST (y opcionalmente _PORT, _NAME, _USER, _PASSWORD), o con PICKLEFREE_DB_REPLICA=1
+# apuntando a la misma base de datos con un segundo alias; en el perfil test está activa y es un espejo de default.
+# Tras escribir, el navegador lee de la primaria durante PICKLEFREE_DB_REPLICA_RETRASO segundos
+
+if os.environ.get('PICKLEFREE_DB_REPLICA_HOST') or entorno_booleano('PICKLEFREE_DB_REPLICA', PERFIL == 'test'):
+    DATABASES['replica'] = {
+        **deepcopy(DATABASES['default']),
+        'NAME':     os.environ.get('PICKLEFREE_DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER':     os.environ.get('PICKLEFREE_DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.environ.get('PICKLEFREE_DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST':     os.environ.get('PICKLEFREE_DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT':     os.environ.get('PICKLEFREE_DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.replicas.RouterReplica']
+
+REPLICA_RETRASO_MAXIMO = entorno_entero('PICKLEFREE_DB_REPLICA_RETRASO', 10)
+
+# Particionado por fecha de envíos y reservas (core/particionado.py): PICKLEFREE_PARTICIONADO=mes o anio lo activa
+# en la migración correspondiente (o después, con manage.py crear_particiones --convertir). Se mantienen creadas
+# PICKLEFREE_PARTICIONES_FUTURAS particiones por delante (al migrar y con crear_particiones, a programar periódicamente)
+# Una tabla con claves únicas que dejarían de serlo al particionarla no se particiona: envio, mientras token_qr sea único
+
+PARTICIONADO_INTERVALO = os.environ.get('PICKLEFREE_PARTICIONADO', '')
+
+PARTICIONES_FUTURAS = entorno_entero('PICKLEFREE_PARTICIONES_FUTURAS', 3)
+
+if PARTICIONADO_INTERVALO not in ('', 'mes', 'anio'):
+    raise ImproperlyConfigured(f'PICKLEFREE_PARTICIONADO debe ser mes, anio o vacío (es "{PARTICIONADO_INTERVALO}")')
+
+
+# Caché compartida entre procesos (miniaturas, planos, resúmenes de encuestas, clubes de cada usuario...)
+# Con PICKLEFREE_CACHE_URL=redis://... se usa Redis (o un servidor compatible, necesita el paquete redis);
+# si no, una caché en ficheros en PICKLEFREE_CACHE_DIR. Las pruebas usan una caché en memoria, aislada por proceso
+
+if PERFIL == 'test':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+elif os.environ.get('PICKLEFREE_CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['PICKLEFREE_CACHE_URL'],
+            'KEY_PREFIX': 'picklefree',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('PICKLEFREE_CACHE_DIR', BASE_DIR / 'cache'),
+            'KEY_PREFIX': 'picklefree',
+            'OPTIONS': {
+                'MAX_ENTRIES': entorno_entero('PICKLEFREE_CACHE_MAX_ENTRIES', 100_000),
+            },
+        },
+    }
+
+
+# Calendarios iCalendar (core/calendarios.py): segundos que un cliente puede reutilizar un calendario sin volver a pedirlo;
+# pasado ese tiempo pregunta con If-None-Match y, si nada ha cambiado, recibe un 304 servido sin consultar la base de datos
+
+CALENDARIOS_MAX_AGE = entorno_entero('PICKLEFREE_CALENDARIOS_MAX_AGE', 300)
+
+
+# API JSON de sólo lectura (core/api.py): segundos que clientes y proxies pueden reutilizar una respuesta;
+# después revalidan con If-None-Match y reciben un 304 si el contenido de la página no ha cambiado
+
+API_MAX_AGE = entorno_entero('PICKLEFREE_API_MAX_AGE', 60)
+
+
+# Marcador en directo (core/marcador.py, sólo con ASGI y PostgreSQL): segundos entre latidos que mantienen viva la conexión,
+# segundos que espera el navegador para reconectar y eventos que se acumulan por cliente antes de desconectarlo por lento
+
+MARCADOR_LATIDO = entorno_entero('PICKLEFREE_MARCADOR_LATIDO', 15)
+MARCADOR_REINTENTO = entorno_entero('PICKLEFREE_MARCADOR_REINTENTO', 3)
+MARCADOR_COLA = entorno_entero('PICKLEFREE_MARCADOR_COLA', 100)
+
+
+# Sesiones: leídas de la caché y respaldadas en la base de datos
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -129,6 +324,21 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Las pruebas no necesitan un hash de contraseñas lento
+
+if PERFIL == 'test':
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+# Seguridad en producción (detrás de un proxy HTTPS)
+
+if PERFIL == 'prod':
+    SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+    SESSION_COOKIE_SECURE = True
+    CSRF_COOKIE_SECURE = True
+    CSRF_TRUSTED_ORIGINS = entorno_lista('PICKLEFREE_CSRF_TRUSTED_ORIGINS')
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -164,6 +374,19 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Los ficheros subidos se guardan por su contenido (SHA-256), deduplicados y con recuento de referencias.
+# Sus URLs nunca cambian de contenido, así que el servidor web puede servir /media/blobs/ y /media/miniaturas/
+# con "Cache-Control: public, max-age=31536000, immutable"
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'core.almacenamiento.AlmacenamientoPorContenido',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 
 # Temas para django-jet-reboot
 
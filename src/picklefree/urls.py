@@ -14,12 +14,34 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
+from djf_surveys.app_settings import SURVEYS_ADMIN_BASE_PATH
+from core.api import api_detalle, api_listado
+from core.encuestas import ResumenEncuestaView
+from core.exportacion import ExportarRespuestasView
+from core.views import calendario_ical, confirmacion_resultado, marcador_en_directo, metricas_prometheus, perfil_del_jugador, servir_media, sugerencias_de_personas
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('jet/', include('jet.urls', 'jet')),
-    path('surveys/', include('djf_surveys.urls'))
+    # El resumen y la descarga de djf_surveys los sirven nuestras vistas (recuentos cacheados y exportación en streaming)
+    path(f'surveys/{SURVEYS_ADMIN_BASE_PATH}summary/survey/<str:slug>/', ResumenEncuestaView.as_view()),
+    path(f'surveys/{SURVEYS_ADMIN_BASE_PATH}download/survey/<str:slug>/', ExportarRespuestasView.as_view()),
+    path('surveys/', include('djf_surveys.urls')),
+    path('metricas/', metricas_prometheus, name='metricas'),
+    path('calendarios/<str:tipo>/<str:token>.ics', calendario_ical, name='calendario'),
+    path('partidos/<str:tipo>/confirmar/<str:token>/', confirmacion_resultado, name='confirmacion_resultado'),
+    path('perfil/', perfil_del_jugador, name='perfil'),
+    path('perfil/<int:clave>/', perfil_del_jugador, name='perfil_jugador'),
+    path('personas/sugerencias/', sugerencias_de_personas, name='sugerencias_personas'),
+    path('marcador/', marcador_en_directo, name='marcador'),
+    path('api/<str:recurso>/', api_listado, name='api_listado'),
+    path('api/<str:recurso>/<int:clave>/', api_detalle, name='api_detalle'),
     #path('core/', include('core.urls')),
 ]
+
+# En desarrollo servimos los ficheros subidos desde Django (en producción lo hace el servidor web)
+if settings.DEBUG:
+    urlpatterns += [re_path(r'^' + settings.MEDIA_URL.lstrip('/') + r'(?P<path>.*)$', servir_media)]